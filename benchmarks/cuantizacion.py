@@ -0,0 +1,98 @@
+"""Pérdida de recall@10 y ahorro de memoria de vectores float16 e int8
+
+Uso:
+
+    python -m benchmarks.cuantizacion
+    python -m benchmarks.cuantizacion --modelo  # vectores reales de los PAA
+
+Sin --modelo usa vectores sintéticos agrupados de la misma dimensión del
+modelo. Con --modelo calcula los vectores de las descripciones de los PAA.
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from utils.indices import buscar_exacto, normalizar_filas
+from utils.vectores import compactar
+
+
+def vectores_sinteticos(n: int, dim: int = 384, grupos: int = 500, semilla: int = 0):
+    rng = np.random.default_rng(semilla)
+    centros = rng.normal(size=(grupos, dim))
+    vectores = centros[rng.integers(0, grupos, n)] + 0.5 * rng.normal(size=(n, dim))
+
+    return vectores.astype(np.float32)
+
+
+def vectores_paa():
+    from sentence_transformers import SentenceTransformer
+
+    from utils.paa import ingerir_paa, leer_manifiesto, leer_paa
+    from utils.variables import MODELO
+
+    ingerir_paa()
+
+    textos = leer_paa(list(leer_manifiesto()))["descripcion"].fillna("").to_list()
+
+    return SentenceTransformer(MODELO).encode(textos, convert_to_numpy=True)
+
+
+def recall(hits: list, referencia: list) -> float:
+    aciertos = [
+        len({h["corpus_id"] for h in a} & {h["corpus_id"] for h in b}) / len(b)
+        for a, b in zip(hits, referencia)
+        if b
+    ]
+
+    return float(np.mean(aciertos))
+
+
+def medir(corpus: np.ndarray, consultas: np.ndarray, top_k: int = 10) -> dict:
+    inicio = time.perf_counter()
+    referencia = buscar_exacto(consultas, corpus, top_k)
+    segundos = time.perf_counter() - inicio
+
+    resultados = {
+        "float32": {
+            "bytes": normalizar_filas(corpus).nbytes,
+            "segundos": segundos,
+            f"recall@{top_k}": 1.0,
+        }
+    }
+
+    for precision in ["float16", "int8"]:
+        compacto = compactar(corpus, precision)
+
+        inicio = time.perf_counter()
+        hits = buscar_exacto(consultas, compacto, top_k)
+        segundos = time.perf_counter() - inicio
+
+        resultados[precision] = {
+            "bytes": compacto.nbytes,
+            "segundos": segundos,
+            f"recall@{top_k}": recall(hits, referencia),
+        }
+
+    return resultados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--n", type=int, default=100000, help="Vectores sintéticos")
+    parser.add_argument("--consultas", type=int, default=200)
+    parser.add_argument("--modelo", action="store_true", help="Usar vectores PAA")
+    args = parser.parse_args()
+
+    corpus = vectores_paa() if args.modelo else vectores_sinteticos(args.n)
+
+    # Consultas cercanas a textos del corpus, como búsquedas reales
+    rng = np.random.default_rng(1)
+    muestra = corpus[rng.choice(len(corpus), size=args.consultas, replace=False)]
+    consultas = muestra + 0.3 * rng.normal(size=muestra.shape).astype(np.float32)
+
+    reporte = {"n": len(corpus), "dim": corpus.shape[1], **medir(corpus, consultas)}
+
+    print(json.dumps(reporte, indent=2))
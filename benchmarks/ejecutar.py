@@ -0,0 +1,362 @@
+"""Mide los caminos críticos de la aplicación y guarda los tiempos en JSON
+
+Uso:
+
+    python -m benchmarks.ejecutar
+    python -m benchmarks.ejecutar --filas 20000 --latencia 0.05 --modelo
+    python -m benchmarks.ejecutar --comparar benchmarks/resultados/anterior.json
+
+Las consultas a Socrata van contra `benchmarks.servidor`. Las funciones con
+cache de Streamlit se miden sin cache mediante `__wrapped__`; la búsqueda en
+Socrata se mide en su camino sin cache (paginar) y con cache en disco por
+separado. Con --modelo también se mide la codificación de textos, que
+requiere el modelo descargado.
+"""
+
+from pathlib import Path
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import requests
+
+from data.rutas import ENTIDADES, META_PAA
+from utils.caches import cargar_df, crear_df_resultados, encode_texts
+from utils.consultas import iterar_socrata, paginar_socrata
+from utils.entidades import IndiceEntidades
+from utils.indices import buscar_similares
+from utils.persistencia import CacheRespuestas
+from utils.socrata import payload_procesos, payload_proponentes
+from utils.tablas import depurar_df, df_desde_tabla, tabla_desde_paginas
+from utils.variables import (
+    ANIDADOS_PROCESOS,
+    COLS_ENTIDADES,
+    COLS_PROCESOS,
+    ESQUEMA_PROCESOS,
+    ID_PROCESOS,
+    ID_PROPONENTES,
+    MODELO,
+)
+
+from benchmarks.servidor import DATASETS, iniciar_servidor
+
+
+DIR_RESULTADOS = Path(__file__).parent.joinpath("resultados")
+
+OFFSET = 1000
+
+# Una medición es regresión si es más lenta que la referencia en este factor
+UMBRAL_REGRESION = 1.2
+
+
+def medir(funcion, repeticiones: int = 5, **extra) -> dict:
+    """Ejecuta una función varias veces y resume sus tiempos
+
+    Parameters
+    ----------
+    funcion : Callable[[], Any]
+        Función sin argumentos a medir
+    repeticiones : int, optional
+        Ejecuciones medidas, después de una de calentamiento, default 5
+
+    Returns
+    -------
+    dict
+        Mediana, mínimo y máximo en segundos, más los datos de `extra`
+    """
+    funcion()
+
+    tiempos = []
+
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+
+    return {
+        "mediana_s": statistics.median(tiempos),
+        "min_s": min(tiempos),
+        "max_s": max(tiempos),
+        "repeticiones": repeticiones,
+        **extra,
+    }
+
+
+def commit_actual() -> str | None:
+    try:
+        salida = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return salida.stdout.strip()
+
+
+def medir_socrata(url_base: str, filas: int, repeticiones: int) -> dict:
+    url_procesos = f"{url_base}{ID_PROCESOS}.json"
+    url_proponentes = f"{url_base}{ID_PROPONENTES}.json"
+
+    session = requests.Session()
+
+    procesos = payload_procesos(offset=OFFSET)
+    proponentes = payload_proponentes(fechas=None, offset=OFFSET)
+
+    registros = paginar_socrata(session, url_procesos, procesos, OFFSET)
+
+    def df_arrow():
+        paginas = iterar_socrata(session, url_procesos, procesos, OFFSET, True)
+        tabla = tabla_desde_paginas(paginas, COLS_PROCESOS, ANIDADOS_PROCESOS)
+
+        return depurar_df(df_desde_tabla(tabla), ["descripci_n_del_procedimiento"])
+
+    directorio = tempfile.TemporaryDirectory()
+    cache = CacheRespuestas(Path(directorio.name).joinpath("socrata.sqlite"))
+    cache.guardar(url_procesos, procesos, registros)
+
+    def df_resultados(esquema=None):
+        return crear_df_resultados.__wrapped__(
+            registros,
+            ["descripci_n_del_procedimiento"],
+            ["id_del_proceso", "entidad"],
+            esquema,
+        )
+
+    # Memoria de la tabla de resultados, con y sin tipos compactos
+    memoria = df_resultados().memory_usage(deep=True).sum()
+    memoria_esquema = df_resultados(ESQUEMA_PROCESOS).memory_usage(deep=True).sum()
+
+    resultados = {
+        "socrata_secuencial": medir(
+            lambda: paginar_socrata(session, url_procesos, procesos, OFFSET),
+            repeticiones,
+            filas=filas,
+        ),
+        "socrata_paralelo": medir(
+            lambda: paginar_socrata(session, url_procesos, procesos, OFFSET, True),
+            repeticiones,
+            filas=filas,
+        ),
+        "socrata_keyset": medir(
+            lambda: paginar_socrata(
+                session, url_procesos, procesos, OFFSET, keyset=True
+            ),
+            repeticiones,
+            filas=filas,
+        ),
+        "socrata_proponentes_paralelo": medir(
+            lambda: paginar_socrata(
+                session, url_proponentes, proponentes, OFFSET, True
+            ),
+            repeticiones,
+            filas=filas,
+        ),
+        "socrata_cache_disco": medir(
+            lambda: cache.leer(url_procesos, procesos), repeticiones, filas=filas
+        ),
+        "buscar_df_socrata_arrow": medir(df_arrow, repeticiones, filas=filas),
+        "crear_df_resultados_esquema": medir(
+            lambda: df_resultados(ESQUEMA_PROCESOS),
+            repeticiones,
+            filas=filas,
+            bytes=int(memoria_esquema),
+        ),
+        "crear_df_resultados": medir(
+            df_resultados, repeticiones, filas=filas, bytes=int(memoria)
+        ),
+    }
+
+    directorio.cleanup()
+
+    return resultados
+
+
+def medir_archivos(repeticiones: int) -> dict:
+    return {
+        "cargar_df_csv_entidades": medir(
+            lambda: cargar_df.__wrapped__(
+                ENTIDADES, {"CCB_NIT_INST": str}, COLS_ENTIDADES
+            ),
+            repeticiones,
+        ),
+        "cargar_df_xlsx_metadata_paa": medir(
+            lambda: cargar_df.__wrapped__(
+                META_PAA, {"nit_entidad": str}, ordenar="entidad"
+            ),
+            repeticiones,
+        ),
+    }
+
+
+def medir_entidades(filas: int, repeticiones: int) -> dict:
+    df_entidades = pd.read_csv(
+        ENTIDADES, dtype={"CCB_NIT_INST": str}, usecols=COLS_ENTIDADES
+    )
+    indice = IndiceEntidades.desde_archivos()
+
+    muestra = df_entidades.dropna(subset=["CCB_NIT_INST"]).sample(
+        filas, replace=True, random_state=0
+    )
+    df = pd.DataFrame(
+        {
+            "nit_entidad": muestra["CCB_NIT_INST"].to_numpy(),
+            "entidad": muestra["NOMBRE"].str.title().to_numpy(),
+        }
+    )
+
+    def merge():
+        return df.merge(
+            df_entidades, how="left", left_on="nit_entidad", right_on="CCB_NIT_INST"
+        )
+
+    aciertos_merge = merge()["SECTOR"].notna().mean()
+    aciertos_indice = indice.enriquecer(df, "nit_entidad", "entidad")["SECTOR"]
+
+    return {
+        "entidades_merge": medir(
+            merge, repeticiones, filas=filas, aciertos=float(aciertos_merge)
+        ),
+        "entidades_indice": medir(
+            lambda: indice.enriquecer(df, "nit_entidad", "entidad"),
+            repeticiones,
+            filas=filas,
+            aciertos=float(aciertos_indice.notna().mean()),
+        ),
+        "entidades_construir_indice": medir(
+            IndiceEntidades.desde_archivos, repeticiones
+        ),
+    }
+
+
+def medir_busqueda(filas: int, repeticiones: int, dim: int = 384) -> dict:
+    rng = np.random.default_rng(0)
+    corpus = rng.normal(size=(filas, dim)).astype(np.float32)
+    consulta = rng.normal(size=(1, dim)).astype(np.float32)
+
+    return {
+        "busqueda_exacta": medir(
+            lambda: buscar_similares(consulta, corpus, top_k=10),
+            repeticiones,
+            filas=filas,
+            dim=dim,
+        )
+    }
+
+
+def medir_codificacion(filas: int, repeticiones: int) -> dict:
+    from utils.modelos import cargar_modelo
+
+    embedder = cargar_modelo(MODELO)
+
+    textos = [
+        DATASETS[ID_PROCESOS](i)["descripci_n_del_procedimiento"] for i in range(filas)
+    ]
+
+    def codificar_y_buscar():
+        corpus = encode_texts.__wrapped__(embedder, textos)
+        consulta = encode_texts.__wrapped__(embedder, "mantenimiento de vías")
+
+        return buscar_similares(consulta, corpus, top_k=10)
+
+    return {
+        "encode_texts_y_busqueda": medir(
+            codificar_y_buscar, max(1, repeticiones // 2), filas=filas
+        )
+    }
+
+
+def comparar(actual: dict, referencia: dict, umbral: float = UMBRAL_REGRESION):
+    """Razón entre tiempos actuales y de referencia
+
+    Parameters
+    ----------
+    actual : dict
+        Resultados de esta ejecución
+    referencia : dict
+        Resultados de otra ejecución
+    umbral : float, optional
+        Razón desde la que se marca regresión, default UMBRAL_REGRESION
+
+    Returns
+    -------
+    tuple[dict, list]
+        Razón por medición y nombres de las mediciones con regresión
+    """
+    razones = {}
+
+    for nombre, resultado in actual["resultados"].items():
+        anterior = referencia["resultados"].get(nombre)
+
+        if anterior and anterior.get("mediana_s"):
+            razones[nombre] = resultado["mediana_s"] / anterior["mediana_s"]
+
+    regresiones = [nombre for nombre, razon in razones.items() if razon > umbral]
+
+    return razones, regresiones
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filas", type=int, default=10000, help="Por dataset")
+    parser.add_argument("--latencia", type=float, default=0.02, help="Segundos")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--modelo", action="store_true", help="Medir codificación")
+    parser.add_argument("--salida", type=Path, default=None)
+    parser.add_argument("--comparar", type=Path, default=None, help="JSON previo")
+    args = parser.parse_args()
+
+    servidor, url_base = iniciar_servidor(
+        {dataset: args.filas for dataset in DATASETS}, args.latencia
+    )
+
+    resultados = {}
+    resultados.update(medir_socrata(url_base, args.filas, args.repeticiones))
+    resultados.update(medir_archivos(args.repeticiones))
+    resultados.update(medir_entidades(args.filas, args.repeticiones))
+    resultados.update(medir_busqueda(args.filas * 5, args.repeticiones))
+
+    if args.modelo:
+        resultados.update(medir_codificacion(args.filas, args.repeticiones))
+
+    servidor.shutdown()
+
+    reporte = {
+        "commit": commit_actual(),
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "parametros": vars(args) | {"salida": None, "comparar": None},
+        "resultados": resultados,
+    }
+
+    salida = args.salida or DIR_RESULTADOS.joinpath(
+        f"{time.strftime('%Y%m%d-%H%M%S')}_{reporte['commit'] or 'sin-commit'}.json"
+    )
+    salida.parent.mkdir(parents=True, exist_ok=True)
+    salida.write_text(json.dumps(reporte, indent=2), encoding="utf-8")
+
+    for nombre, resultado in resultados.items():
+        print(f"{nombre:32} {resultado['mediana_s'] * 1000:10.1f} ms")
+
+    print(f"\nResultados en {salida}")
+
+    if args.comparar is not None:
+        referencia = json.loads(args.comparar.read_text(encoding="utf-8"))
+        razones, regresiones = comparar(reporte, referencia)
+
+        for nombre, razon in razones.items():
+            marca = "  <- regresión" if nombre in regresiones else ""
+            print(f"{nombre:32} x{razon:6.2f}{marca}")
+
+        if regresiones:
+            sys.exit(1)
@@ -0,0 +1,105 @@
+"""Paridad y velocidad del modelo ONNX int8 frente al modelo PyTorch
+
+Uso:
+
+    python -m benchmarks.paridad_onnx
+    python -m benchmarks.paridad_onnx --n 5000 --hilos 4
+
+Compara los vectores de ambos backends sobre descripciones de los PAA: coseno
+entre el vector de cada texto en los dos backends y coincidencia del top 10
+de consultas de ejemplo. Termina con código 1 si el coseno mínimo queda bajo
+el umbral.
+"""
+
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from utils.indices import buscar_exacto, normalizar_filas
+from utils.modelos import cargar_modelo
+from utils.variables import MODELO
+
+
+CONSULTAS = [
+    "mantenimiento de vías terciarias",
+    "servicios de vigilancia y seguridad privada",
+    "compra de equipos de cómputo",
+    "prestación de servicios profesionales de abogado",
+    "suministro de combustible para vehículos",
+    "interventoría de obra pública",
+    "adquisición de medicamentos e insumos hospitalarios",
+    "servicio de aseo y cafetería",
+]
+
+
+def textos_paa(n: int) -> list:
+    from utils.paa import ingerir_paa, leer_manifiesto, leer_paa
+
+    ingerir_paa()
+
+    textos = leer_paa(list(leer_manifiesto()))["descripcion"].dropna()
+
+    return textos.drop_duplicates().head(n).to_list()
+
+
+def codificar(modelo, textos: list) -> tuple[np.ndarray, float]:
+    inicio = time.perf_counter()
+    vectores = modelo.encode(textos, convert_to_numpy=True)
+
+    return normalizar_filas(vectores), time.perf_counter() - inicio
+
+
+def coincidencia(hits: list, referencia: list) -> float:
+    aciertos = [
+        len({h["corpus_id"] for h in a} & {h["corpus_id"] for h in b}) / len(b)
+        for a, b in zip(hits, referencia)
+        if b
+    ]
+
+    return float(np.mean(aciertos))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--n", type=int, default=2000, help="Textos a codificar")
+    parser.add_argument("--hilos", type=int, default=None)
+    parser.add_argument("--umbral", type=float, default=0.98, help="Coseno mínimo")
+    args = parser.parse_args()
+
+    textos = textos_paa(args.n)
+
+    reporte = {"n": len(textos), "hilos": args.hilos}
+    corpus, consultas = {}, {}
+
+    for backend in ["torch", "onnx"]:
+        modelo = cargar_modelo(MODELO, backend, args.hilos)
+
+        # Primer llamado fuera de la medición: carga de sesión y memoria
+        modelo.encode(textos[:8])
+
+        corpus[backend], segundos = codificar(modelo, textos)
+        consultas[backend], _ = codificar(modelo, CONSULTAS)
+
+        reporte[backend] = {"segundos": segundos, "textos/s": len(textos) / segundos}
+
+    cosenos = np.sum(corpus["torch"] * corpus["onnx"], axis=1)
+
+    referencia = buscar_exacto(consultas["torch"], corpus["torch"], 10)
+    hits = buscar_exacto(consultas["onnx"], corpus["onnx"], 10)
+
+    reporte.update(
+        {
+            "aceleracion": reporte["torch"]["segundos"] / reporte["onnx"]["segundos"],
+            "coseno_min": float(cosenos.min()),
+            "coseno_medio": float(cosenos.mean()),
+            "top10_coincidencia": coincidencia(hits, referencia),
+        }
+    )
+
+    print(json.dumps(reporte, indent=2))
+
+    if reporte["coseno_min"] < args.umbral:
+        sys.exit(1)
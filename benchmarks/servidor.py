@@ -0,0 +1,225 @@
+"""Servidor local que imita `datos.gov.co/resource/*.json` con datos sintéticos
+
+Uso:
+
+    python -m benchmarks.servidor --puerto 8765 --latencia 0.05
+
+Atiende SECOP II - Procesos (p6dx-8zbt) y Proponentes (hgi6-6wh3) con una
+cantidad configurable de filas. Entiende lo que usa la aplicación:
+`count(*)`, `$select`, `$limit`, `$offset`, `:id > '...'` y
+`id_del_proceso in (...)`.
+Cada fila se genera a partir de su posición, así todas las páginas son
+reproducibles sin guardar el dataset en memoria.
+"""
+
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import json
+import random
+import re
+import threading
+import time
+
+from utils.variables import ID_PROCESOS, ID_PROPONENTES
+
+
+PALABRAS = (
+    "prestación de servicios profesionales apoyo a la gestión suministro de "
+    "equipos de cómputo mantenimiento preventivo correctivo vías terciarias "
+    "interventoría obra pública vigilancia aseo cafetería combustible "
+    "medicamentos insumos hospitalarios capacitación consultoría software "
+    "licencias transporte alimentación escolar dotación mobiliario"
+).split()
+
+ENTIDADES = [
+    ("ALCALDIA MUNICIPAL DE SUESCA", "832011441"),
+    ("MINISTERIO DE HACIENDA Y CREDITO PUBLICO", "899999090"),
+    ("GOBERNACION DE ANTIOQUIA", "890900286"),
+    ("INSTITUTO NACIONAL DE VIAS", "800215807"),
+    ("SERVICIO NACIONAL DE APRENDIZAJE", "899999034"),
+]
+
+MODALIDADES = ["Contratación directa", "Mínima cuantía", "Licitación pública"]
+
+INICIO = datetime(2024, 1, 1)
+
+
+def _descripcion(rng: random.Random) -> str:
+    return " ".join(rng.choices(PALABRAS, k=rng.randint(4, 40)))
+
+
+def fila_proceso(i: int) -> dict:
+    rng = random.Random(i)
+    entidad, nit = rng.choice(ENTIDADES)
+    publicado = INICIO + timedelta(minutes=17 * i)
+    adjudicado = rng.choice(["Si", "No"])
+
+    return {
+        ":id": f"row-{i:09d}",
+        ":updated_at": (publicado + timedelta(days=2)).isoformat(),
+        "id_del_proceso": f"CO1.REQ.{i}",
+        "descripci_n_del_procedimiento": _descripcion(rng),
+        "entidad": entidad,
+        "nit_entidad": nit,
+        "precio_base": str(rng.randint(1, 5000) * 100000),
+        "fecha_de_publicacion_del": publicado.strftime("%Y-%m-%dT%H:%M:%S.000"),
+        "fase": "Presentación de oferta",
+        "duracion": str(rng.randint(1, 12)),
+        "unidad_de_duracion": "Mes(es)",
+        "modalidad_de_contratacion": rng.choice(MODALIDADES),
+        "estado_del_procedimiento": "Publicado",
+        "estado_de_apertura_del_proceso": "Abierto",
+        "referencia_del_proceso": f"REF-{i}",
+        "ordenentidad": rng.choice(["Nacional", "Territorial"]),
+        "adjudicado": adjudicado,
+        "fecha_adjudicacion": publicado.strftime("%Y-%m-%dT%H:%M:%S.000"),
+        "nombre_del_proveedor": "PROVEEDOR S.A.S." if adjudicado == "Si" else "",
+        "urlproceso": {"url": f"https://community.secop.gov.co/{i}"},
+    }
+
+
+def fila_proponente(i: int) -> dict:
+    rng = random.Random(-i - 1)
+    entidad, _ = rng.choice(ENTIDADES)
+    publicado = INICIO + timedelta(minutes=11 * i)
+
+    return {
+        ":id": f"row-{i:09d}",
+        "proveedor": f"PROVEEDOR {rng.randint(1, 5000)} S.A.S.",
+        "nit_proveedor": str(rng.randint(800000000, 999999999)),
+        "id_procedimiento": f"CO1.REQ.{rng.randint(0, 10 * (i + 1))}",
+        "fecha_publicaci_n": publicado.strftime("%Y-%m-%dT%H:%M:%S.000"),
+        "nombre_procedimiento": _descripcion(rng),
+        "entidad_compradora": entidad,
+    }
+
+
+DATASETS = {ID_PROCESOS: fila_proceso, ID_PROPONENTES: fila_proponente}
+
+
+class ManejadorSocrata(BaseHTTPRequestHandler):
+    """Responde consultas SoQL sobre los datasets sintéticos"""
+
+    # Asignados por `iniciar_servidor`
+    filas = {}
+    latencia = 0.0
+    llamados = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _responder(self, codigo: int, contenido):
+        cuerpo = json.dumps(contenido).encode("utf-8")
+
+        self.send_response(codigo)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def do_GET(self):
+        with self.lock:
+            type(self).llamados += 1
+
+        time.sleep(self.latencia)
+
+        url = urlparse(self.path)
+        dataset = re.fullmatch(r"/resource/([\w-]+)\.json", url.path)
+
+        if dataset is None or dataset.group(1) not in DATASETS:
+            return self._responder(404, {"error": "dataset no encontrado"})
+
+        generar = DATASETS[dataset.group(1)]
+        total = self.filas.get(dataset.group(1), 0)
+
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+
+        if params.get("$select", "").startswith("count(*)"):
+            return self._responder(200, [{"total": str(total)}])
+
+        where = params.get("$where", "")
+        ids = re.search(r"id_del_proceso in\s*\((.*)\)", where)
+
+        if ids:
+            posiciones = [
+                int(m)
+                for m in re.findall(r"'CO1\.REQ\.(\d+)'", ids.group(1))
+                if int(m) < total
+            ]
+        else:
+            # Las filas ya están en orden de `:id`
+            ultimo = re.search(r":id > 'row-(\d+)'", where)
+            inicio = int(ultimo.group(1)) + 1 if ultimo else 0
+
+            offset = inicio + int(params.get("$offset", 0))
+            limite = int(params.get("$limit", 1000))
+            posiciones = range(offset, min(offset + limite, total))
+
+        registros = [generar(i) for i in posiciones]
+
+        if "$select" in params:
+            columnas = [c.strip() for c in params["$select"].split(",")]
+            registros = [{c: r[c] for c in columnas if c in r} for r in registros]
+        else:
+            registros = [
+                {c: v for c, v in r.items() if not c.startswith(":")} for r in registros
+            ]
+
+        self._responder(200, registros)
+
+
+def iniciar_servidor(filas: dict = None, latencia: float = 0.0, puerto: int = 0):
+    """Inicia el servidor en un hilo
+
+    Parameters
+    ----------
+    filas : dict, optional
+        Filas por ID de dataset, default 10000 en cada uno
+    latencia : float, optional
+        Segundos de espera por llamado, default 0
+    puerto : int, optional
+        Puerto local, default 0 para uno libre
+
+    Returns
+    -------
+    tuple[ThreadingHTTPServer, str]
+        Servidor y URL base equivalente a URL_RESOURCES
+    """
+    if filas is None:
+        filas = {dataset: 10000 for dataset in DATASETS}
+
+    manejador = type(
+        "Manejador",
+        (ManejadorSocrata,),
+        {"filas": filas, "latencia": latencia, "llamados": 0},
+    )
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", puerto), manejador)
+    servidor.daemon_threads = True
+
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+
+    return servidor, f"http://127.0.0.1:{servidor.server_port}/resource/"
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--latencia", type=float, default=0.05, help="Segundos")
+    parser.add_argument("--filas", type=int, default=10000, help="Por dataset")
+    args = parser.parse_args()
+
+    servidor, url = iniciar_servidor(
+        {dataset: args.filas for dataset in DATASETS}, args.latencia, args.puerto
+    )
+
+    print(f"Atendiendo en {url}")
+
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        servidor.shutdown()
@@ -7,11 +7,53 @@ DIR_DATA = Path(__file__).parent
 
 DIR_PAA = DIR_DATA.joinpath("paa")
 
+DIR_PRESUPUESTO = DIR_DATA.joinpath("presupuesto")
+
+DIR_PGN_PARQUET = DIR_DATA.joinpath("pgn_parquet")
+
+DIR_PAA_PARQUET = DIR_DATA.joinpath("paa_parquet")
+
+DIR_PAA_VECTORES = DIR_DATA.joinpath("paa_vectores")
+
+DIR_CACHE = DIR_DATA.joinpath("cache")
+
+DIR_ESPEJO = DIR_DATA.joinpath("espejo")
+
+DIR_EMBEDDINGS = DIR_DATA.joinpath("embeddings")
+
+DIR_MODELOS = DIR_DATA.joinpath("modelos")
+
+DIR_ALERTAS = DIR_DATA.joinpath("alertas")
+
+DIR_RESULTADOS_ALERTAS = DIR_ALERTAS.joinpath("resultados")
+
 
 # Filepaths
 
 ENTIDADES = DIR_DATA.joinpath("entidades", "entidades.csv")
 
-PGN2024 = DIR_DATA.joinpath("presupuesto", "pgn2024.csv")
+SECTORES_NACIONAL = DIR_DATA.joinpath("entidades", "sectores_nacional.csv")
+
+SECTORES_TERRITORIAL = DIR_DATA.joinpath("entidades", "sectores_territorial.csv")
+
+PGN2024 = DIR_PRESUPUESTO.joinpath("pgn2024.csv")
+
+MANIFIESTO_PGN = DIR_PGN_PARQUET.joinpath("_manifiesto.json")
 
 META_PAA = DIR_DATA.joinpath("metadata", "paa.xlsx")
+
+CONSULTAS_ALERTAS = DIR_ALERTAS.joinpath("consultas.csv")
+
+MANIFIESTO_PAA = DIR_PAA_PARQUET.joinpath("manifiesto.json")
+
+INDICE_VECTORES_PAA = DIR_PAA_VECTORES.joinpath("indice.json")
+
+CACHE_SOCRATA = DIR_CACHE.joinpath("socrata.sqlite")
+
+SOCKET_EMBEDDINGS = DIR_CACHE.joinpath("embeddings.sock")
+
+METRICAS_JSONL = DIR_CACHE.joinpath("metricas.jsonl")
+
+ESPEJO_PROCESOS = DIR_ESPEJO.joinpath("procesos.parquet")
+
+MARCA_PROCESOS = DIR_ESPEJO.joinpath("procesos.json")
@@ -1,98 +1,123 @@
+from datetime import date
+
 import pandas as pd
 import plotly.express as px
 import streamlit as st
 
-from data.rutas import PGN2024
-from utils.caches import cargar_df
+from utils.caches import (
+    buscar_agregado,
+    cargar_indice_entidades,
+    cargar_pgn,
+    create_session,
+)
 from utils.config import configurar_pagina
-from utils.variables import TIPO_PRESUPUESTO, COLS_PGN
+from utils.consultas import ErrorSocrata
+from utils.metricas import mostrar_metricas
+from utils.presupuesto import ingerir_pgn, vigencias_pgn
+from utils.socrata import payload_agregado, payload_paa
+from utils.variables import TIPO_PRESUPUESTO, COLS_ENTIDADES, URL_PAA
 
 
 configurar_pagina("Presupuesto de entidades estatales", "💰", "wide")
 
 
-# Preparar ui
-
-st.title(":flag-co: Presupuesto de entidades estatales")
+# Definir variables y constantes
 
-st.markdown("""Presupuesto General de la Nación vigencia 2024.""")
+TOKEN = st.secrets["X_APP_TOKEN"]
 
-st.markdown("---")
+OFFSET = 1000
 
+ANNOS_PAA = list(range(date.today().year, 2019, -1))
 
-df_pgn = cargar_df(
-    PGN2024, tipos=None, columnas=COLS_PGN, ordenar="TOTAL", ascending=False
-)
 
-for col in ["APORTE_NACIONAL", "RECURSOS_PROPIOS", "TOTAL"]:
-    df_pgn[col] = df_pgn[col].str.replace(",", "")
-    df_pgn[col] = pd.to_numeric(df_pgn[col])
+# Preparar ui
 
-df_pgn = df_pgn[df_pgn["nivel"] == "total"]
+st.title(":flag-co: Presupuesto de entidades estatales")
 
-df_inversion = df_pgn[df_pgn["nivel"] == "partida"]
+st.markdown("""Presupuesto General de la Nación por vigencia.""")
 
-tipo = st.selectbox("Seleccione tipo de presupuesto 👇", TIPO_PRESUPUESTO)
+st.markdown("---")
 
-df_tipo = df_pgn[df_pgn["tipo"] == tipo]
 
-fig = px.treemap(
-    df_tipo,
-    path=[px.Constant("Todos"), "ENTIDAD"],
-    values="TOTAL",
-    color="ENTIDAD",
-)
+with st.spinner("Preparando presupuesto..."):
+    firma_pgn = ingerir_pgn()
 
-fig.update_traces(
-    root_color="lightgrey",
-    hovertemplate="<b>%{label}</b><br><b>Monto</b> %{value:,.2f}",
-    texttemplate="<b>%{label}</b><br><b>Monto</b> %{value:,.2f}",
-    textinfo="label+value",
-)
+VIGENCIAS = vigencias_pgn()
 
-st.plotly_chart(fig, use_container_width=True)
+vigencias = st.multiselect("Seleccione vigencias 👇", VIGENCIAS, VIGENCIAS[:1])
 
+tipo = st.selectbox("Seleccione tipo de presupuesto 👇", TIPO_PRESUPUESTO)
 
-# Esto era lo anterior donde cruzaba para obtener sector
+df_tipo = cargar_pgn(tuple(sorted(vigencias)), tipo, "total", firma_pgn)
+df_tipo = df_tipo.sort_values(by="TOTAL", ascending=False)
+df_tipo["vigencia"] = df_tipo["vigencia"].astype(str)
 
-# df_entidades = cargar_df(
-#     ENTIDADES, tipos={"CCB_NIT_INST": str}, columnas=COLS_ENTIDADES
-# )
+if not df_tipo.empty:
+    fig = px.treemap(
+        df_tipo,
+        path=[px.Constant("Todos"), "vigencia", "ENTIDAD"],
+        values="TOTAL",
+        color="ENTIDAD",
+    )
 
-# session = create_session(TOKEN)
+    fig.update_traces(
+        root_color="lightgrey",
+        hovertemplate="<b>%{label}</b><br><b>Monto</b> %{value:,.2f}",
+        texttemplate="<b>%{label}</b><br><b>Monto</b> %{value:,.2f}",
+        textinfo="label+value",
+    )
 
-# prep_ppa = payload_paa(2023, limit=OFFSET)
-# paas = buscar_socrata(_session=session, url=URL_PAA, payload=prep_ppa, offset=OFFSET)
+    st.plotly_chart(fig, use_container_width=True)
 
-# if paas:
-#     df_paa = pd.DataFrame.from_records(paas)
 
-#     df_paa["valor_presupuesto_general"] = pd.to_numeric(
-#         df_paa["valor_presupuesto_general"]
-#     )
+# Planes anuales de adquisición por sector, agregados en Socrata
 
-#     df_paa["normalizado"] = normalizar_textual(df_paa, "nombre_entidad")
-#     df_entidades["normalizado"] = normalizar_textual(df_entidades, "NOMBRE")
+st.markdown("---")
 
-#     df_paa = df_paa.merge(
-#         df_entidades, how="left", left_on="normalizado", right_on="normalizado"
-#     )
+st.subheader("Planes Anuales de Adquisición por sector")
 
-#     cols = COLS_ENTIDADES + ["nombre_entidad"]
-#     df_paa[cols] = df_paa[cols].fillna("No identificado")
+anno = st.selectbox("Seleccione año del plan 👇", ANNOS_PAA)
 
-#     fig = px.treemap(
-#         df_paa,
-#         path=[px.Constant("Todos"), "SECTOR", "nombre_entidad"],
-#         values="valor_presupuesto_general",
-#         color="SECTOR",
-#     )
+indice_entidades = cargar_indice_entidades()
 
-#     fig.update_traces(
-#         root_color="lightgrey",
-#         hovertemplate="<b>%{label}</b><br><b>Monto</b> %{value:,.2f}",
-#         texttemplate="<b>%{label}</b><br><b>Monto</b> %{value:,.2f}",
-#         textinfo="label+value",
-#     )
+session = create_session(TOKEN)
 
-#     st.plotly_chart(fig, use_container_width=True)
+prep_paa = payload_agregado(
+    grupos=["nombre_entidad"],
+    sumas=["valor_presupuesto_general"],
+    contar=False,
+    where=payload_paa(anno)["$where"],
+    offset=OFFSET,
+)
+try:
+    df_paa = buscar_agregado(
+        _session=session, url=URL_PAA, payload=prep_paa, offset=OFFSET
+    )
+except ErrorSocrata as e:
+    st.error(f"No se pudieron agregar los planes en Socrata API. {e}")
+    df_paa = pd.DataFrame()
+
+if not df_paa.empty:
+    df_paa = indice_entidades.enriquecer(df_paa, col_nombre="nombre_entidad")
+
+    cols = COLS_ENTIDADES + ["nombre_entidad"]
+    df_paa[cols] = df_paa[cols].fillna("No identificado")
+
+    fig = px.treemap(
+        df_paa,
+        path=[px.Constant("Todos"), "SECTOR", "nombre_entidad"],
+        values="suma_valor_presupuesto_general",
+        color="SECTOR",
+    )
+
+    fig.update_traces(
+        root_color="lightgrey",
+        hovertemplate="<b>%{label}</b><br><b>Monto</b> %{value:,.2f}",
+        texttemplate="<b>%{label}</b><br><b>Monto</b> %{value:,.2f}",
+        textinfo="label+value",
+    )
+
+    st.plotly_chart(fig, use_container_width=True)
+
+
+mostrar_metricas()
@@ -1,49 +1,40 @@
 from st_aggrid import GridOptionsBuilder, AgGrid, GridUpdateMode, ColumnsAutoSizeMode
-from sentence_transformers import util
 import pandas as pd
 import plotly.express as px
 import streamlit as st
 
-from data.rutas import ENTIDADES, META_PAA, DIR_PAA
-from utils.caches import cargar_df, load_embedder, encode_texts
+from data.rutas import META_PAA
+from utils.caches import (
+    cargar_df,
+    cargar_indice_entidades,
+    load_embedder,
+    cargar_almacen_embeddings,
+    cargar_indice,
+    cargar_indice_lexico,
+    filas_almacen,
+    encode_texts,
+    cargar_paa,
+    cargar_vectores_paa,
+)
+from utils.codificacion import codificar_textos
 from utils.config import configurar_pagina
-from utils.variables import COLS_ENTIDADES, COLS_PAA
+from utils.indices import buscar_similares
+from utils.lexico import buscar_hibrido
+from utils.metricas import medir, mostrar_metricas
+from utils.paa import ingerir_paa, firma_vectores_paa
+from utils.variables import MODELO, PESO_LEXICO, PRECISION_EMBEDDINGS
 
 
 configurar_pagina("Planes anuales de adquisición", "💸", "wide")
 
 
-# Definir variables y constantes
-
-MODELO = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
-
-RENOMBRES = {
-    "Código UNSPSC (cada código separado por ;)": "unspsc",
-    "Descripción": "descripcion",
-    "Fecha estimada de inicio de proceso de selección (mes)": "mes_inicio",
-    "Fecha estimada de presentación de ofertas (mes)": "mes_oferta",
-    "Duración del contrato (número)": "duracion",
-    "Duración del contrato (intervalo: días, meses, años)": "intervalo",
-    "Modalidad de selección ": "modalidad",
-    "Fuente de los recursos": "fuente",
-    "Valor total estimado": "valor",
-    "Valor estimado en la vigencia actual": "valor_vigencia",
-    "¿Se requieren vigencias futuras?": "vigencias_futuras",
-    "Estado de solicitud de vigencias futuras": "solicitud_vigencias",
-    "Unidad de contratación (referencia)": "unidad",
-    "Ubicación": "ubicacion",
-    "Nombre del responsable ": "responsable",
-    "Teléfono del responsable ": "telefono",
-    "Correo electrónico del responsable ": "email",
-    "¿Debe cumplir con invertir mínimo el 30% de los recursos del presupuesto destinados a comprar alimentos, cumpliendo con lo establecido en la Ley 2046 de 2020, reglamentada por el Decreto 248 de 2021?": "otra1",
-    "¿El contrato incluye el suministro de bienes y servicios distintos a alimentos?": "otra2",
-}
-
-
 # Datos globales y config
 
 df_meta = cargar_df(META_PAA, {"nit_entidad": str}, ordenar="entidad")
 
+with st.spinner("Preparando planes de adquisición..."):
+    firma_paa = ingerir_paa()
+
 
 # Preparar ui
 
@@ -59,41 +50,90 @@ opt_entidades = st.multiselect("Seleccione entidades", df_meta["entidad"])
 
 query = st.text_input("Consulta a realizar")
 
+col_hibrida, col_peso = st.columns(2)
+
+hibrida = col_hibrida.toggle(
+    "Búsqueda híbrida",
+    value=True,
+    help="Preselecciona por términos (BM25) y solo calcula vectores de esos candidatos",
+)
+peso_lexico = col_peso.slider(
+    "Peso léxico", 0.0, 1.0, PESO_LEXICO, 0.05, disabled=not hibrida
+)
+
 
 # Aca se modifica todo
 
 embedder = load_embedder(MODELO)
+almacen = cargar_almacen_embeddings(embedder, MODELO)
+indice = cargar_indice(almacen, MODELO)
 
-df_entidades = cargar_df(
-    ENTIDADES, tipos={"CCB_NIT_INST": str}, columnas=COLS_ENTIDADES
-)
+indice_entidades = cargar_indice_entidades()
 
 if opt_entidades and query:
     df_filtrado = df_meta[df_meta["entidad"].isin(opt_entidades)]
 
-    dfs = []
-
-    for row in df_filtrado.itertuples():
-        df = pd.read_excel(DIR_PAA.joinpath(row.archivo), skiprows=1)
-        df.rename(RENOMBRES, inplace=True, axis=1)
-        df = df[COLS_PAA]
-        df["entidad"] = row.entidad
-        df["nit_entidad"] = row.nit_entidad
-        dfs.append(df)
+    archivos = df_filtrado["archivo"].to_list()
 
-    df_paa = pd.concat(dfs, ignore_index=True)
+    df_paa = cargar_paa(archivos, firma_paa)
+    vectores_paa = cargar_vectores_paa(archivos, firma_vectores_paa())
 
     corpus = df_paa["descripcion"].to_list()
 
-    if corpus:
-        corpus_embeddings = encode_texts(embedder, corpus)
+    filas = None
+
+    if vectores_paa is not None:
+        # Fragmentos precalculados: no hace falta pasar el corpus por el modelo
+        corpus_embeddings = vectores_paa[0]
+    elif corpus and not hibrida:
+        corpus_embeddings = encode_texts(
+            embedder, corpus, _almacen=almacen, precision=PRECISION_EMBEDDINGS
+        )
+        filas = filas_almacen(embedder, almacen, corpus)
+        indice.actualizar(almacen)
 
     if query:
         query_embedding = encode_texts(embedder, query)
 
-    if corpus and query:
-        hits = util.semantic_search(query_embedding, corpus_embeddings, top_k=10)
+    if corpus and query and hibrida:
+
+        def vectores(ids):
+            if vectores_paa is not None:
+                return corpus_embeddings[ids]
+
+            # Sin cache de Streamlit: cada consulta trae otros candidatos y el
+            # almacén ya evita recalcularlos
+            return almacen.obtener(
+                [corpus[i] for i in ids],
+                lambda faltantes: codificar_textos(embedder, faltantes),
+            )
+
+        # Los archivos y la firma de los planes identifican el corpus
+        firma_corpus = f"{firma_paa}:{'|'.join(archivos)}"
+
+        with medir("paa.hibrida") as medicion:
+            hits = buscar_hibrido(
+                query,
+                query_embedding,
+                cargar_indice_lexico(corpus, firma_corpus),
+                vectores,
+                top_k=10,
+                peso_lexico=peso_lexico,
+            )
+            medicion.filas = len(corpus)
+    elif corpus and query:
+        with medir("paa.similitud") as medicion:
+            hits = buscar_similares(
+                query_embedding,
+                corpus_embeddings,
+                top_k=10,
+                indice=indice,
+                almacen=almacen,
+                filas=filas,
+            )
+            medicion.filas = len(corpus)
 
+    if corpus and query:
         query_hits = hits[0]
 
         ids = [hit["corpus_id"] for hit in query_hits]
@@ -101,22 +141,23 @@ if opt_entidades and query:
         df_similarity = df_paa.loc[ids]
         df_similarity["score"] = [hit["score"] for hit in query_hits]
 
-        df_similarity["nit_entidad"] = df_similarity["nit_entidad"].astype(str)
-
-        df_similarity = df_similarity.merge(
-            df_entidades, how="left", left_on="nit_entidad", right_on="CCB_NIT_INST"
-        )
+        with medir("paa.entidades"):
+            df_similarity = indice_entidades.enriquecer(
+                df_similarity, col_nit="nit_entidad", col_nombre="entidad"
+            )
 
         gb = GridOptionsBuilder.from_dataframe(df_similarity)
         gb.configure_selection(selection_mode="multiple", use_checkbox=True)
         gridOptions = gb.build()
 
-        grid = AgGrid(
-            df_similarity,
-            gridOptions,
-            columns_auto_size_mode=ColumnsAutoSizeMode.FIT_CONTENTS,
-            update_mode=GridUpdateMode.SELECTION_CHANGED,
-        )
+        with medir("paa.aggrid") as medicion:
+            grid = AgGrid(
+                df_similarity,
+                gridOptions,
+                columns_auto_size_mode=ColumnsAutoSizeMode.FIT_CONTENTS,
+                update_mode=GridUpdateMode.SELECTION_CHANGED,
+            )
+            medicion.filas = len(df_similarity)
 
         selected_rows = grid["selected_rows"]
 
@@ -174,3 +215,6 @@ if opt_entidades and query:
                         :{color_score}[{fila.get('score'):.2f}]
                     """
                 )
+
+
+mostrar_metricas()
@@ -1,24 +1,43 @@
 from datetime import date, timedelta
 
 from st_aggrid import GridOptionsBuilder, AgGrid, GridUpdateMode, ColumnsAutoSizeMode
-from sentence_transformers import util
 import pandas as pd
 import streamlit as st
 
-from data.rutas import ENTIDADES
+from data.rutas import ESPEJO_PROCESOS
 from utils.caches import (
     load_embedder,
+    cargar_almacen_embeddings,
+    cargar_indice,
+    cargar_indice_lexico,
+    filas_almacen,
     encode_texts,
     create_session,
-    buscar_socrata,
-    crear_df_resultados,
-    cargar_df,
+    buscar_df_socrata,
+    cargar_indice_entidades,
+    cargar_parquet,
     limpiar_estado,
 )
+from utils.codificacion import codificar_textos
 from utils.config import configurar_pagina
-from utils.helpers import validar_fechas
+from utils.consultas import ErrorSocrata
+from utils.indices import buscar_similares
+from utils.lexico import buscar_hibrido, firma_corpus
+from utils.metricas import medir, mostrar_metricas
+from utils.espejo import cobertura_espejo, filtrar_procesos
+from utils.helpers import mascara_procesos, validar_fechas
+from utils.tablas import aplicar_esquema, depurar_df
 from utils.socrata import payload_procesos
-from utils.variables import URL_PROCESOS, COLS_PROCESOS, ORDEN_ENTIDAD
+from utils.variables import (
+    URL_PROCESOS,
+    COLS_PROCESOS,
+    ANIDADOS_PROCESOS,
+    ESQUEMA_PROCESOS,
+    MODELO,
+    ORDEN_ENTIDAD,
+    PESO_LEXICO,
+    PRECISION_EMBEDDINGS,
+)
 
 
 configurar_pagina(title="Procesos de contratación pública", icon="📇", layout="wide")
@@ -31,10 +50,6 @@ TOKEN = st.secrets["X_APP_TOKEN"]
 COLS_NA = ["descripci_n_del_procedimiento"]
 COLS_DUP = ["id_del_proceso", "entidad"]
 
-COLS_ENTIDADES = ["NOMBRE", "CCB_NIT_INST", "ORDEN", "SECTOR"]
-
-MODELO = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
-
 OFFSET = 1000
 
 HOY = date.today()
@@ -46,7 +61,7 @@ k1 = "procesos"
 k2 = "seleccion"
 
 if k1 not in st.session_state:
-    st.session_state[k1] = []
+    st.session_state[k1] = pd.DataFrame()
 
 if k2 not in st.session_state:
     st.session_state[k2] = {}
@@ -70,35 +85,78 @@ with st.sidebar:
 
     orden_entidad = st.selectbox("Tipo de entidad", ORDEN_ENTIDAD)
 
+    # La copia local solo se propone si cubre todo el rango pedido
+    cobertura = cobertura_espejo() if ESPEJO_PROCESOS.exists() else None
+    inicio_rango, fin_rango = validar_fechas(tuple(fechas))
+
+    cubre_rango = cobertura is not None and (
+        cobertura[0] <= inicio_rango and fin_rango <= cobertura[1]
+    )
+
+    usar_espejo = st.checkbox(
+        "Usar copia local",
+        value=cubre_rango,
+        disabled=cobertura is None,
+    )
+
+    if cobertura is None:
+        st.caption("Sin copia local completa, se consulta Socrata API.")
+    else:
+        st.caption(
+            f"La copia local cubre del {cobertura[0]:%Y-%m-%d} al "
+            f"{cobertura[1]:%Y-%m-%d}. Fuera de ese rango se consulta Socrata API."
+        )
+
+        if usar_espejo and not cubre_rango:
+            st.warning("El rango pedido no está completo en la copia local.")
+
     boton = st.button("Buscar procesos", on_click=limpiar_estado, args=(k2,))
 
 
 # Aca se modifica todo
 
 embedder = load_embedder(MODELO)
+almacen = cargar_almacen_embeddings(embedder, MODELO)
+indice = cargar_indice(almacen, MODELO)
 
-with st.spinner("Cargando listado de sectores..."):
-    df_ents = cargar_df(ENTIDADES, {"CCB_NIT_INST": str}, COLS_ENTIDADES)
+indice_entidades = cargar_indice_entidades()
 
 if boton:
     inicio, fin = validar_fechas(fechas)
 
-    payload = payload_procesos(
+    filtros = dict(
         fechas=(inicio, fin),
         precio_minimo=precio_minimo,
-        offset=OFFSET,
         orden=orden_entidad,
         sort="fecha_de_publicacion_del DESC",
     )
 
-    procesos = buscar_socrata(
-        _session=session, url=URL_PROCESOS, payload=payload, offset=OFFSET
-    )
+    if usar_espejo:
+        df_espejo = cargar_parquet(ESPEJO_PROCESOS, ESPEJO_PROCESOS.stat().st_mtime)
+        df_procesos = filtrar_procesos(df_espejo, **filtros)
+        df_procesos = depurar_df(df_procesos, na_cols=COLS_NA, dup_cols=COLS_DUP)
+        df_procesos = aplicar_esquema(df_procesos, ESQUEMA_PROCESOS)
+    else:
+        payload = payload_procesos(offset=OFFSET, **filtros)
+
+        try:
+            df_procesos = buscar_df_socrata(
+                _session=session,
+                url=URL_PROCESOS,
+                payload=payload,
+                columnas=COLS_PROCESOS,
+                offset=OFFSET,
+                paralelo=True,
+                anidados=ANIDADOS_PROCESOS,
+                na_cols=COLS_NA,
+                dup_cols=COLS_DUP,
+                esquema=ESQUEMA_PROCESOS,
+            )
+        except ErrorSocrata as e:
+            st.error(f"No se pudo completar la búsqueda en Socrata API. {e}")
+            st.stop()
 
-    st.session_state[k1] = [
-        {k: proceso.get(k) for k in proceso.keys() if k in COLS_PROCESOS}
-        for proceso in procesos
-    ]
+    st.session_state[k1] = df_procesos
 
     n = len(st.session_state[k1])
 
@@ -109,44 +167,133 @@ if boton:
     st.info(f"{n} registros encontrados.", icon="🔥")
 
 
-if st.session_state[k1]:
-    df_procesos = crear_df_resultados(
-        st.session_state[k1], na_cols=COLS_NA, dup_cols=COLS_DUP
-    )
+if not st.session_state[k1].empty:
+    df_procesos = st.session_state[k1]
+
+    # Los filtros no cambian el corpus, así sus vectores se calculan una vez
+    corpus = df_procesos["descripci_n_del_procedimiento"].to_list()
 
-    df_procesos["urlproceso"] = df_procesos["urlproceso"].apply(lambda x: x.get("url"))
+    precios = df_procesos["precio_base"].fillna(0)
+    publicados = df_procesos["fecha_de_publicacion_del"]
+
+    col_entidades, col_modalidades = st.columns(2)
 
     entidades = list(df_procesos["entidad"].sort_values().unique())
-    sel_entidades = st.multiselect("Entidades a considerar (opcional)", entidades)
+    sel_entidades = col_entidades.multiselect(
+        "Entidades a considerar (opcional)", entidades
+    )
 
-    if sel_entidades:
-        df_procesos = df_procesos[df_procesos["entidad"].isin(sel_entidades)]
-        df_procesos = df_procesos.reset_index(drop=True)
+    modalidades = list(df_procesos["modalidad_de_contratacion"].dropna().unique())
+    sel_modalidades = col_modalidades.multiselect(
+        "Modalidades a considerar (opcional)", sorted(modalidades)
+    )
 
-    corpus = df_procesos["descripci_n_del_procedimiento"].to_list()
+    col_precio, col_fechas = st.columns(2)
+
+    precio_min, precio_max = int(precios.min()), int(precios.max())
+    sel_precio = col_precio.slider(
+        "Rango de precio base",
+        precio_min,
+        max(precio_max, precio_min + 1),
+        (precio_min, max(precio_max, precio_min + 1)),
+        format="%d",
+    )
+
+    # Sin ninguna fecha válida no hay rango que ofrecer
+    sel_fechas = None
+
+    if publicados.notna().any():
+        publicado_min = publicados.min().date()
+        publicado_max = publicados.max().date()
+
+        sel_fechas = col_fechas.date_input(
+            "Publicados entre",
+            [publicado_min, publicado_max],
+            min_value=publicado_min,
+            max_value=publicado_max,
+        )
+
+    rango_completo = sel_precio == (precio_min, max(precio_max, precio_min + 1))
+
+    mascara = mascara_procesos(
+        df_procesos,
+        entidades=sel_entidades,
+        precio=None if rango_completo else sel_precio,
+        modalidades=sel_modalidades,
+        fechas=None if sel_fechas is None else tuple(sel_fechas),
+    )
+
+    st.caption(f"{mascara.sum()} de {len(mascara)} procesos en la búsqueda.")
 
     query = st.text_input("Consulta a realizar")
 
+    col_hibrida, col_peso = st.columns(2)
+
+    hibrida = col_hibrida.toggle(
+        "Búsqueda híbrida",
+        value=True,
+        help="Preselecciona por términos (BM25) y solo calcula vectores de esos candidatos",
+    )
+    peso_lexico = col_peso.slider(
+        "Peso léxico", 0.0, 1.0, PESO_LEXICO, 0.05, disabled=not hibrida
+    )
+
     btn_filtro = st.button("Filtrar resultados")
 
     if btn_filtro:
-        corpus_embeddings = encode_texts(embedder, corpus)
+        if not hibrida:
+            corpus_embeddings = encode_texts(
+                embedder, corpus, _almacen=almacen, precision=PRECISION_EMBEDDINGS
+            )
+            filas = filas_almacen(embedder, almacen, corpus)
+            indice.actualizar(almacen)
 
         if query:
             query_embedding = encode_texts(embedder, query)
 
-            hits = util.semantic_search(query_embedding, corpus_embeddings, top_k=10)
+            if hibrida:
+                indice_lexico = cargar_indice_lexico(corpus, firma_corpus(corpus))
+
+                with medir("procesos.hibrida") as medicion:
+                    hits = buscar_hibrido(
+                        query,
+                        query_embedding,
+                        indice_lexico,
+                        # Sin cache de Streamlit: cada consulta trae otros
+                        # candidatos y el almacén ya evita recalcularlos
+                        lambda ids: almacen.obtener(
+                            [corpus[i] for i in ids],
+                            lambda faltantes: codificar_textos(embedder, faltantes),
+                        ),
+                        top_k=10,
+                        peso_lexico=peso_lexico,
+                        mascara=mascara,
+                    )
+                    medicion.filas = int(mascara.sum())
+            else:
+                with medir("procesos.similitud") as medicion:
+                    hits = buscar_similares(
+                        query_embedding,
+                        corpus_embeddings,
+                        top_k=10,
+                        indice=indice,
+                        almacen=almacen,
+                        filas=filas,
+                        mascara=mascara,
+                    )
+                    medicion.filas = int(mascara.sum())
 
             query_hits = hits[0]
 
             ids = [hit["corpus_id"] for hit in query_hits]
 
-            df_similarity = df_procesos.loc[ids]
+            df_similarity = df_procesos.iloc[ids]
             df_similarity["score"] = [hit["score"] for hit in query_hits]
 
-            df_similarity = df_similarity.merge(
-                df_ents, how="left", left_on="nit_entidad", right_on="CCB_NIT_INST"
-            )
+            with medir("procesos.entidades"):
+                df_similarity = indice_entidades.enriquecer(
+                    df_similarity, col_nit="nit_entidad", col_nombre="entidad"
+                )
 
             COLS = COLS_PROCESOS + ["SECTOR", "score"]
 
@@ -161,13 +308,15 @@ if st.session_state[k2]:
     gb.configure_selection(selection_mode="multiple", use_checkbox=True)
     gridOptions = gb.build()
 
-    grid = AgGrid(
-        df_similarity,
-        gridOptions,
-        height=250,
-        columns_auto_size_mode=ColumnsAutoSizeMode.FIT_CONTENTS,
-        update_mode=GridUpdateMode.SELECTION_CHANGED,
-    )
+    with medir("procesos.aggrid") as medicion:
+        grid = AgGrid(
+            df_similarity,
+            gridOptions,
+            height=250,
+            columns_auto_size_mode=ColumnsAutoSizeMode.FIT_CONTENTS,
+            update_mode=GridUpdateMode.SELECTION_CHANGED,
+        )
+        medicion.filas = len(df_similarity)
 
     selected_rows = grid["selected_rows"]
 
@@ -188,7 +337,7 @@ if st.session_state[k2]:
 
                     Entidad: :blue[{fila.get('entidad')}]
 
-                    Valor: :blue[{float(fila.get('precio_base')):,.2f}]
+                    Valor: :blue[{fila.get('precio_base'):,.2f}]
 
                     Duración: {fila.get('duracion')} {fila.get('unidad_de_duracion')}
 
@@ -208,3 +357,6 @@ if st.session_state[k2]:
                 st.markdown(f"Proveedor: {fila.get('nombre_del_proveedor')}")
 
             st.divider()
+
+
+mostrar_metricas()
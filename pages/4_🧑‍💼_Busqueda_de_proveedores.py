@@ -1,18 +1,22 @@
 from datetime import date, timedelta
 
 from st_aggrid import GridOptionsBuilder, AgGrid, GridUpdateMode, ColumnsAutoSizeMode
+import pandas as pd
 import streamlit as st
 
 
-from utils.caches import create_session, buscar_socrata, crear_df_resultados
+from utils.caches import create_session, buscar_df_socrata, cargar_detalles_procesos
 from utils.config import configurar_pagina
+from utils.consultas import ErrorSocrata
 from utils.helpers import validar_fechas
-from utils.socrata import payload_proponentes, payload_procesos
+from utils.metricas import medir, mostrar_metricas
+from utils.socrata import payload_proponentes
+from utils.tablas import aplicar_esquema
 from utils.variables import (
     COLS_PROVEEDORES,
-    COLS_PROCESOS,
+    ESQUEMA_PROCESOS,
+    ESQUEMA_PROVEEDORES,
     URL_PROPONENTES,
-    URL_PROCESOS,
 )
 
 
@@ -30,15 +34,19 @@ COLS_DUP = ["proveedor", "id_procedimiento"]
 
 OFFSET = 1000
 
+# Filas por página de la tabla, sus detalles se precargan al buscar
+PAGINA = 20
+
 HOY = date.today()
 ayer = HOY - timedelta(days=30)
 
 session = create_session(TOKEN)
+detalles = cargar_detalles_procesos(session)
 
 k1 = "proveedores"
 
 if k1 not in st.session_state:
-    st.session_state[k1] = []
+    st.session_state[k1] = pd.DataFrame()
 
 # Preparar ui
 
@@ -68,14 +76,24 @@ if boton:
     else:
         payload = payload_proponentes(fechas=(inicio, fin), offset=OFFSET)
 
-    resultados = buscar_socrata(
-        _session=session, url=URL_PROPONENTES, payload=payload, offset=OFFSET
-    )
+    try:
+        st.session_state[k1] = buscar_df_socrata(
+            _session=session,
+            url=URL_PROPONENTES,
+            payload=payload,
+            columnas=COLS_PROVEEDORES,
+            offset=OFFSET,
+            paralelo=True,
+            na_cols=COLS_NA,
+            dup_cols=COLS_DUP,
+            esquema=ESQUEMA_PROVEEDORES,
+        )
+    except ErrorSocrata as e:
+        st.error(f"No se pudo completar la búsqueda en Socrata API. {e}")
+        st.stop()
 
-    st.session_state[k1] = [
-        {k: res.get(k) for k in res.keys() if k in COLS_PROVEEDORES}
-        for res in resultados
-    ]
+    # Detalles de la primera página en segundo plano, una vez por búsqueda
+    detalles.precargar(st.session_state[k1]["id_procedimiento"].dropna()[:PAGINA])
 
     n = len(st.session_state[k1])
 
@@ -86,41 +104,50 @@ if boton:
     st.info(f"{n} registros encontrados.", icon="🔥")
 
 
-if st.session_state[k1]:
-    df_proveedores = crear_df_resultados(
-        st.session_state[k1], na_cols=COLS_NA, dup_cols=COLS_DUP
-    )
-
-    df_proveedores = df_proveedores[COLS_PROVEEDORES]
+if not st.session_state[k1].empty:
+    df_proveedores = st.session_state[k1]
 
     gb = GridOptionsBuilder.from_dataframe(df_proveedores)
     gb.configure_column(field="nit_proveedor", hide=True, supress_tool_panel=True)
 
     gb.configure_selection(selection_mode="single", use_checkbox=True)
+    gb.configure_pagination(paginationAutoPageSize=False, paginationPageSize=PAGINA)
     gridOptions = gb.build()
 
-    grid = AgGrid(
-        df_proveedores,
-        gridOptions,
-        height=250,
-        columns_auto_size_mode=ColumnsAutoSizeMode.FIT_CONTENTS,
-        update_mode=GridUpdateMode.SELECTION_CHANGED,
-    )
+    with medir("proveedores.aggrid") as medicion:
+        grid = AgGrid(
+            df_proveedores,
+            gridOptions,
+            height=250,
+            columns_auto_size_mode=ColumnsAutoSizeMode.FIT_CONTENTS,
+            update_mode=GridUpdateMode.SELECTION_CHANGED,
+        )
+        medicion.filas = len(df_proveedores)
 
     selected_rows = grid["selected_rows"]
 
-    for fila in selected_rows:
-        id_proceso = fila.get("id_procedimiento")
+    try:
+        with medir("proveedores.detalles") as medicion:
+            procesos = detalles.obtener(
+                fila.get("id_procedimiento") for fila in selected_rows
+            )
+            medicion.filas = len(procesos)
+    except ErrorSocrata as e:
+        st.error(f"No se pudieron cargar los detalles de los procesos. {e}")
+        procesos = {}
+
+    if procesos:
+        # Mismos tipos que las tablas de procesos, convertidos de una vez
+        df_detalles = aplicar_esquema(
+            pd.DataFrame.from_records(list(procesos.values()), index=list(procesos)),
+            ESQUEMA_PROCESOS,
+        )
+        procesos = df_detalles.to_dict("index")
 
-        pay = payload_procesos(id_proceso=id_proceso)
-        res = buscar_socrata(_session=session, url=URL_PROCESOS, payload=pay)
-        res = [
-            {k: proceso.get(k) for k in proceso.keys() if k in COLS_PROCESOS}
-            for proceso in res
-        ]
-        if res:
-            resultado = res[0]
+    for fila in selected_rows:
+        resultado = procesos.get(fila.get("id_procedimiento"))
 
+        if resultado:
             adjudicado = resultado.get("adjudicado")
             color_adjud = "green" if adjudicado == "Si" else "red"
 
@@ -131,7 +158,7 @@ if st.session_state[k1]:
 
                     Entidad: :blue[{resultado.get('entidad')}]
 
-                    Valor: :blue[{float(resultado.get('precio_base')):,.2f}]
+                    Valor: :blue[{resultado.get('precio_base'):,.2f}]
 
                     Duración: {resultado.get('duracion')} {resultado.get('unidad_de_duracion')}
 
@@ -147,3 +174,6 @@ if st.session_state[k1]:
 
             if adjudicado == "Si":
                 st.markdown(f"Proveedor: {resultado.get('nombre_del_proveedor')}")
+
+
+mostrar_metricas()
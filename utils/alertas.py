@@ -0,0 +1,374 @@
+"""Búsquedas semánticas guardadas sobre procesos nuevos, sin Streamlit
+
+Uso:
+
+    python -m utils.alertas
+    python -m utils.alertas --desde 2024-05-01 --hasta 2024-05-07 --formato csv
+    python -m utils.alertas --espejo --consultas clientes.json
+
+Descarga una vez la ventana de SECOP II - Procesos, calcula una vez los
+vectores del corpus y puntúa todas las consultas guardadas en bloques de
+productos de matrices. Los resultados de todas las consultas quedan en un
+archivo, con una fila por coincidencia.
+"""
+
+from datetime import date, timedelta
+from pathlib import Path
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from data.rutas import (
+    CACHE_SOCRATA,
+    CONSULTAS_ALERTAS,
+    DIR_EMBEDDINGS,
+    DIR_RESULTADOS_ALERTAS,
+    ESPEJO_PROCESOS,
+)
+from utils.codificacion import codificar_textos
+from utils.consultas import iterar_socrata
+from utils.entidades import IndiceEntidades
+from utils.espejo import filtrar_procesos
+from utils.indices import buscar_exacto
+from utils.persistencia import CacheRespuestas
+from utils.socrata import payload_procesos
+from utils.tablas import (
+    aplicar_esquema,
+    depurar_df,
+    df_desde_tabla,
+    tabla_desde_paginas,
+)
+from utils.variables import (
+    ANIDADOS_PROCESOS,
+    COLS_PROCESOS,
+    ESQUEMA_PROCESOS,
+    URL_PROCESOS,
+)
+
+
+# Resultados por consulta y similitud mínima si la consulta no los define
+TOP_K = 20
+UMBRAL = 0.5
+
+# Consultas que se puntúan juntas, limita la matriz de puntajes en memoria
+CONSULTAS_POR_BLOQUE = 256
+
+COL_TEXTO = "descripci_n_del_procedimiento"
+COLS_DUP = ["id_del_proceso", "entidad"]
+
+FORMATOS = ["parquet", "csv"]
+
+
+def leer_consultas(ruta=CONSULTAS_ALERTAS) -> pd.DataFrame:
+    """Lee las consultas guardadas desde CSV o JSON
+
+    Cada consulta tiene `consulta` y opcionalmente `cliente`, `top_k` y
+    `umbral`.
+
+    Parameters
+    ----------
+    ruta : str | Path, optional
+        Archivo .csv o .json (lista de objetos), default CONSULTAS_ALERTAS
+
+    Returns
+    -------
+    pd.DataFrame
+        Consultas con columnas consulta_id, cliente, consulta, top_k y umbral
+    """
+    ruta = Path(ruta)
+
+    if ruta.suffix == ".json":
+        df = pd.DataFrame(json.loads(ruta.read_text(encoding="utf-8")))
+    else:
+        df = pd.read_csv(ruta, encoding="utf-8", dtype={"cliente": str})
+
+    if "consulta" not in df.columns:
+        raise ValueError(f"{ruta} no tiene la columna consulta")
+
+    df = df.dropna(subset=["consulta"])
+    df = df[df["consulta"].str.strip() != ""].reset_index(drop=True)
+
+    if "consulta_id" not in df.columns:
+        df["consulta_id"] = df.index
+
+    df["cliente"] = df.get("cliente", pd.Series("", index=df.index)).fillna("")
+    df["top_k"] = df.get("top_k", pd.Series(TOP_K, index=df.index)).fillna(TOP_K)
+    df["umbral"] = df.get("umbral", pd.Series(UMBRAL, index=df.index)).fillna(UMBRAL)
+
+    df["top_k"] = df["top_k"].astype(int)
+    df["umbral"] = df["umbral"].astype(float)
+
+    return df[["consulta_id", "cliente", "consulta", "top_k", "umbral"]]
+
+
+def descargar_procesos(
+    session,
+    fechas: tuple[date],
+    precio_minimo: int = 0,
+    orden: str = None,
+    offset: int = 1000,
+    cache: CacheRespuestas = None,
+) -> pd.DataFrame:
+    """Procesos publicados en una ventana, desde Socrata API
+
+    Usa el mismo cache en disco que `buscar_df_socrata`, así una ventana ya
+    consultada desde la aplicación no se vuelve a descargar.
+
+    Parameters
+    ----------
+    session : requests.Session
+        Sesión con el token de la aplicación
+    fechas : tuple[date]
+        Fechas inicial y final de publicación
+    precio_minimo : int, optional
+        Precio mínimo del proceso, default 0
+    orden : str, optional
+        Entidad de orden Nacional o Territorial, default None para todas
+    offset : int, optional
+        Cantidad de resultados por llamado, default 1000
+    cache : CacheRespuestas, optional
+        Cache de respuestas, default None para no usarlo
+
+    Returns
+    -------
+    pd.DataFrame
+        Procesos con COLS_PROCESOS y ESQUEMA_PROCESOS, sin descripciones
+        vacías ni repetidos
+    """
+    payload = payload_procesos(
+        fechas=fechas, precio_minimo=precio_minimo, offset=offset, orden=orden
+    )
+
+    variante = {"columnas": COLS_PROCESOS, "anidados": ANIDADOS_PROCESOS}
+
+    tabla = None if cache is None else cache.leer_tabla(URL_PROCESOS, payload, variante)
+
+    if tabla is None:
+        paginas = iterar_socrata(session, URL_PROCESOS, payload, offset, True)
+        tabla = tabla_desde_paginas(paginas, COLS_PROCESOS, ANIDADOS_PROCESOS)
+
+        if cache is not None:
+            cache.guardar_tabla(URL_PROCESOS, payload, tabla, variante)
+
+    df = depurar_df(df_desde_tabla(tabla), [COL_TEXTO], COLS_DUP)
+
+    return aplicar_esquema(df, ESQUEMA_PROCESOS)
+
+
+def puntuar_consultas(vectores_consultas, vectores_corpus, top_k: int) -> list:
+    """Mejores procesos de cada consulta, por bloques de consultas
+
+    Parameters
+    ----------
+    vectores_consultas : np.ndarray
+        Matriz de vectores de las consultas
+    vectores_corpus : np.ndarray
+        Matriz de vectores del corpus
+    top_k : int
+        Resultados por consulta
+
+    Returns
+    -------
+    list
+        Una lista de {"corpus_id", "score"} por consulta
+    """
+    hits = []
+
+    for i in range(0, len(vectores_consultas), CONSULTAS_POR_BLOQUE):
+        bloque = vectores_consultas[i : i + CONSULTAS_POR_BLOQUE]
+        hits.extend(buscar_exacto(bloque, vectores_corpus, top_k=top_k))
+
+    return hits
+
+
+def ejecutar_alertas(
+    df_procesos: pd.DataFrame,
+    df_consultas: pd.DataFrame,
+    embedder,
+    almacen=None,
+    indice_entidades: IndiceEntidades = None,
+) -> pd.DataFrame:
+    """Puntúa todas las consultas contra los procesos
+
+    Parameters
+    ----------
+    df_procesos : pd.DataFrame
+        Procesos de la ventana, ver `descargar_procesos`
+    df_consultas : pd.DataFrame
+        Consultas guardadas, ver `leer_consultas`
+    embedder : SentenceTransformer | ClienteEmbeddings
+        Modelo o cliente del servicio de vectores
+    almacen : AlmacenEmbeddings, optional
+        Almacén para reutilizar vectores ya calculados, default None
+    indice_entidades : IndiceEntidades, optional
+        Índice para agregar el sector de cada entidad, default None
+
+    Returns
+    -------
+    pd.DataFrame
+        Una fila por consulta y proceso que supera su umbral, con
+        consulta_id, cliente, consulta, posicion, score y COLS_PROCESOS
+    """
+    columnas = ["consulta_id", "cliente", "consulta", "posicion", "score"]
+
+    if df_procesos.empty or df_consultas.empty:
+        return pd.DataFrame(columns=columnas + list(df_procesos.columns))
+
+    df_procesos = df_procesos.reset_index(drop=True)
+    corpus = df_procesos[COL_TEXTO].to_list()
+
+    if almacen is None:
+        vectores_corpus = codificar_textos(embedder, corpus)
+    else:
+        vectores_corpus = almacen.obtener(
+            corpus, lambda faltantes: codificar_textos(embedder, faltantes)
+        )
+
+    vectores_consultas = codificar_textos(embedder, df_consultas["consulta"].to_list())
+
+    hits = puntuar_consultas(
+        vectores_consultas, vectores_corpus, int(df_consultas["top_k"].max())
+    )
+
+    filas = []
+
+    for consulta, hits_consulta in zip(df_consultas.itertuples(), hits):
+        for posicion, hit in enumerate(hits_consulta[: consulta.top_k], start=1):
+            if hit["score"] < consulta.umbral:
+                break
+
+            filas.append(
+                (consulta.Index, posicion, hit["score"], int(hit["corpus_id"]))
+            )
+
+    if not filas:
+        return pd.DataFrame(columns=columnas + list(df_procesos.columns))
+
+    consulta, posicion, score, proceso = map(np.array, zip(*filas))
+
+    df = pd.concat(
+        [
+            df_consultas.loc[consulta, ["consulta_id", "cliente", "consulta"]]
+            .reset_index(drop=True)
+            .assign(posicion=posicion, score=score),
+            df_procesos.loc[proceso].reset_index(drop=True),
+        ],
+        axis=1,
+    )
+
+    if indice_entidades is not None:
+        df = indice_entidades.enriquecer(
+            df, col_nit="nit_entidad", col_nombre="entidad"
+        )
+
+    return df
+
+
+def guardar_resultados(
+    df: pd.DataFrame, salida=DIR_RESULTADOS_ALERTAS, formato: str = "parquet"
+) -> Path:
+    """Guarda los resultados de una ejecución
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Resultados de `ejecutar_alertas`
+    salida : str | Path, optional
+        Archivo o carpeta de salida, default DIR_RESULTADOS_ALERTAS
+    formato : str, optional
+        "parquet" o "csv", si `salida` es una carpeta, default "parquet"
+
+    Returns
+    -------
+    Path
+        Archivo escrito
+    """
+    salida = Path(salida)
+
+    if salida.suffix not in (".parquet", ".csv"):
+        salida = salida.joinpath(f"alertas_{date.today().isoformat()}.{formato}")
+
+    salida.parent.mkdir(parents=True, exist_ok=True)
+
+    temporal = salida.with_suffix(f".{os.getpid()}.tmp")
+
+    if salida.suffix == ".csv":
+        df.to_csv(temporal, index=False, encoding="utf-8")
+    else:
+        df.to_parquet(temporal, index=False)
+
+    temporal.replace(salida)
+
+    return salida
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from utils.modelos import cargar_modelo, id_vectores
+    from utils.servicio import conectar_servicio
+    from utils.sesion import SesionSocrata
+    from utils.variables import BACKEND_EMBEDDINGS, MODELO
+    from utils.vectores import AlmacenEmbeddings
+
+    ayer = date.today() - timedelta(days=1)
+
+    parser = argparse.ArgumentParser(description="Ejecuta las consultas guardadas")
+    parser.add_argument("--consultas", type=Path, default=CONSULTAS_ALERTAS)
+    parser.add_argument("--desde", type=date.fromisoformat, default=ayer)
+    parser.add_argument("--hasta", type=date.fromisoformat, default=date.today())
+    parser.add_argument("--precio-minimo", type=int, default=0)
+    parser.add_argument("--orden", default=None, help="Nacional o Territorial")
+    parser.add_argument(
+        "--espejo", action="store_true", help="Usar la copia local de procesos"
+    )
+    parser.add_argument("--salida", type=Path, default=DIR_RESULTADOS_ALERTAS)
+    parser.add_argument("--formato", choices=FORMATOS, default="parquet")
+    parser.add_argument("--modelo", default=MODELO)
+    parser.add_argument("--backend", default=BACKEND_EMBEDDINGS)
+    args = parser.parse_args()
+
+    df_consultas = leer_consultas(args.consultas)
+
+    filtros = dict(
+        fechas=(args.desde, args.hasta),
+        precio_minimo=args.precio_minimo,
+        orden=args.orden,
+    )
+
+    if args.espejo:
+        df_procesos = filtrar_procesos(pd.read_parquet(ESPEJO_PROCESOS), **filtros)
+        df_procesos = depurar_df(df_procesos, [COL_TEXTO], COLS_DUP)
+        df_procesos = aplicar_esquema(df_procesos, ESQUEMA_PROCESOS)
+    else:
+        session = SesionSocrata(os.environ["X_APP_TOKEN"])
+        cache = CacheRespuestas(CACHE_SOCRATA)
+        df_procesos = descargar_procesos(session, cache=cache, **filtros)
+
+    embedder = conectar_servicio(args.modelo, args.backend) or cargar_modelo(
+        args.modelo, args.backend
+    )
+
+    modelo = id_vectores(args.modelo, args.backend)
+    almacen = AlmacenEmbeddings(
+        DIR_EMBEDDINGS.joinpath(modelo.replace("/", "__")),
+        modelo,
+        embedder.get_sentence_embedding_dimension(),
+    )
+
+    df = ejecutar_alertas(
+        df_procesos,
+        df_consultas,
+        embedder,
+        almacen=almacen,
+        indice_entidades=IndiceEntidades.desde_archivos(),
+    )
+
+    ruta = guardar_resultados(df, args.salida, args.formato)
+
+    print(
+        f"{len(df_consultas)} consultas sobre {len(df_procesos)} procesos: "
+        f"{len(df)} coincidencias en {ruta}"
+    )
@@ -1,87 +1,267 @@
 from pathlib import Path
 
-from sentence_transformers import SentenceTransformer
 import pandas as pd
-import requests
 import streamlit as st
+import torch
+
+from data.rutas import CACHE_SOCRATA, DIR_EMBEDDINGS
+from utils.codificacion import codificar_textos
+from utils.consultas import DetallesPorId, iterar_socrata, paginar_socrata
+from utils.entidades import IndiceEntidades
+from utils.indices import IndiceVectorial
+from utils.lexico import IndiceBM25
+from utils.metricas import instrumentar, medir
+from utils.modelos import cargar_modelo, id_vectores
+from utils.paa import leer_paa, leer_vectores_paa
+from utils.persistencia import CacheRespuestas
+from utils.presupuesto import leer_pgn
+from utils.servicio import conectar_servicio
+from utils.sesion import SesionSocrata
+from utils.socrata import lotes_ids, payload_procesos
+from utils.tablas import (
+    aplicar_esquema,
+    depurar_df,
+    df_desde_tabla,
+    tabla_desde_paginas,
+)
+from utils.variables import (
+    BACKEND_EMBEDDINGS,
+    HILOS_EMBEDDINGS,
+    MAXIMO_COPIAS_PARQUET,
+    MAXIMO_INDICES_LEXICOS,
+    MAXIMO_SELECCIONES_PAA,
+    TTL_INDICES_LEXICOS,
+    USAR_SERVICIO_EMBEDDINGS,
+    URL_PROCESOS,
+)
+from utils.vectores import AlmacenEmbeddings, compactar
 
 
 # Definir funciones
 
 
-@st.cache_resource(show_spinner="Cargando modelo para similitud semántica...")
-def load_embedder(model_id):
-    return SentenceTransformer(model_id)
+@instrumentar(
+    "embeddings.modelo",
+    st.cache_resource(show_spinner="Cargando modelo para similitud semántica..."),
+)
+def load_embedder(model_id, backend=BACKEND_EMBEDDINGS, hilos=HILOS_EMBEDDINGS):
+    if USAR_SERVICIO_EMBEDDINGS:
+        # Un solo modelo compartido por todos los procesos de Streamlit
+        cliente = conectar_servicio(
+            model_id,
+            backend,
+            respaldo=lambda: cargar_modelo(model_id, backend, hilos),
+        )
 
+        if cliente is not None:
+            return cliente
 
-@st.cache_data(show_spinner="Calculando vectores...")
-def encode_texts(_embedder, texts):
-    embeddings = _embedder.encode(texts, convert_to_tensor=True)
+    return cargar_modelo(model_id, backend, hilos)
+
+
+@st.cache_resource
+def cargar_almacen_embeddings(_embedder, model_id, backend=BACKEND_EMBEDDINGS):
+    modelo = id_vectores(model_id, backend)
+
+    directorio = DIR_EMBEDDINGS.joinpath(modelo.replace("/", "__"))
+    dim = _embedder.get_sentence_embedding_dimension()
+
+    return AlmacenEmbeddings(directorio, modelo, dim)
+
+
+@instrumentar(
+    "embeddings.indice",
+    st.cache_resource(show_spinner="Cargando índice de vectores..."),
+)
+def cargar_indice(_almacen, model_id):
+    # model_id identifica el almacén en la llave del cache
+    return IndiceVectorial.desde_almacen(_almacen)
+
+
+@instrumentar(
+    "lexico.indice",
+    st.cache_resource(
+        show_spinner="Indexando términos...",
+        max_entries=MAXIMO_INDICES_LEXICOS,
+        ttl=TTL_INDICES_LEXICOS,
+    ),
+)
+def cargar_indice_lexico(_texts, firma):
+    # firma identifica el corpus sin hashear todos sus textos en cada rerun
+    return IndiceBM25(_texts)
+
+
+@instrumentar("embeddings.filas", st.cache_data)
+def filas_almacen(_embedder, _almacen, texts):
+    filas = _almacen.asegurar(
+        texts, lambda faltantes: codificar_textos(_embedder, faltantes)
+    )
+
+    return filas
+
+
+@instrumentar(
+    "embeddings.codificar", st.cache_data(show_spinner="Calculando vectores...")
+)
+def encode_texts(_embedder, texts, _almacen=None, precision="float32"):
+    unico = isinstance(texts, str)
+    lista = [texts] if unico else texts
+
+    if _almacen is None:
+        vectores = codificar_textos(_embedder, lista)
+    else:
+        vectores = _almacen.obtener(
+            lista, lambda faltantes: codificar_textos(_embedder, faltantes)
+        )
+
+    embeddings = torch.from_numpy(vectores[0] if unico else vectores)
+
+    if precision != "float32":
+        # float16 o int8: la mitad o la cuarta parte de memoria en el cache
+        embeddings = compactar(embeddings, precision)
 
     return embeddings
 
 
 @st.cache_resource
 def create_session(token):
-    session = requests.Session()
-    session.headers.update({"X-App-token": token})
+    # Una sesión por token: reintentos, conexiones y límite de tasa compartidos
+    session = SesionSocrata(token)
 
     return session
 
 
-@st.cache_data(show_spinner="Buscando en Socrata API...")
-def buscar_socrata(_session, url, payload, offset=1000):
-    error = 0
-    resultados = []
+@st.cache_resource
+def cargar_detalles_procesos(_session):
+    # Compartido entre sesiones, los detalles de un proceso se piden una vez
+    detalles = DetallesPorId(
+        _session,
+        URL_PROCESOS,
+        "id_del_proceso",
+        lambda ids: payload_procesos(ids_proceso=ids),
+        lotes_ids,
+    )
+
+    return detalles
+
+
+@instrumentar(
+    "entidades.indice",
+    st.cache_resource(show_spinner="Cargando índice de entidades..."),
+)
+def cargar_indice_entidades():
+    return IndiceEntidades.desde_archivos()
+
 
-    n = offset + 0
+@st.cache_resource
+def cargar_cache_respuestas():
+    return CacheRespuestas(CACHE_SOCRATA)
 
-    try:
-        r = _session.get(url, params=payload)
-    except Exception as e:
-        error += 1
-        r = None
 
-    if (r is not None) and (200 <= r.status_code < 300):
-        # r.status_code in [200, 202] podria ser
-        resultados.extend(r.json())
-        params = payload.copy()
+@instrumentar(
+    "socrata.buscar", st.cache_data(show_spinner="Buscando en Socrata API...")
+)
+def buscar_socrata(_session, url, payload, offset=1000, paralelo=False, keyset=False):
+    cache = cargar_cache_respuestas()
 
-        while len(resultados) == n:
-            params.update({"$offset": n})
+    # Por :id y por $offset los registros llegan en otro orden
+    variante = {"keyset": True} if keyset else None
 
-            try:
-                r = _session.get(url, params=params)
-            except Exception as e:
-                error += 1
-                r = None
+    with medir("socrata.cache_disco") as medicion:
+        resultados = cache.leer(url, payload, variante)
+        medicion.cache = "miss" if resultados is None else "hit"
 
-            if (r is not None) and (200 <= r.status_code < 300):
-                resultados.extend(r.json())
-                n += offset
+    if resultados is None:
+        # Un llamado fallido lanza ErrorSocrata, que Streamlit no guarda en cache
+        resultados = paginar_socrata(
+            _session, url, payload, offset, paralelo=paralelo, keyset=keyset
+        )
 
-            else:
-                break
+        cache.guardar(url, payload, resultados, variante)
 
     return resultados
 
 
-@st.cache_data(show_spinner="Creando tabla de resultados...")
-def crear_df_resultados(resultados, na_cols=None, dup_cols=None):
+@instrumentar(
+    "socrata.agregado", st.cache_data(show_spinner="Agregando en Socrata API...")
+)
+def buscar_agregado(_session, url, payload, offset=1000):
+    resultados = buscar_socrata(_session, url, payload, offset)
+
     df = pd.DataFrame.from_records(resultados)
 
-    if na_cols is not None:
-        df = df.dropna(subset=na_cols)
-    if dup_cols is not None:
-        df = df.drop_duplicates(subset=dup_cols)
+    # Socrata retorna sumas y conteos como texto
+    grupos = payload.get("$group", "").split(",")
 
-    if (na_cols is not None) or (dup_cols is not None):
-        df = df.reset_index(drop=True)
+    for col in df.columns.difference(grupos):
+        df[col] = pd.to_numeric(df[col], errors="coerce")
 
     return df
 
 
-@st.cache_data(show_spinner="Cargando archivo requerido...")
+@instrumentar(
+    "socrata.buscar_df", st.cache_data(show_spinner="Buscando en Socrata API...")
+)
+def buscar_df_socrata(
+    _session,
+    url,
+    payload,
+    columnas,
+    offset=1000,
+    paralelo=False,
+    keyset=False,
+    anidados=None,
+    na_cols=None,
+    dup_cols=None,
+    esquema=None,
+):
+    cache = cargar_cache_respuestas()
+
+    # La misma respuesta con otras columnas es otra tabla
+    variante = {"columnas": columnas, "anidados": anidados}
+
+    if keyset:
+        variante["keyset"] = True
+
+    with medir("socrata.cache_disco") as medicion:
+        tabla = cache.leer_tabla(url, payload, variante)
+        medicion.cache = "miss" if tabla is None else "hit"
+
+    if tabla is None:
+        paginas = iterar_socrata(
+            _session, url, payload, offset, paralelo=paralelo, keyset=keyset
+        )
+
+        with medir("tablas.arrow") as medicion:
+            tabla = tabla_desde_paginas(paginas, columnas, anidados)
+            medicion.filas = tabla.num_rows
+
+        cache.guardar_tabla(url, payload, tabla, variante)
+
+    with medir("tablas.dataframe") as medicion:
+        df = depurar_df(df_desde_tabla(tabla), na_cols, dup_cols)
+        df = aplicar_esquema(df, esquema)
+        medicion.filas = len(df)
+
+    return df
+
+
+@instrumentar(
+    "tablas.resultados",
+    st.cache_data(show_spinner="Creando tabla de resultados..."),
+)
+def crear_df_resultados(resultados, na_cols=None, dup_cols=None, esquema=None):
+    df = pd.DataFrame.from_records(resultados)
+
+    df = depurar_df(df, na_cols, dup_cols)
+    df = aplicar_esquema(df, esquema)
+
+    return df
+
+
+@instrumentar(
+    "archivos.cargar", st.cache_data(show_spinner="Cargando archivo requerido...")
+)
 def cargar_df(fp, tipos=None, columnas=None, ordenar=None, ascending=True):
     ruta = Path(fp)
 
@@ -96,6 +276,51 @@ def cargar_df(fp, tipos=None, columnas=None, ordenar=None, ascending=True):
     return df
 
 
+@instrumentar(
+    "archivos.parquet",
+    st.cache_resource(
+        show_spinner="Cargando copia local...", max_entries=MAXIMO_COPIAS_PARQUET
+    ),
+)
+def cargar_parquet(fp, modificado=None):
+    # modificado hace parte de la llave del cache para releer si cambia el archivo.
+    # El DataFrame es compartido por todas las sesiones: no modificarlo
+    df = pd.read_parquet(fp)
+
+    return df
+
+
+@instrumentar(
+    "presupuesto.cargar", st.cache_data(show_spinner="Cargando presupuesto...")
+)
+def cargar_pgn(vigencias, tipo=None, nivel=None, firma=None):
+    # firma hace parte de la llave del cache para releer si cambian los PGN
+    df = leer_pgn(list(vigencias), tipo, nivel)
+
+    return df
+
+
+@instrumentar(
+    "paa.cargar", st.cache_data(show_spinner="Cargando planes de adquisición...")
+)
+def cargar_paa(archivos, firma=None):
+    # firma hace parte de la llave del cache para releer si cambian los planes
+    df = leer_paa(archivos)
+
+    return df
+
+
+@st.cache_resource(
+    show_spinner="Cargando vectores de planes de adquisición...",
+    max_entries=MAXIMO_SELECCIONES_PAA,
+)
+def cargar_vectores_paa(archivos, firma=None):
+    # cache_resource evita copiar la matriz en cada rerun
+    vectores = leer_vectores_paa(archivos)
+
+    return vectores
+
+
 def limpiar_estado(key: str):
     """Elimina contenido de session state
 
@@ -0,0 +1,209 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+import os
+
+import numpy as np
+
+from utils.modelos import cargar_modelo
+
+
+# Tokens por lote, incluido el relleno hasta el texto más largo del lote
+TOKENS_POR_LOTE = 8192
+
+LOTE_MAXIMO = 256
+
+# Textos únicos desde los que se reparte el trabajo entre procesos
+UMBRAL_PROCESOS = 20000
+
+# Textos por tarea enviada a un proceso
+TEXTOS_POR_TAREA = 4096
+
+# Modelo de cada proceso del pool, se carga una vez al iniciar el proceso
+_modelo = None
+
+
+def _iniciar_proceso(model_id: str, backend: str, hilos: int):
+    global _modelo
+
+    _modelo = cargar_modelo(model_id, backend, hilos)
+
+
+def _codificar_lotes(lotes: list) -> list:
+    return [
+        _modelo.encode(lote, batch_size=len(lote), convert_to_numpy=True)
+        for lote in lotes
+    ]
+
+
+def crear_pool(model_id: str, backend: str = "torch", procesos: int = None):
+    """Crea un pool de procesos con una copia del modelo en cada uno
+
+    Los núcleos se reparten entre procesos para no sobresuscribir la CPU.
+
+    Parameters
+    ----------
+    model_id : str
+        ID del modelo en Hugging Face
+    backend : str, optional
+        "torch" u "onnx", default "torch"
+    procesos : int, optional
+        Cantidad de procesos, default None usa un proceso por núcleo
+
+    Returns
+    -------
+    ProcessPoolExecutor
+        Pool para pasar a `codificar_textos`
+    """
+    nucleos = os.cpu_count() or 1
+    procesos = procesos or nucleos
+
+    return ProcessPoolExecutor(
+        max_workers=procesos,
+        mp_context=get_context("spawn"),
+        initializer=_iniciar_proceso,
+        initargs=(model_id, backend, max(1, nucleos // procesos)),
+    )
+
+
+def contar_tokens(modelo, textos: list) -> np.ndarray:
+    """Cantidad de tokens de cada texto después de truncar
+
+    Parameters
+    ----------
+    modelo : SentenceTransformer
+        Modelo cuyo tokenizador se usa
+    textos : list
+        Textos a medir
+
+    Returns
+    -------
+    np.ndarray
+        Tokens de cada texto, incluidos los especiales
+    """
+    tokens = modelo.tokenizer(
+        textos, truncation=True, max_length=modelo.max_seq_length
+    )["input_ids"]
+
+    return np.fromiter(map(len, tokens), dtype=np.int64, count=len(textos))
+
+
+def armar_lotes(
+    longitudes: np.ndarray,
+    tokens_por_lote: int = TOKENS_POR_LOTE,
+    lote_maximo: int = LOTE_MAXIMO,
+) -> list:
+    """Agrupa textos de longitud parecida en lotes de tamaño adaptativo
+
+    Los textos se ordenan de mayor a menor longitud y cada lote toma tantos
+    textos como quepan en `tokens_por_lote` con el relleno de su texto más
+    largo. Los lotes de textos cortos son más grandes.
+
+    Parameters
+    ----------
+    longitudes : np.ndarray
+        Tokens de cada texto
+    tokens_por_lote : int, optional
+        Máximo de tokens por lote, default TOKENS_POR_LOTE
+    lote_maximo : int, optional
+        Máximo de textos por lote, default LOTE_MAXIMO
+
+    Returns
+    -------
+    list[np.ndarray]
+        Posiciones de los textos de cada lote
+    """
+    orden = np.argsort(-longitudes, kind="stable")
+
+    lotes = []
+    inicio = 0
+
+    while inicio < len(orden):
+        largo = max(int(longitudes[orden[inicio]]), 1)
+        tamano = min(lote_maximo, max(1, tokens_por_lote // largo))
+
+        lotes.append(orden[inicio : inicio + tamano])
+        inicio += tamano
+
+    return lotes
+
+
+def codificar_textos(
+    modelo,
+    textos: list,
+    pool: ProcessPoolExecutor = None,
+    tokens_por_lote: int = TOKENS_POR_LOTE,
+    lote_maximo: int = LOTE_MAXIMO,
+) -> np.ndarray:
+    """Calcula vectores sin repetir textos y con lotes por longitud
+
+    Cada texto distinto se codifica una sola vez. Con `pool` y más de
+    UMBRAL_PROCESOS textos distintos, los lotes se reparten entre procesos.
+    Con un cliente del servicio de vectores los textos se envían tal cual,
+    el servicio hace la misma agrupación.
+
+    Parameters
+    ----------
+    modelo : SentenceTransformer | ClienteEmbeddings
+        Modelo para calcular los vectores
+    textos : list
+        Textos a convertir en vectores
+    pool : ProcessPoolExecutor, optional
+        Pool creado con `crear_pool`, default None
+    tokens_por_lote : int, optional
+        Máximo de tokens por lote, default TOKENS_POR_LOTE
+    lote_maximo : int, optional
+        Máximo de textos por lote, default LOTE_MAXIMO
+
+    Returns
+    -------
+    np.ndarray
+        Matriz float32 de forma (len(textos), dim) en el orden recibido
+    """
+    if getattr(modelo, "remoto", False):
+        return modelo.encode(list(textos), convert_to_numpy=True)
+
+    posiciones = {}
+    inversa = np.fromiter(
+        (posiciones.setdefault(t, len(posiciones)) for t in textos), dtype=np.int64
+    )
+    unicos = list(posiciones)
+
+    vectores = np.empty(
+        (len(unicos), modelo.get_sentence_embedding_dimension()), dtype=np.float32
+    )
+
+    if not unicos:
+        return vectores
+
+    lotes = armar_lotes(contar_tokens(modelo, unicos), tokens_por_lote, lote_maximo)
+
+    if pool is not None and len(unicos) >= UMBRAL_PROCESOS:
+        tareas, tarea, n = [], [], 0
+
+        for lote in lotes:
+            tarea.append(lote)
+            n += len(lote)
+
+            if n >= TEXTOS_POR_TAREA:
+                tareas.append(tarea)
+                tarea, n = [], 0
+
+        if tarea:
+            tareas.append(tarea)
+
+        futuros = []
+
+        for tarea in tareas:
+            textos_tarea = [[unicos[i] for i in lote] for lote in tarea]
+            futuros.append((tarea, pool.submit(_codificar_lotes, textos_tarea)))
+
+        for tarea, futuro in futuros:
+            for lote, resultado in zip(tarea, futuro.result()):
+                vectores[lote] = resultado
+    else:
+        for lote in lotes:
+            vectores[lote] = modelo.encode(
+                [unicos[i] for i in lote], batch_size=len(lote), convert_to_numpy=True
+            )
+
+    return vectores[inversa]
@@ -0,0 +1,609 @@
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from itertools import chain, islice
+from pathlib import Path
+from urllib.parse import urlparse
+import threading
+import time
+
+from utils.metricas import medir
+from utils.socrata import payload_keyset
+
+
+# Cantidad máxima de llamados simultáneos a Socrata API. Se mantiene por debajo
+# de las conexiones por host de la sesión para reutilizar conexiones.
+TRABAJADORES = 8
+
+# Registros que guarda en memoria un `DetallesPorId`
+MAXIMO_DETALLES = 50000
+
+# IDs que acepta cada llamado a `precargar`, el resto se ignora. Cada lote de
+# unos 50 IDs consume un llamado del limitador compartido con las consultas.
+MAXIMO_PRECARGA = 100
+
+# Segundos que un registro de `DetallesPorId` se considera vigente
+TTL_DETALLES = 6 * 60 * 60
+
+
+class ErrorSocrata(Exception):
+    """Llamado a Socrata API que falló después de los reintentos de la sesión"""
+
+
+def pedir_pagina(session, url: str, params: dict) -> list:
+    """Realiza un llamado a Socrata API
+
+    Parameters
+    ----------
+    session : requests.Session
+        Sesión con el token de la aplicación
+    url : str
+        URL del recurso a consultar
+    params : dict
+        Payload para enviar a Socrata API
+
+    Returns
+    -------
+    list
+        Registros retornados
+
+    Raises
+    ------
+    ErrorSocrata
+        Si no hay respuesta o no es 2xx
+    """
+    dataset = Path(urlparse(url).path).stem
+
+    with medir("socrata.http", dataset=dataset) as medicion:
+        try:
+            r = session.get(url, params=params)
+        except Exception as e:
+            medicion.error = type(e).__name__
+            raise ErrorSocrata(f"Sin respuesta de {dataset}: {e}") from e
+
+        medicion.bytes = len(r.content)
+
+        if not 200 <= r.status_code < 300:
+            medicion.error = str(r.status_code)
+            raise ErrorSocrata(f"{dataset} respondió {r.status_code}: {r.text[:200]}")
+
+    with medir("socrata.json", dataset=dataset) as medicion:
+        registros = r.json()
+        medicion.filas = len(registros)
+
+    return registros
+
+
+def contar_socrata(session, url: str, payload: dict) -> int | None:
+    """Cuenta registros que cumplen el filtro de un payload
+
+    Parameters
+    ----------
+    session : requests.Session
+        Sesión con el token de la aplicación
+    url : str
+        URL del recurso a consultar
+    payload : dict
+        Payload cuyo `$where` se usa para contar
+
+    Returns
+    -------
+    int | None
+        Cantidad de registros, None si el llamado falla
+    """
+    params = {"$select": "count(*) AS total"}
+
+    for k in ["$where", "$q"]:
+        if k in payload:
+            params.update({k: payload[k]})
+
+    try:
+        resultado = pedir_pagina(session, url, params)
+    except ErrorSocrata:
+        return None
+
+    if not resultado:
+        return None
+
+    return int(resultado[0].get("total", 0))
+
+
+def iterar_secuencial(session, url: str, payload: dict, offset: int = 1000):
+    """Genera páginas una tras otra mientras vengan completas
+
+    Parameters
+    ----------
+    session : requests.Session
+        Sesión con el token de la aplicación
+    url : str
+        URL del recurso a consultar
+    payload : dict
+        Payload para enviar a Socrata API
+    offset : int, optional
+        Cantidad de resultados por llamado, default 1000
+
+    Yields
+    ------
+    list
+        Registros de cada página
+    """
+    params = payload.copy()
+
+    n = 0
+
+    while True:
+        if n:
+            params.update({"$offset": n})
+
+        pagina = pedir_pagina(session, url, params)
+
+        yield pagina
+
+        if len(pagina) < offset:
+            return
+
+        n += offset
+
+
+def iterar_keyset(session, url: str, payload: dict, offset: int = 1000):
+    """Genera páginas filtrando por el último `:id` recibido
+
+    Parameters
+    ----------
+    session : requests.Session
+        Sesión con el token de la aplicación
+    url : str
+        URL del recurso a consultar
+    payload : dict
+        Payload para enviar a Socrata API, ver `payload_keyset`
+    offset : int, optional
+        Cantidad de resultados por llamado, default 1000
+
+    Yields
+    ------
+    list
+        Registros de cada página, ordenados por `:id`
+    """
+    # `:id` se agrega para paginar, se quita si no estaba en la selección
+    quitar_id = "$select" in payload and ":id" not in payload["$select"].split(",")
+
+    ultimo = None
+
+    while True:
+        params = payload_keyset(payload, ultimo)
+        params.update({"$limit": offset})
+
+        pagina = pedir_pagina(session, url, params)
+
+        if not pagina:
+            return
+
+        ultimo = pagina[-1][":id"]
+
+        if quitar_id:
+            for registro in pagina:
+                registro.pop(":id", None)
+
+        yield pagina
+
+        if len(pagina) < offset:
+            return
+
+
+def iterar_paralelo(
+    session,
+    url: str,
+    payload: dict,
+    total: int,
+    offset: int = 1000,
+    trabajadores: int = TRABAJADORES,
+):
+    """Genera en orden las páginas de un total conocido, pidiéndolas en paralelo
+
+    Solo mantiene `trabajadores` llamados en curso, así la memoria no crece
+    con el tamaño de la consulta si quien consume procesa cada página.
+
+    Parameters
+    ----------
+    session : requests.Session
+        Sesión con el token de la aplicación
+    url : str
+        URL del recurso a consultar
+    payload : dict
+        Payload para enviar a Socrata API
+    total : int
+        Cantidad de registros a descargar
+    offset : int, optional
+        Cantidad de resultados por llamado, default 1000
+    trabajadores : int, optional
+        Máximo de llamados simultáneos, default TRABAJADORES
+
+    Yields
+    ------
+    list
+        Registros de cada página, en el mismo orden de la paginación secuencial
+    """
+    if total <= 0:
+        return
+
+    base = payload.copy()
+    base.update({"$limit": offset})
+
+    # Sin orden explícito Socrata no garantiza páginas disjuntas
+    if "$order" not in base:
+        base.update({"$order": ":id"})
+
+    lotes = ({**base, "$offset": n} for n in range(0, total, offset))
+
+    with ThreadPoolExecutor(max_workers=trabajadores) as executor:
+        pendientes = deque(
+            executor.submit(pedir_pagina, session, url, p)
+            for p in islice(lotes, trabajadores)
+        )
+
+        while pendientes:
+            try:
+                pagina = pendientes.popleft().result()
+            except ErrorSocrata:
+                # Una página fallida invalida la consulta, no se retorna a medias
+                for futuro in pendientes:
+                    futuro.cancel()
+                raise
+
+            siguiente = next(lotes, None)
+
+            if siguiente is not None:
+                pendientes.append(
+                    executor.submit(pedir_pagina, session, url, siguiente)
+                )
+
+            yield pagina
+
+
+def iterar_socrata(
+    session,
+    url: str,
+    payload: dict,
+    offset: int = 1000,
+    paralelo: bool = False,
+    trabajadores: int = TRABAJADORES,
+    keyset: bool = False,
+):
+    """Genera las páginas de una consulta a Socrata API
+
+    Parameters
+    ----------
+    session : requests.Session
+        Sesión con el token de la aplicación
+    url : str
+        URL del recurso a consultar
+    payload : dict
+        Payload para enviar a Socrata API
+    offset : int, optional
+        Cantidad de resultados por llamado, default 1000
+    paralelo : bool, optional
+        Contar primero y pedir las páginas en paralelo, default False
+    trabajadores : int, optional
+        Máximo de llamados simultáneos en modo paralelo, default TRABAJADORES
+    keyset : bool, optional
+        Paginar por `:id` en vez de `$offset`, excluye `paralelo` y un
+        `$order` propio, default False
+
+    Yields
+    ------
+    list
+        Registros de cada página
+
+    Raises
+    ------
+    ErrorSocrata
+        Si falla alguna página, en vez de retornar resultados incompletos
+    ValueError
+        Si se combina `keyset` con `paralelo` o con otro `$order`
+    """
+    if keyset and paralelo:
+        raise ValueError("keyset y paralelo no se pueden usar juntos")
+
+    if keyset:
+        yield from iterar_keyset(session, url, payload, offset)
+        return
+
+    if paralelo:
+        total = contar_socrata(session, url, payload)
+
+        if total is not None:
+            yield from iterar_paralelo(
+                session, url, payload, total, offset, trabajadores
+            )
+            return
+
+    yield from iterar_secuencial(session, url, payload, offset)
+
+
+def paginar_paralelo(
+    session,
+    url: str,
+    payload: dict,
+    total: int,
+    offset: int = 1000,
+    trabajadores: int = TRABAJADORES,
+) -> list:
+    """Descarga en paralelo todas las páginas de un total conocido
+
+    Parameters
+    ----------
+    session : requests.Session
+        Sesión con el token de la aplicación
+    url : str
+        URL del recurso a consultar
+    payload : dict
+        Payload para enviar a Socrata API
+    total : int
+        Cantidad de registros a descargar
+    offset : int, optional
+        Cantidad de resultados por llamado, default 1000
+    trabajadores : int, optional
+        Máximo de llamados simultáneos, default TRABAJADORES
+
+    Returns
+    -------
+    list
+        Registros encontrados, en el mismo orden de la paginación secuencial
+    """
+    paginas = iterar_paralelo(session, url, payload, total, offset, trabajadores)
+
+    return list(chain.from_iterable(paginas))
+
+
+def paginar_socrata(
+    session,
+    url: str,
+    payload: dict,
+    offset: int = 1000,
+    paralelo: bool = False,
+    trabajadores: int = TRABAJADORES,
+    keyset: bool = False,
+) -> list:
+    """Descarga todos los registros de una consulta a Socrata API
+
+    Parameters
+    ----------
+    session : requests.Session
+        Sesión con el token de la aplicación
+    url : str
+        URL del recurso a consultar
+    payload : dict
+        Payload para enviar a Socrata API
+    offset : int, optional
+        Cantidad de resultados por llamado, default 1000
+    paralelo : bool, optional
+        Contar primero y descargar las páginas en paralelo, default False
+    trabajadores : int, optional
+        Máximo de llamados simultáneos en modo paralelo, default TRABAJADORES
+    keyset : bool, optional
+        Paginar por `:id` en vez de `$offset`, excluye `paralelo`, default False
+
+    Returns
+    -------
+    list
+        Registros encontrados
+
+    Raises
+    ------
+    ErrorSocrata
+        Si falla alguna página, en vez de retornar resultados incompletos
+    """
+    paginas = iterar_socrata(
+        session, url, payload, offset, paralelo, trabajadores, keyset
+    )
+
+    return list(chain.from_iterable(paginas))
+
+
+class DetallesPorId:
+    """Búsqueda por lotes de registros de Socrata a partir de su ID
+
+    Resuelve muchos IDs con pocos llamados `in (...)` en paralelo y guarda
+    los registros en memoria por `ttl` segundos. `precargar` pide en segundo
+    plano unos pocos IDs; si un ID ya se está pidiendo, `obtener` espera ese
+    mismo llamado, y si sigue en cola lo saca de la precarga y lo pide de
+    inmediato.
+
+    Parameters
+    ----------
+    session : requests.Session
+        Sesión con el token de la aplicación
+    url : str
+        URL del recurso a consultar
+    campo : str
+        Columna con el ID de cada registro
+    crear_payload : Callable[[list], dict]
+        Función que arma el payload de un lote de IDs
+    lotes : Callable[[Iterable], list]
+        Función que parte los IDs en lotes que caben en una URL
+    trabajadores : int, optional
+        Máximo de llamados simultáneos, default TRABAJADORES
+    maximo : int, optional
+        Registros en memoria, los más antiguos se descartan, default
+        MAXIMO_DETALLES
+    ttl : float, optional
+        Segundos de vigencia de cada registro, default TTL_DETALLES
+    maximo_precarga : int, optional
+        IDs que acepta cada llamado a `precargar`, default MAXIMO_PRECARGA
+    """
+
+    def __init__(
+        self,
+        session,
+        url: str,
+        campo: str,
+        crear_payload,
+        lotes,
+        trabajadores: int = TRABAJADORES,
+        maximo: int = MAXIMO_DETALLES,
+        ttl: float = TTL_DETALLES,
+        maximo_precarga: int = MAXIMO_PRECARGA,
+    ):
+        self.session = session
+        self.url = url
+        self.campo = campo
+        self.crear_payload = crear_payload
+        self.lotes = lotes
+        self.trabajadores = trabajadores
+        self.maximo = maximo
+        self.ttl = ttl
+        self.maximo_precarga = maximo_precarga
+
+        # {id: (momento de llegada, registro)}
+        self._registros = OrderedDict()
+        self._pendientes = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=trabajadores)
+
+    def _pedir_lote(self, ids: list, liberar: bool = True):
+        try:
+            registros = paginar_socrata(self.session, self.url, self.crear_payload(ids))
+        finally:
+            # IDs sin registro o de un llamado fallido se pueden volver a pedir
+            if liberar:
+                with self._lock:
+                    for i in ids:
+                        self._pendientes.pop(i, None)
+
+        llegada = time.monotonic()
+
+        with self._lock:
+            for registro in registros:
+                self._registros[registro.get(self.campo)] = (llegada, registro)
+                self._registros.move_to_end(registro.get(self.campo))
+
+            while len(self._registros) > self.maximo:
+                self._registros.popitem(last=False)
+
+    def _vigente(self, i) -> bool:
+        # Llamar con el lock tomado; descarta el registro si ya venció
+        if i not in self._registros:
+            return False
+
+        if time.monotonic() - self._registros[i][0] <= self.ttl:
+            return True
+
+        del self._registros[i]
+
+        return False
+
+    def _encolar(self, ids: list):
+        # Llamar con el lock tomado
+        for lote in self.lotes(ids):
+            futuro = self._executor.submit(self._pedir_lote, lote)
+
+            for i in lote:
+                self._pendientes[i] = futuro
+
+    def precargar(self, ids):
+        """Pide en segundo plano los IDs que aún no están en memoria
+
+        Solo considera los primeros `maximo_precarga` IDs, como las filas
+        visibles de una tabla.
+
+        Parameters
+        ----------
+        ids : Iterable[str]
+            IDs a precargar, en orden de prioridad
+        """
+        ids = list(islice(dict.fromkeys(ids), self.maximo_precarga))
+
+        with self._lock:
+            faltantes = [
+                i for i in ids if not self._vigente(i) and i not in self._pendientes
+            ]
+
+            self._encolar(faltantes)
+
+    def obtener(self, ids) -> dict:
+        """Retorna los registros de unos IDs, pidiendo solo los faltantes
+
+        Espera los llamados de precarga que ya están en curso. Los IDs que
+        siguen en cola detrás de una precarga se sacan de ella y se piden de
+        inmediato; el resto de su lote vuelve a la cola. Mientras se piden,
+        los faltantes quedan pendientes para que otras llamadas no los repitan.
+
+        Parameters
+        ----------
+        ids : Iterable[str]
+            IDs a buscar
+
+        Returns
+        -------
+        dict
+            Diccionario {id: registro} solo con los IDs encontrados
+
+        Raises
+        ------
+        ErrorSocrata
+            Si falla el llamado de alguno de los lotes
+        """
+        ids = list(dict.fromkeys(ids))
+
+        with self._lock:
+            en_curso, faltantes, cancelados = set(), [], set()
+
+            for i in ids:
+                futuro = self._pendientes.get(i)
+
+                if futuro is not None and futuro not in cancelados:
+                    if futuro.cancel():
+                        cancelados.add(futuro)
+                    else:
+                        en_curso.add(futuro)
+                        continue
+
+                if futuro is not None or not self._vigente(i):
+                    faltantes.append(i)
+
+            # Los IDs de lotes cancelados que no se piden aquí vuelven a la cola
+            solicitados = set(faltantes)
+            devueltos = [
+                i
+                for i, futuro in self._pendientes.items()
+                if futuro in cancelados and i not in solicitados
+            ]
+
+            # Los faltantes quedan pendientes mientras se piden, así una
+            # precarga u otra sesión espera este llamado en vez de repetirlo
+            propio = Future()
+            propio.set_running_or_notify_cancel()
+
+            for i in solicitados:
+                self._pendientes[i] = propio
+
+            self._encolar(devueltos)
+
+        lotes = self.lotes(faltantes)
+
+        try:
+            if len(lotes) == 1:
+                self._pedir_lote(lotes[0], liberar=False)
+            elif lotes:
+                with ThreadPoolExecutor(max_workers=self.trabajadores) as executor:
+                    list(
+                        executor.map(
+                            lambda lote: self._pedir_lote(lote, liberar=False), lotes
+                        )
+                    )
+        except BaseException as e:
+            propio.set_exception(e)
+            raise
+        else:
+            propio.set_result(None)
+        finally:
+            with self._lock:
+                for i in solicitados:
+                    if self._pendientes.get(i) is propio:
+                        del self._pendientes[i]
+
+        for futuro in wait(en_curso).done:
+            # Propaga el ErrorSocrata de una precarga fallida
+            futuro.result()
+
+        with self._lock:
+            return {i: self._registros[i][1] for i in ids if i in self._registros}
@@ -0,0 +1,326 @@
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from data.rutas import ENTIDADES, SECTORES_NACIONAL, SECTORES_TERRITORIAL
+from utils.helpers import normalizar_nit, normalizar_nombre
+from utils.variables import COLS_ENTIDADES
+
+
+# Pesos de la DIAN para el dígito de verificación, del último dígito al primero
+PESOS_DV = [3, 7, 13, 17, 19, 23, 29, 37, 41, 43, 47, 53, 59, 67, 71]
+
+# Similitud mínima (coeficiente de Dice sobre trigramas) para aceptar un nombre
+UMBRAL_DIFUSO = 0.7
+
+# Sectores sin información en el universo de entidades
+SIN_SECTOR = {"NO APLICA"}
+
+
+def digito_verificacion(nit: str) -> str:
+    """Calcula el dígito de verificación de un NIT
+
+    Parameters
+    ----------
+    nit : str
+        NIT solo con dígitos, sin dígito de verificación
+
+    Returns
+    -------
+    str
+        Dígito de verificación
+    """
+    suma = sum(int(d) * p for d, p in zip(reversed(nit), PESOS_DV))
+    residuo = suma % 11
+
+    return str(residuo if residuo < 2 else 11 - residuo)
+
+
+def sin_verificacion(nit: str) -> str | None:
+    """Quita el último dígito de un NIT si es su dígito de verificación
+
+    Parameters
+    ----------
+    nit : str
+        NIT solo con dígitos
+
+    Returns
+    -------
+    str | None
+        NIT sin dígito de verificación, None si el último dígito no lo es
+    """
+    if len(nit) < 9 or digito_verificacion(nit[:-1]) != nit[-1]:
+        return None
+
+    return nit[:-1]
+
+
+def trigramas(texto: str) -> set:
+    """Trigramas de un nombre normalizado, con bordes de palabra
+
+    Parameters
+    ----------
+    texto : str
+        Nombre normalizado
+
+    Returns
+    -------
+    set
+        Trigramas del texto
+    """
+    texto = f"  {texto} "
+
+    return {texto[i : i + 3] for i in range(len(texto) - 2)}
+
+
+def cargar_universo() -> pd.DataFrame:
+    """Une el universo de entidades con los listados de sectores
+
+    Las entidades del universo tienen prioridad. Los listados de sectores
+    completan el sector cuando el universo no lo tiene y agregan las entidades
+    que no aparecen en él.
+
+    Returns
+    -------
+    pd.DataFrame
+        Entidades con columnas COLS_ENTIDADES
+    """
+    df = pd.read_csv(ENTIDADES, encoding="utf-8-sig", dtype=str, usecols=COLS_ENTIDADES)
+    df = df.replace({"NULL": pd.NA})
+
+    sectores = []
+
+    for ruta, orden in [
+        (SECTORES_NACIONAL, "NACIONAL"),
+        (SECTORES_TERRITORIAL, "TERRITORIAL"),
+    ]:
+        df_sector = pd.read_csv(ruta, encoding="utf-8", dtype=str)
+        df_sector = df_sector.rename(
+            {"nombre_entidad": "NOMBRE", "nit_entidad": "CCB_NIT_INST"}, axis=1
+        )
+        df_sector["ORDEN"] = orden
+        df_sector["SECTOR"] = df_sector.pop("sector")
+        sectores.append(df_sector[COLS_ENTIDADES])
+
+    df_sectores = pd.concat(sectores, ignore_index=True)
+    df_sectores["nit"] = normalizar_nit(df_sectores["CCB_NIT_INST"])
+    df_sectores = df_sectores.dropna(subset=["nit"]).drop_duplicates("nit")
+
+    df["nit"] = normalizar_nit(df["CCB_NIT_INST"])
+
+    sector = df["nit"].map(df_sectores.set_index("nit")["SECTOR"])
+    sin_sector = df["SECTOR"].isna() | df["SECTOR"].isin(SIN_SECTOR)
+    df["SECTOR"] = df["SECTOR"].mask(sin_sector & sector.notna(), sector)
+
+    nuevas = df_sectores[~df_sectores["nit"].isin(df["nit"].dropna())]
+
+    df = pd.concat([df, nuevas], ignore_index=True)
+
+    return df[COLS_ENTIDADES].astype("string")
+
+
+class IndiceEntidades:
+    """Índice para identificar entidades por NIT o nombre
+
+    Tiene diccionarios de NIT, con y sin dígito de verificación, y de nombre
+    normalizado. Los nombres que no coinciden exactamente se buscan por
+    trigramas.
+
+    Parameters
+    ----------
+    entidades : pd.DataFrame
+        Entidades con columnas COLS_ENTIDADES, ver `cargar_universo`
+    """
+
+    def __init__(self, entidades: pd.DataFrame):
+        self.entidades = entidades.reset_index(drop=True)
+
+        nits = normalizar_nit(self.entidades["CCB_NIT_INST"])
+        nombres = normalizar_nombre(self.entidades["NOMBRE"])
+
+        self.por_nit = {}
+        self.por_nombre = {}
+
+        # setdefault deja la primera entidad ante claves repetidas
+        for i, nit in nits.dropna().items():
+            self.por_nit.setdefault(nit, i)
+
+        for i, nit in nits.dropna().items():
+            base = sin_verificacion(nit)
+
+            if base is not None:
+                self.por_nit.setdefault(base, i)
+
+        for i, nombre in nombres.dropna().items():
+            if nombre:
+                self.por_nombre.setdefault(nombre, i)
+
+        self.nombres = list(self.por_nombre)
+        self.posiciones = np.fromiter(self.por_nombre.values(), dtype=np.int64)
+        self.n_trigramas = np.empty(len(self.nombres), dtype=np.int64)
+
+        postings = defaultdict(list)
+
+        for j, nombre in enumerate(self.nombres):
+            grams = trigramas(nombre)
+            self.n_trigramas[j] = len(grams)
+
+            for g in grams:
+                postings[g].append(j)
+
+        self.postings = {g: np.array(js, dtype=np.int64) for g, js in postings.items()}
+
+    @classmethod
+    def desde_archivos(cls):
+        """Construye el índice con el universo de entidades y los sectores
+
+        Returns
+        -------
+        IndiceEntidades
+            Índice listo para `resolver`
+        """
+        return cls(cargar_universo())
+
+    def buscar_difuso(self, nombre: str, umbral: float = UMBRAL_DIFUSO) -> int:
+        """Entidad con el nombre más parecido según trigramas
+
+        Parameters
+        ----------
+        nombre : str
+            Nombre normalizado
+        umbral : float, optional
+            Similitud mínima, default UMBRAL_DIFUSO
+
+        Returns
+        -------
+        int
+            Posición de la entidad, -1 si ninguna supera el umbral
+        """
+        grams = trigramas(nombre)
+        listas = [self.postings[g] for g in grams if g in self.postings]
+
+        if not listas:
+            return -1
+
+        comunes = np.bincount(np.concatenate(listas), minlength=len(self.nombres))
+        dice = 2 * comunes / (len(grams) + self.n_trigramas)
+
+        j = int(np.argmax(dice))
+
+        return int(self.posiciones[j]) if dice[j] >= umbral else -1
+
+    def resolver(
+        self,
+        nits: pd.Series = None,
+        nombres: pd.Series = None,
+        difuso: bool = True,
+    ) -> pd.DataFrame:
+        """Identifica las entidades de una serie de NIT y/o nombres
+
+        Cada valor distinto se busca una sola vez: primero por NIT, luego por
+        nombre exacto y al final por nombre parecido.
+
+        Parameters
+        ----------
+        nits : pd.Series, optional
+            NIT a buscar, default None
+        nombres : pd.Series, optional
+            Nombres a buscar, con el mismo índice de `nits`, default None
+        difuso : bool, optional
+            Buscar por trigramas los nombres sin coincidencia, default True
+
+        Returns
+        -------
+        pd.DataFrame
+            COLS_ENTIDADES y `coincidencia` (nit, nombre o difuso), con el
+            índice recibido
+        """
+        indice = (nits if nits is not None else nombres).index
+
+        # Posiciones 0..n-1 para que un índice con repetidos no afecte
+        if nits is not None:
+            nits = nits.reset_index(drop=True)
+
+        if nombres is not None:
+            nombres = nombres.reset_index(drop=True)
+
+        posicion = pd.Series(-1, index=range(len(indice)), dtype=np.int64)
+        coincidencia = pd.Series(pd.NA, index=posicion.index, dtype="string")
+
+        if nits is not None:
+            claves = normalizar_nit(nits)
+            encontrado = claves.map(self.por_nit)
+
+            # NIT con dígito de verificación contra entidades registradas sin él
+            faltan = encontrado.isna() & claves.notna()
+            bases = claves[faltan].map(
+                {c: sin_verificacion(c) for c in claves[faltan].unique()}
+            )
+            encontrado[faltan] = bases.map(self.por_nit)
+
+            hallados = encontrado.notna()
+            posicion[hallados] = encontrado[hallados].astype(np.int64)
+            coincidencia[hallados] = "nit"
+
+        if nombres is not None:
+            faltan = posicion < 0
+            claves = normalizar_nombre(nombres[faltan])
+
+            encontrado = claves.map(self.por_nombre)
+            hallados = encontrado.notna()
+
+            posicion[hallados[hallados].index] = encontrado[hallados].astype(np.int64)
+            coincidencia[hallados[hallados].index] = "nombre"
+
+            if difuso:
+                pendientes = claves[~hallados].dropna()
+                pendientes = pendientes[pendientes != ""]
+
+                parecidos = {c: self.buscar_difuso(c) for c in pendientes.unique()}
+                encontrado = pendientes.map(parecidos)
+                hallados = encontrado[encontrado >= 0]
+
+                posicion[hallados.index] = hallados.astype(np.int64)
+                coincidencia[hallados.index] = "difuso"
+
+        hallados = posicion >= 0
+
+        df = pd.DataFrame(index=posicion.index, columns=COLS_ENTIDADES, dtype="string")
+        df.loc[hallados, COLS_ENTIDADES] = self.entidades.loc[
+            posicion[hallados].to_numpy(), COLS_ENTIDADES
+        ].to_numpy()
+        df["coincidencia"] = coincidencia
+
+        return df.set_axis(indice)
+
+    def enriquecer(
+        self, df: pd.DataFrame, col_nit: str = None, col_nombre: str = None
+    ) -> pd.DataFrame:
+        """Agrega a un DataFrame las columnas de su entidad
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            Registros a enriquecer
+        col_nit : str, optional
+            Columna con el NIT de la entidad, default None
+        col_nombre : str, optional
+            Columna con el nombre de la entidad, default None
+
+        Returns
+        -------
+        pd.DataFrame
+            Copia de `df` con COLS_ENTIDADES, sin repetir columnas existentes
+        """
+        entidades = self.resolver(
+            nits=df[col_nit] if col_nit else None,
+            nombres=df[col_nombre] if col_nombre else None,
+        )
+
+        nuevas = [c for c in COLS_ENTIDADES if c not in df.columns]
+
+        df = df.copy()
+        df[nuevas] = entidades[nuevas].to_numpy()
+
+        return df
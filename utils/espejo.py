@@ -0,0 +1,283 @@
+from datetime import date, timedelta
+from pathlib import Path
+import json
+import os
+
+import pandas as pd
+
+from data.rutas import ESPEJO_PROCESOS, MARCA_PROCESOS
+from utils.consultas import contar_socrata, iterar_keyset
+from utils.helpers import ruta_temporal, validar_fechas
+from utils.tablas import df_desde_tabla, tabla_desde_paginas
+from utils.variables import URL_PROCESOS, COLS_PROCESOS, ANIDADOS_PROCESOS
+
+
+# Días a descargar cuando la copia local aún no existe
+DIAS_INICIALES = 90
+
+COL_ACTUALIZADO = ":updated_at"
+COL_PUBLICADO = "fecha_de_publicacion_del"
+COL_ID = "id_del_proceso"
+
+
+def leer_marca(ruta=MARCA_PROCESOS) -> dict:
+    """Lee la marca de agua de la última sincronización
+
+    Parameters
+    ----------
+    ruta : str | Path, optional
+        Archivo JSON de la marca, default MARCA_PROCESOS
+
+    Returns
+    -------
+    dict
+        Diccionario con las llaves COL_ACTUALIZADO, COL_PUBLICADO y "desde",
+        vacío si no se ha sincronizado
+    """
+    ruta = Path(ruta)
+
+    if not ruta.exists():
+        return {}
+
+    return json.loads(ruta.read_text(encoding="utf-8"))
+
+
+def cobertura_espejo(ruta_marca=MARCA_PROCESOS) -> tuple[date] | None:
+    """Fechas de publicación que la copia local tiene completas
+
+    Parameters
+    ----------
+    ruta_marca : str | Path, optional
+        Archivo JSON de la marca de agua, default MARCA_PROCESOS
+
+    Returns
+    -------
+    tuple[date] | None
+        Fecha inicial de la sincronización y fecha de la marca de agua, None
+        si no se ha completado una sincronización o no se sabe desde cuándo
+    """
+    marca = leer_marca(ruta_marca)
+
+    if not marca.get("desde") or not marca.get(COL_PUBLICADO):
+        return None
+
+    return (
+        date.fromisoformat(marca["desde"]),
+        date.fromisoformat(marca[COL_PUBLICADO][:10]),
+    )
+
+
+def payload_sincronizacion(marca: dict, desde: date = None, offset: int = 1000):
+    """Payload para traer procesos nuevos o modificados desde una marca
+
+    Parameters
+    ----------
+    marca : dict
+        Marca de agua de la última sincronización
+    desde : date, optional
+        Fecha de publicación inicial si no hay marca, default None
+    offset : int, optional
+        Cantidad de resultados por llamado, default 1000
+
+    Returns
+    -------
+    dict
+        Payload para enviar a Socrata API
+    """
+    columnas = [COL_ACTUALIZADO] + COLS_PROCESOS
+
+    payload = {"$limit": offset, "$select": ",".join(columnas), "$order": ":id"}
+
+    if marca:
+        # Inclusivo: registros del mismo segundo que la marca pudieron llegar
+        # después de la última descarga; repetirlos no cambia la copia local
+        where_query = (
+            f"{COL_ACTUALIZADO} >= '{marca[COL_ACTUALIZADO]}'"
+            f" OR {COL_PUBLICADO} >= '{marca[COL_PUBLICADO]}'"
+        )
+    else:
+        if desde is None:
+            desde = date.today() - timedelta(days=DIAS_INICIALES)
+
+        where_query = f"{COL_PUBLICADO} >= '{desde.strftime('%Y-%m-%d')}T00:00:00'"
+
+    payload.update({"$where": where_query})
+
+    return payload
+
+
+def sincronizar_procesos(
+    session,
+    desde: date = None,
+    offset: int = 1000,
+    ruta=ESPEJO_PROCESOS,
+    ruta_marca=MARCA_PROCESOS,
+) -> int:
+    """Actualiza la copia local de SECOP II - Procesos de Contratación
+
+    Trae los registros desde la marca de agua, incluida, y los inserta o
+    reemplaza por `id_del_proceso`. La marca avanza solo si se descargaron
+    todos los registros contados, para no saltarse cambios en un fallo.
+
+    Parameters
+    ----------
+    session : requests.Session
+        Sesión con el token de la aplicación
+    desde : date, optional
+        Fecha de publicación inicial si no hay copia local, default None
+    offset : int, optional
+        Cantidad de resultados por llamado, default 1000
+    ruta : str | Path, optional
+        Archivo Parquet de la copia local, default ESPEJO_PROCESOS
+    ruta_marca : str | Path, optional
+        Archivo JSON de la marca de agua, default MARCA_PROCESOS
+
+    Returns
+    -------
+    int
+        Cantidad de registros nuevos o modificados
+    """
+    ruta, ruta_marca = Path(ruta), Path(ruta_marca)
+
+    marca = leer_marca(ruta_marca)
+
+    if not marca:
+        desde = desde or date.today() - timedelta(days=DIAS_INICIALES)
+
+    payload = payload_sincronizacion(marca, desde, offset)
+
+    total = contar_socrata(session, URL_PROCESOS, payload)
+
+    if not total:
+        return 0
+
+    columnas = [COL_ACTUALIZADO] + COLS_PROCESOS
+
+    # Por `:id`: las páginas profundas no se degradan y no se corren si se
+    # publican procesos durante la descarga
+    paginas = iterar_keyset(session, URL_PROCESOS, payload, offset)
+    tabla = tabla_desde_paginas(paginas, columnas, ANIDADOS_PROCESOS)
+
+    n = tabla.num_rows
+
+    if not n:
+        return 0
+
+    df_nuevos = df_desde_tabla(tabla)
+
+    if ruta.exists():
+        df_espejo = pd.concat([pd.read_parquet(ruta), df_nuevos], ignore_index=True)
+    else:
+        df_espejo = df_nuevos
+
+    df_espejo = df_espejo.drop_duplicates(subset=[COL_ID], keep="last")
+    df_espejo = df_espejo.reset_index(drop=True)
+
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+
+    temporal = ruta_temporal(ruta)
+    df_espejo.to_parquet(temporal, index=False)
+    temporal.replace(ruta)
+
+    if n >= total:
+        marca = {
+            COL_ACTUALIZADO: df_espejo[COL_ACTUALIZADO].max(),
+            COL_PUBLICADO: df_espejo[COL_PUBLICADO].max(),
+            # Inicio de la primera sincronización completa, no cambia después
+            "desde": marca.get("desde") if marca else desde.isoformat(),
+        }
+        temporal = ruta_temporal(ruta_marca)
+        temporal.write_text(json.dumps(marca), encoding="utf-8")
+        temporal.replace(ruta_marca)
+
+    return n
+
+
+def filtrar_procesos(
+    df: pd.DataFrame,
+    fechas: tuple[date] | date = None,
+    precio_minimo: int = 0,
+    orden: str = None,
+    entidades: list | set = None,
+    id_proceso: str = None,
+    sort: str = None,
+) -> pd.DataFrame:
+    """Aplica sobre la copia local los filtros de `payload_procesos`
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Copia local de procesos
+    fechas : tuple[date] | date, optional
+        Fechas inicial y final de búsqueda, default None
+    precio_minimo : int, optional
+        Precio mínimo de proceso de contratación, default 0
+    orden : str, optional
+        Entidad de orden Nacional o Territorial, default None
+    entidades : list | set, optional
+        Filtro de entidades a buscar, default None
+    id_proceso : str, optional
+        ID de proceso a buscar, default None
+    sort : str, optional
+        Campo a usar para ordenar, con sufijo DESC opcional, default None
+
+    Returns
+    -------
+    pd.DataFrame
+        Procesos que cumplen los filtros, solo con COLS_PROCESOS
+    """
+    filtro = pd.Series(True, index=df.index)
+
+    if fechas is not None:
+        inicio, fin = validar_fechas(fechas)
+
+        inicial = f'{inicio.strftime("%Y-%m-%d")}T00:00:00'
+        final = f'{fin.strftime("%Y-%m-%d")}T23:59:59'
+
+        # Fechas ISO 8601 comparables como texto
+        publicado = df[COL_PUBLICADO].fillna("").str.slice(0, 19)
+        filtro &= publicado.between(inicial, final)
+
+    if precio_minimo > 0:
+        filtro &= pd.to_numeric(df["precio_base"], errors="coerce") > precio_minimo
+
+    if orden is not None:
+        filtro &= df["ordenentidad"] == orden
+
+    if entidades is not None:
+        filtro &= df["entidad"].isin(entidades)
+
+    if id_proceso is not None:
+        filtro &= df[COL_ID] == id_proceso
+
+    resultado = df.loc[filtro, [c for c in COLS_PROCESOS if c in df.columns]]
+
+    if sort is not None:
+        campo, *sentido = sort.split()
+        ascending = not (sentido and sentido[0].upper() == "DESC")
+        resultado = resultado.sort_values(by=campo, ascending=ascending)
+
+    return resultado.reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from utils.sesion import SesionSocrata
+
+    parser = argparse.ArgumentParser(
+        description="Sincroniza la copia local de SECOP II - Procesos"
+    )
+    parser.add_argument(
+        "--desde",
+        type=date.fromisoformat,
+        default=None,
+        help="Fecha inicial (AAAA-MM-DD) si aún no existe copia local",
+    )
+    args = parser.parse_args()
+
+    session = SesionSocrata(os.environ["X_APP_TOKEN"])
+
+    n = sincronizar_procesos(session, desde=args.desde)
+
+    print(f"{n} procesos nuevos o modificados.")
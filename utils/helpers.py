@@ -1,5 +1,8 @@
 from datetime import date, timedelta
+from pathlib import Path
+import uuid
 
+import numpy as np
 import pandas as pd
 
 
@@ -28,6 +31,68 @@ def normalizar_textual(df: pd.DataFrame, col: str) -> pd.Series:
     return normalizada
 
 
+def normalizar_nombre(nombres: pd.Series) -> pd.Series:
+    """Normaliza nombres para compararlos sin tildes, mayúsculas ni signos
+
+    Parameters
+    ----------
+    nombres : pd.Series
+        Nombres a normalizar
+
+    Returns
+    -------
+    pd.Series
+        Nombres en mayúscula, solo letras, dígitos y un espacio entre palabras
+    """
+    normalizados = normalizar_textual(nombres.astype("string").to_frame("n"), "n")
+
+    normalizados = (
+        normalizados.str.upper().str.replace(r"[^A-Z0-9]+", " ", regex=True).str.strip()
+    )
+
+    return normalizados
+
+
+def normalizar_nit(nits: pd.Series) -> pd.Series:
+    """Deja solo los dígitos de una serie de NIT
+
+    Parameters
+    ----------
+    nits : pd.Series
+        NIT como texto o número, con puntos, guiones o espacios
+
+    Returns
+    -------
+    pd.Series
+        NIT solo con dígitos, NA si no tiene ninguno
+    """
+    digitos = nits.astype("string").str.replace(r"\.0$", "", regex=True)
+    digitos = digitos.str.replace(r"\D", "", regex=True)
+
+    return digitos.mask(digitos == "")
+
+
+def ruta_temporal(destino) -> Path:
+    """Archivo temporal único junto a un destino, para reemplazarlo de una vez
+
+    Las sesiones de Streamlit son hilos del mismo proceso, así que el PID no
+    basta para separar sus archivos temporales.
+
+    Parameters
+    ----------
+    destino : str | Path
+        Archivo que se va a reemplazar
+
+    Returns
+    -------
+    Path
+        Ruta oculta en la misma carpeta, con sufijo .tmp
+    """
+    destino = Path(destino)
+
+    return destino.with_name(f".{destino.name}.{uuid.uuid4().hex}.tmp")
+
+
 def validar_fechas(fechas: tuple | date = None) -> tuple[date]:
     """Comprueba retorno de fechas inicial y final
 
@@ -58,3 +123,54 @@ def validar_fechas(fechas: tuple | date = None) -> tuple[date]:
         inicio = fin - timedelta(days=1)
 
     return (inicio, fin)
+
+
+def mascara_procesos(
+    df: pd.DataFrame,
+    entidades: list | set = None,
+    precio: tuple = None,
+    modalidades: list | set = None,
+    fechas: tuple[date] | date = None,
+) -> np.ndarray:
+    """Filas de un DataFrame de procesos que cumplen los filtros
+
+    Sirve para buscar en un subconjunto del corpus sin volver a calcular sus
+    vectores, ver `buscar_similares`.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Procesos con ESQUEMA_PROCESOS, en el mismo orden del corpus
+    entidades : list | set, optional
+        Entidades a considerar, default None para todas
+    precio : tuple, optional
+        Precio base mínimo y máximo, incluidos, default None
+    modalidades : list | set, optional
+        Modalidades de contratación a considerar, default None para todas
+    fechas : tuple[date] | date, optional
+        Fechas inicial y final de publicación, default None
+
+    Returns
+    -------
+    np.ndarray
+        Máscara booleana con una posición por fila de `df`
+    """
+    filtro = np.ones(len(df), dtype=bool)
+
+    if entidades:
+        filtro &= df["entidad"].isin(entidades).to_numpy()
+
+    if precio is not None:
+        minimo, maximo = precio
+        filtro &= df["precio_base"].between(minimo, maximo).to_numpy()
+
+    if modalidades:
+        filtro &= df["modalidad_de_contratacion"].isin(modalidades).to_numpy()
+
+    if fechas is not None:
+        inicio, fin = validar_fechas(fechas)
+
+        publicado = df["fecha_de_publicacion_del"].dt.normalize()
+        filtro &= publicado.between(pd.Timestamp(inicio), pd.Timestamp(fin)).to_numpy()
+
+    return filtro
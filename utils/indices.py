@@ -0,0 +1,595 @@
+from pathlib import Path
+import threading
+
+import numpy as np
+
+from utils.vectores import VectoresCompactos, puntuar_compacto
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+
+# Por debajo de esta cantidad de vectores la búsqueda exacta es más rápida
+UMBRAL_ANN = 20000
+
+# Listas a revisar por consulta en el índice IVF
+NPROBE = 16
+
+# Vectores por bloque al leer la matriz del almacén
+BLOQUE = 65536
+
+# Candidatos a pedir al índice por cada resultado, antes de filtrar por corpus
+SOBREMUESTREO = 4
+
+# Sobre esta cantidad de candidatos por consulta conviene la búsqueda exacta
+MAXIMO_CANDIDATOS_ANN = 4096
+
+
+def normalizar_filas(matriz: np.ndarray) -> np.ndarray:
+    """Normaliza filas a norma 1 para usar producto punto como coseno
+
+    Parameters
+    ----------
+    matriz : np.ndarray
+        Matriz de forma (n, dim) o vector de forma (dim,)
+
+    Returns
+    -------
+    np.ndarray
+        Matriz float32 con filas de norma 1
+    """
+    matriz = np.atleast_2d(np.asarray(matriz, dtype=np.float32))
+    normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+
+    return matriz / np.maximum(normas, 1e-12)
+
+
+def _como_numpy(embeddings) -> np.ndarray:
+    # Acepta tensores de torch sin importar torch
+    if hasattr(embeddings, "detach"):
+        embeddings = embeddings.detach().cpu().numpy()
+
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+def _mejores(puntajes: np.ndarray, ids: np.ndarray, top_k: int) -> list:
+    k = min(top_k, len(puntajes))
+
+    if k == 0:
+        return []
+
+    mejores = np.argpartition(-puntajes, k - 1)[:k]
+    mejores = mejores[np.argsort(-puntajes[mejores])]
+
+    return [{"corpus_id": int(ids[i]), "score": float(puntajes[i])} for i in mejores]
+
+
+def posiciones_mascara(mascara, n: int) -> np.ndarray:
+    """Posiciones seleccionadas por una máscara sobre un corpus
+
+    Parameters
+    ----------
+    mascara : np.ndarray | pd.Series | list | None
+        Máscara booleana de largo `n`, o posiciones en el corpus
+    n : int
+        Tamaño del corpus
+
+    Returns
+    -------
+    np.ndarray
+        Posiciones int64 ordenadas, todas si `mascara` es None
+    """
+    if mascara is None:
+        return np.arange(n)
+
+    mascara = np.asarray(mascara)
+
+    if mascara.dtype == bool:
+        if len(mascara) != n:
+            raise ValueError(f"La máscara tiene {len(mascara)} filas, el corpus {n}")
+
+        return np.flatnonzero(mascara)
+
+    posiciones = np.unique(mascara.astype(np.int64))
+
+    return posiciones[(posiciones >= 0) & (posiciones < n)]
+
+
+def buscar_exacto(consultas, corpus, top_k: int = 10, mascara=None) -> list:
+    """Búsqueda por similitud coseno contra todo el corpus
+
+    Con `mascara` solo se puntúan las filas seleccionadas, sin volver a
+    calcular los vectores del corpus.
+
+    Parameters
+    ----------
+    consultas : np.ndarray | torch.Tensor
+        Vector o matriz de vectores de consulta
+    corpus : np.ndarray | torch.Tensor | VectoresCompactos
+        Matriz de vectores del corpus, o su versión compacta
+    top_k : int, optional
+        Cantidad de resultados por consulta, default 10
+    mascara : np.ndarray, optional
+        Máscara booleana o posiciones del corpus a considerar, default None
+        para todo el corpus
+
+    Returns
+    -------
+    list
+        Una lista de {"corpus_id", "score"} por consulta, como
+        `sentence_transformers.util.semantic_search`
+    """
+    consultas = normalizar_filas(_como_numpy(consultas))
+
+    if mascara is None:
+        ids = np.arange(len(corpus))
+    else:
+        ids = posiciones_mascara(mascara, len(corpus))
+
+        if isinstance(corpus, VectoresCompactos):
+            escala = None if corpus.escala is None else corpus.escala[ids]
+            corpus = VectoresCompactos(corpus.datos[ids], escala)
+        else:
+            corpus = _como_numpy(corpus)[ids]
+
+    if isinstance(corpus, VectoresCompactos):
+        puntajes = puntuar_compacto(consultas, corpus)
+    else:
+        puntajes = consultas @ normalizar_filas(_como_numpy(corpus)).T
+
+    return [_mejores(fila, ids, top_k) for fila in puntajes]
+
+
+def kmeans_esferico(
+    vectores: np.ndarray, k: int, iteraciones: int = 10, semilla: int = 0
+) -> np.ndarray:
+    """Agrupa vectores normalizados con k-means sobre similitud coseno
+
+    Parameters
+    ----------
+    vectores : np.ndarray
+        Matriz de vectores de norma 1
+    k : int
+        Cantidad de grupos
+    iteraciones : int, optional
+        Iteraciones de Lloyd, default 10
+    semilla : int, optional
+        Semilla aleatoria, default 0
+
+    Returns
+    -------
+    np.ndarray
+        Centroides de norma 1, de forma (k, dim)
+    """
+    rng = np.random.default_rng(semilla)
+    centroides = vectores[rng.choice(len(vectores), size=k, replace=False)]
+
+    for _ in range(iteraciones):
+        asignacion = np.argmax(vectores @ centroides.T, axis=1)
+
+        sumas = np.zeros_like(centroides)
+        np.add.at(sumas, asignacion, vectores)
+
+        # Un grupo vacío conserva su centroide anterior
+        vacios = np.bincount(asignacion, minlength=k) == 0
+        sumas[vacios] = centroides[vacios]
+
+        centroides = normalizar_filas(sumas)
+
+    return centroides
+
+
+class IndiceVectorial:
+    """Índice de vecinos aproximados sobre las filas de un almacén de vectores
+
+    Los IDs del índice son las filas de `AlmacenEmbeddings`, así el índice se
+    actualiza agregando solo las filas nuevas del almacén. Usa HNSW si está
+    instalado hnswlib; si no, un índice IVF en NumPy que lee los vectores
+    directamente de la matriz del almacén.
+
+    Parameters
+    ----------
+    dim : int
+        Dimensión de los vectores
+    backend : str, optional
+        "hnsw" o "ivf", default "hnsw" si hnswlib está disponible
+    """
+
+    def __init__(self, dim: int, backend: str = None):
+        if backend is None:
+            backend = "ivf" if hnswlib is None else "hnsw"
+
+        if backend == "hnsw" and hnswlib is None:
+            raise ImportError("El backend hnsw requiere instalar hnswlib")
+
+        self.dim = dim
+        self.backend = backend
+        self.n = 0
+
+        self._lock = threading.Lock()
+
+        # Estado HNSW
+        self._hnsw = None
+
+        # Estado IVF
+        self._centroides = None
+        self._asignacion = np.empty(0, dtype=np.int32)
+        self._n_entrenado = 0
+        self._listas = None
+
+    def __len__(self) -> int:
+        return self.n
+
+    # Construcción
+
+    def _agregar_hnsw(self, vectores: np.ndarray):
+        if self._hnsw is None:
+            self._hnsw = hnswlib.Index(space="cosine", dim=self.dim)
+            self._hnsw.init_index(
+                max_elements=max(len(vectores), 1024), ef_construction=200, M=16
+            )
+
+        capacidad = self._hnsw.get_max_elements()
+        requerida = self.n + len(vectores)
+
+        if requerida > capacidad:
+            self._hnsw.resize_index(max(requerida, 2 * capacidad))
+
+        self._hnsw.add_items(vectores, np.arange(self.n, requerida))
+
+    def _entrenar_ivf(self, matriz: np.ndarray):
+        n = len(matriz)
+        k = int(min(4096, max(16, 4 * np.sqrt(n))))
+
+        rng = np.random.default_rng(0)
+        muestra = np.sort(rng.choice(n, size=min(n, 256 * k), replace=False))
+
+        self._centroides = kmeans_esferico(normalizar_filas(matriz[muestra]), k)
+        self._asignacion = np.empty(0, dtype=np.int32)
+        self._n_entrenado = n
+
+    def _asignar(self, vectores: np.ndarray) -> np.ndarray:
+        asignacion = [
+            np.argmax(
+                normalizar_filas(vectores[i : i + BLOQUE]) @ self._centroides.T, 1
+            )
+            for i in range(0, len(vectores), BLOQUE)
+        ]
+
+        return np.concatenate(asignacion).astype(np.int32)
+
+    def sincronizar(self, almacen) -> int:
+        """Agrega al índice las filas del almacén que aún no tiene
+
+        Parameters
+        ----------
+        almacen : AlmacenEmbeddings
+            Almacén cuyas filas indexar
+
+        Returns
+        -------
+        int
+            Cantidad de vectores agregados
+        """
+        with self._lock:
+            matriz = almacen.matriz()
+            total = len(matriz)
+
+            if total <= self.n:
+                return 0
+
+            inicio = self.n
+
+            if self.backend == "hnsw":
+                for i in range(inicio, total, BLOQUE):
+                    self._agregar_hnsw(np.asarray(matriz[i : min(i + BLOQUE, total)]))
+                    self.n = min(i + BLOQUE, total)
+
+                return total - inicio
+
+            # IVF: entrena al superar el umbral y reentrena si el corpus creció mucho
+            if total >= UMBRAL_ANN and (
+                self._centroides is None or total > 8 * self._n_entrenado
+            ):
+                self._entrenar_ivf(matriz)
+                inicio = 0
+
+            if self._centroides is not None:
+                nuevas = self._asignar(matriz[inicio:total])
+                self._asignacion = np.concatenate([self._asignacion[:inicio], nuevas])
+                self._listas = None
+
+            agregados = total - self.n
+            self.n = total
+
+            return agregados
+
+    def _listas_ivf(self) -> tuple[np.ndarray, np.ndarray]:
+        if self._listas is None:
+            orden = np.argsort(self._asignacion, kind="stable")
+            conteo = np.bincount(self._asignacion, minlength=len(self._centroides))
+            self._listas = (orden, np.concatenate([[0], np.cumsum(conteo)]))
+
+        return self._listas
+
+    # Búsqueda
+
+    def buscar(
+        self, consultas, almacen, top_k: int = 10, permitidos: np.ndarray = None
+    ) -> list:
+        """Busca los vecinos más cercanos de cada consulta
+
+        El índice aproximado se usa solo sobre todo el almacén. Con
+        `permitidos` la búsqueda es exacta sobre esas filas: filtrar después
+        de recorrer el índice deja pocos o ningún candidato cuando las filas
+        permitidas son una parte pequeña del almacén.
+
+        Parameters
+        ----------
+        consultas : np.ndarray | torch.Tensor
+            Vector o matriz de vectores de consulta
+        almacen : AlmacenEmbeddings
+            Almacén con los vectores indexados
+        top_k : int, optional
+            Cantidad de resultados por consulta, default 10
+        permitidos : np.ndarray, optional
+            Filas del almacén entre las que buscar, default None para todas
+
+        Returns
+        -------
+        list
+            Una lista de {"corpus_id", "score"} por consulta, donde corpus_id
+            es la fila del almacén
+        """
+        consultas = normalizar_filas(_como_numpy(consultas))
+
+        mascara = None
+
+        if permitidos is not None:
+            mascara = np.zeros(self.n, dtype=bool)
+            mascara[permitidos[permitidos < self.n]] = True
+
+        with self._lock:
+            if mascara is None and self.backend == "hnsw" and self._hnsw is not None:
+                return self._buscar_hnsw(consultas, top_k)
+
+            if mascara is None and self._centroides is not None:
+                return self._buscar_ivf(consultas, almacen, top_k)
+
+        # Filas permitidas o índice sin entrenar: búsqueda exacta
+        ids = np.arange(self.n) if mascara is None else np.flatnonzero(mascara)
+        vectores = normalizar_filas(almacen.matriz()[ids])
+
+        return [_mejores(fila, ids, top_k) for fila in consultas @ vectores.T]
+
+    def _buscar_hnsw(self, consultas, top_k) -> list:
+        k = min(top_k, self.n)
+
+        if k == 0:
+            return [[] for _ in consultas]
+
+        self._hnsw.set_ef(max(64, 2 * k))
+
+        etiquetas, distancias = self._hnsw.knn_query(consultas, k=k)
+
+        return [
+            [
+                {"corpus_id": int(i), "score": float(1 - d)}
+                for i, d in zip(fila_ids, fila_dist)
+            ]
+            for fila_ids, fila_dist in zip(etiquetas, distancias)
+        ]
+
+    def _buscar_ivf(self, consultas, almacen, top_k) -> list:
+        orden, limites = self._listas_ivf()
+        matriz = almacen.matriz()
+
+        nprobe = min(NPROBE, len(self._centroides))
+
+        resultados = []
+
+        for q in consultas:
+            listas = np.argpartition(-(self._centroides @ q), nprobe - 1)[:nprobe]
+            ids = np.sort(
+                np.concatenate([orden[limites[j] : limites[j + 1]] for j in listas])
+            )
+
+            puntajes = normalizar_filas(matriz[ids]) @ q
+            resultados.append(_mejores(puntajes, ids, top_k))
+
+        return resultados
+
+    # Persistencia
+
+    def guardar(self, ruta):
+        """Guarda el índice en disco
+
+        Parameters
+        ----------
+        ruta : str | Path
+            Archivo base, se agregan las extensiones .npz y .hnsw
+        """
+        ruta = Path(ruta)
+
+        with self._lock:
+            if self.backend == "hnsw" and self._hnsw is not None:
+                self._hnsw.save_index(str(ruta.with_suffix(".hnsw")))
+
+            np.savez(
+                ruta.with_suffix(".npz"),
+                dim=self.dim,
+                n=self.n,
+                backend=self.backend,
+                centroides=(
+                    np.empty((0, self.dim), dtype=np.float32)
+                    if self._centroides is None
+                    else self._centroides
+                ),
+                asignacion=self._asignacion,
+                n_entrenado=self._n_entrenado,
+            )
+
+    @classmethod
+    def cargar(cls, ruta):
+        """Carga un índice guardado con `guardar`
+
+        Parameters
+        ----------
+        ruta : str | Path
+            Archivo base del índice
+
+        Returns
+        -------
+        IndiceVectorial
+            Índice cargado
+        """
+        ruta = Path(ruta)
+
+        datos = np.load(ruta.with_suffix(".npz"))
+
+        indice = cls(int(datos["dim"]), str(datos["backend"]))
+        indice.n = int(datos["n"])
+
+        if indice.backend == "hnsw" and indice.n:
+            indice._hnsw = hnswlib.Index(space="cosine", dim=indice.dim)
+            indice._hnsw.load_index(str(ruta.with_suffix(".hnsw")))
+        elif len(datos["centroides"]):
+            indice._centroides = datos["centroides"]
+            indice._asignacion = datos["asignacion"]
+            indice._n_entrenado = int(datos["n_entrenado"])
+
+        return indice
+
+    def actualizar(self, almacen) -> int:
+        """Agrega las filas nuevas del almacén y guarda el índice si cambió
+
+        Parameters
+        ----------
+        almacen : AlmacenEmbeddings
+            Almacén indexado
+
+        Returns
+        -------
+        int
+            Cantidad de vectores agregados
+        """
+        agregados = self.sincronizar(almacen)
+
+        if agregados:
+            self.guardar(almacen.directorio.joinpath("indice_ann"))
+
+        return agregados
+
+    @classmethod
+    def desde_almacen(cls, almacen, backend: str = None):
+        """Carga el índice guardado junto al almacén, o lo crea, y lo actualiza
+
+        Parameters
+        ----------
+        almacen : AlmacenEmbeddings
+            Almacén a indexar
+        backend : str, optional
+            "hnsw" o "ivf", default el disponible
+
+        Returns
+        -------
+        IndiceVectorial
+            Índice con todas las filas del almacén
+        """
+        ruta = almacen.directorio.joinpath("indice_ann")
+
+        if ruta.with_suffix(".npz").exists():
+            indice = cls.cargar(ruta)
+        else:
+            indice = cls(almacen.dim, backend)
+
+        indice.actualizar(almacen)
+
+        return indice
+
+
+def buscar_similares(
+    consultas,
+    corpus,
+    top_k: int = 10,
+    indice: IndiceVectorial = None,
+    almacen=None,
+    filas: np.ndarray = None,
+    mascara=None,
+) -> list:
+    """Busca los textos del corpus más similares a cada consulta
+
+    Con un corpus grande se consulta el índice aproximado del almacén
+    compartido pidiendo más candidatos que `top_k`, y se conservan solo los
+    que son textos del corpus seleccionados por `mascara`. Si quedan menos de
+    `top_k`, o el corpus es una parte tan pequeña del almacén que harían falta
+    demasiados candidatos, la búsqueda es exacta sobre los vectores del
+    corpus, que ya están en memoria.
+
+    Parameters
+    ----------
+    consultas : np.ndarray | torch.Tensor
+        Vector o matriz de vectores de consulta
+    corpus : np.ndarray | torch.Tensor | VectoresCompactos
+        Matriz de vectores del corpus, o su versión compacta
+    top_k : int, optional
+        Cantidad de resultados por consulta, default 10
+    indice : IndiceVectorial, optional
+        Índice sobre el almacén, default None
+    almacen : AlmacenEmbeddings, optional
+        Almacén indexado, requerido con `indice`
+    filas : np.ndarray, optional
+        Fila del almacén de cada texto del corpus, requerido con `indice`
+    mascara : np.ndarray, optional
+        Máscara booleana o posiciones del corpus a considerar, ver
+        `mascara_procesos`, default None para todo el corpus
+
+    Returns
+    -------
+    list
+        Una lista de {"corpus_id", "score"} por consulta, con corpus_id como
+        posición en el corpus
+    """
+    if indice is None or filas is None:
+        return buscar_exacto(consultas, corpus, top_k, mascara=mascara)
+
+    filas = np.asarray(filas)
+    seleccion = posiciones_mascara(mascara, len(filas))
+
+    if len(seleccion) < UMBRAL_ANN:
+        return buscar_exacto(consultas, corpus, top_k, mascara=mascara)
+
+    # Textos repetidos comparten fila; se reporta su primera posición
+    unicas, primeras = np.unique(filas[seleccion], return_index=True)
+
+    # Filas aún sin indexar nunca saldrían entre los candidatos
+    if unicas[-1] >= len(indice):
+        return buscar_exacto(consultas, corpus, top_k, mascara=mascara)
+
+    k = min(len(indice), SOBREMUESTREO * top_k * len(indice) // len(unicas))
+
+    if k > MAXIMO_CANDIDATOS_ANN:
+        return buscar_exacto(consultas, corpus, top_k, mascara=mascara)
+
+    posicion = np.full(len(indice), -1, dtype=np.int64)
+    posicion[unicas] = seleccion[primeras]
+
+    resultados = []
+
+    for consulta, candidatos in zip(
+        normalizar_filas(_como_numpy(consultas)), indice.buscar(consultas, almacen, k)
+    ):
+        hits = [
+            {**hit, "corpus_id": int(posicion[hit["corpus_id"]])}
+            for hit in candidatos
+            if posicion[hit["corpus_id"]] >= 0
+        ][:top_k]
+
+        if len(hits) < min(top_k, len(unicas)):
+            hits = buscar_exacto(consulta, corpus, top_k, mascara=seleccion)[0]
+
+        resultados.append(hits)
+
+    return resultados
@@ -0,0 +1,265 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from utils.helpers import normalizar_textual
+from utils.indices import buscar_exacto, posiciones_mascara
+from utils.variables import CANDIDATOS_LEXICOS, PESO_LEXICO
+
+
+# Parámetros usuales de BM25
+K1 = 1.2
+B = 0.75
+
+PALABRAS_VACIAS = set(
+    """
+    a al algo ante con contra de del desde durante e el en entre es esta este
+    hacia hasta la las lo los o para por que se segun sin sobre su sus un una
+    unas unos y
+    """.split()
+)
+
+
+def tokenizar(textos: pd.Series) -> pd.Series:
+    """Términos de cada texto, sin tildes, en minúscula y sin palabras vacías
+
+    Parameters
+    ----------
+    textos : pd.Series
+        Textos a tokenizar
+
+    Returns
+    -------
+    pd.Series
+        Un término por fila, con el índice del texto de origen
+    """
+    normalizados = normalizar_textual(textos.fillna("").to_frame("texto"), "texto")
+
+    terminos = normalizados.str.lower().str.findall(r"[a-z0-9]+").explode().dropna()
+
+    # Códigos como UNSPSC se conservan aunque sean cortos
+    conservar = ~terminos.isin(PALABRAS_VACIAS) & (
+        (terminos.str.len() > 1) | terminos.str.isdigit()
+    )
+
+    return terminos[conservar]
+
+
+def firma_corpus(textos) -> str:
+    """Huella del contenido y orden de un corpus
+
+    Sirve como llave de cache en vez de la lista completa de textos.
+
+    Parameters
+    ----------
+    textos : list | pd.Series
+        Corpus
+
+    Returns
+    -------
+    str
+        Hash sha1 en hexadecimal
+    """
+    huella = hashlib.sha1()
+
+    for texto in textos:
+        huella.update(str(texto).encode("utf-8"))
+        huella.update(b"\x1f")
+
+    return huella.hexdigest()
+
+
+class IndiceBM25:
+    """Índice invertido con puntajes BM25 sobre un corpus de textos
+
+    Las listas de cada término están en un arreglo contiguo ordenado por
+    término, así una consulta solo recorre los documentos que contienen
+    alguno de sus términos.
+
+    Parameters
+    ----------
+    textos : list | pd.Series
+        Corpus, la posición de cada texto es su ID
+    k1 : float, optional
+        Saturación de la frecuencia del término, default K1
+    b : float, optional
+        Normalización por largo del documento, default B
+    """
+
+    def __init__(self, textos, k1: float = K1, b: float = B):
+        textos = pd.Series(list(textos), dtype="object")
+
+        self.n = len(textos)
+        self.k1 = k1
+
+        terminos = tokenizar(textos)
+
+        codigos, vocabulario = pd.factorize(terminos, sort=True)
+        self.vocabulario = {t: i for i, t in enumerate(vocabulario)}
+
+        pares = pd.DataFrame({"termino": codigos, "doc": terminos.index.to_numpy()})
+        frecuencias = pares.value_counts(sort=False).sort_index()
+
+        termino = frecuencias.index.get_level_values("termino").to_numpy()
+
+        self.docs = frecuencias.index.get_level_values("doc").to_numpy(np.int64)
+        self.tf = frecuencias.to_numpy(np.float32)
+
+        # Inicio de la lista de cada término en `docs` y `tf`
+        conteo = np.bincount(termino, minlength=len(vocabulario))
+        self.inicios = np.concatenate([[0], np.cumsum(conteo)]).astype(np.int64)
+
+        self.idf = np.log1p((self.n - conteo + 0.5) / (conteo + 0.5)).astype(np.float32)
+
+        largos = np.bincount(self.docs, weights=self.tf, minlength=self.n)
+        promedio = largos.mean() if self.n and largos.mean() else 1.0
+        self.normas = (k1 * (1 - b + b * largos / promedio)).astype(np.float32)
+
+    def __len__(self) -> int:
+        return self.n
+
+    def puntuar(self, consulta: str) -> tuple[np.ndarray, np.ndarray]:
+        """Puntaje BM25 de los documentos con algún término de la consulta
+
+        Parameters
+        ----------
+        consulta : str
+            Texto de la consulta
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray]
+            IDs de los documentos y su puntaje
+        """
+        terminos = tokenizar(pd.Series([consulta]))
+        ids = [self.vocabulario[t] for t in terminos.unique() if t in self.vocabulario]
+
+        if not ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        docs, parciales = [], []
+
+        for i in ids:
+            inicio, fin = self.inicios[i], self.inicios[i + 1]
+            d, tf = self.docs[inicio:fin], self.tf[inicio:fin]
+
+            docs.append(d)
+            parciales.append(self.idf[i] * tf * (self.k1 + 1) / (tf + self.normas[d]))
+
+        unicos, inversa = np.unique(np.concatenate(docs), return_inverse=True)
+        puntajes = np.bincount(inversa, weights=np.concatenate(parciales))
+
+        return unicos, puntajes.astype(np.float32)
+
+    def candidatos(
+        self, consulta: str, n: int = CANDIDATOS_LEXICOS, mascara=None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Documentos con mejor puntaje BM25
+
+        Parameters
+        ----------
+        consulta : str
+            Texto de la consulta
+        n : int, optional
+            Máximo de candidatos, default CANDIDATOS_LEXICOS
+        mascara : np.ndarray, optional
+            Máscara booleana o posiciones permitidas, default None para todas
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray]
+            IDs y puntajes en orden descendente
+        """
+        docs, puntajes = self.puntuar(consulta)
+
+        if mascara is not None:
+            permitidos = np.isin(docs, posiciones_mascara(mascara, self.n))
+            docs, puntajes = docs[permitidos], puntajes[permitidos]
+
+        if len(docs) > n:
+            mejores = np.argpartition(-puntajes, n - 1)[:n]
+            docs, puntajes = docs[mejores], puntajes[mejores]
+
+        orden = np.argsort(-puntajes, kind="stable")
+
+        return docs[orden], puntajes[orden]
+
+
+def buscar_hibrido(
+    consulta: str,
+    consulta_embedding,
+    indice: IndiceBM25,
+    vectores,
+    top_k: int = 10,
+    peso_lexico: float = PESO_LEXICO,
+    candidatos: int = CANDIDATOS_LEXICOS,
+    mascara=None,
+) -> list:
+    """Preselecciona con BM25 y reordena los candidatos por similitud
+
+    Solo los candidatos léxicos pasan por `vectores`, así el modelo no procesa
+    todo el corpus. Si ningún documento comparte términos con la consulta se
+    usan todos los documentos permitidos y solo cuenta la similitud, como en la
+    búsqueda semántica.
+
+    Parameters
+    ----------
+    consulta : str
+        Texto de la consulta
+    consulta_embedding : np.ndarray | torch.Tensor
+        Vector de la consulta
+    indice : IndiceBM25
+        Índice léxico del corpus
+    vectores : Callable[[np.ndarray], np.ndarray | torch.Tensor]
+        Retorna los vectores de unos IDs del corpus
+    top_k : int, optional
+        Cantidad de resultados, default 10
+    peso_lexico : float, optional
+        Peso del puntaje BM25 normalizado, entre 0 y 1; la similitud coseno
+        pesa el resto, default PESO_LEXICO
+    candidatos : int, optional
+        Máximo de candidatos léxicos, default CANDIDATOS_LEXICOS
+    mascara : np.ndarray, optional
+        Máscara booleana o posiciones del corpus a considerar, default None
+        para todo el corpus
+
+    Returns
+    -------
+    list
+        Una lista con los {"corpus_id", "score", "score_lexico",
+        "score_semantico"} de la consulta, como `buscar_similares`
+    """
+    ids, lexicos = indice.candidatos(consulta, candidatos, mascara)
+
+    if not len(ids):
+        ids = posiciones_mascara(mascara, len(indice))
+        lexicos = np.zeros(len(ids), dtype=np.float32)
+        peso_lexico = 0.0
+
+    if not len(ids):
+        return [[]]
+
+    # Puntaje léxico relativo al mejor candidato, entre 0 y 1
+    lexicos = lexicos / lexicos[0] if lexicos[0] > 0 else lexicos
+
+    hits = buscar_exacto(consulta_embedding, vectores(ids), top_k=len(ids))[0]
+
+    semanticos = np.empty(len(ids), dtype=np.float32)
+    semanticos[[hit["corpus_id"] for hit in hits]] = [hit["score"] for hit in hits]
+
+    puntajes = peso_lexico * lexicos + (1 - peso_lexico) * semanticos
+
+    mejores = np.argsort(-puntajes, kind="stable")[:top_k]
+
+    return [
+        [
+            {
+                "corpus_id": int(ids[i]),
+                "score": float(puntajes[i]),
+                "score_lexico": float(lexicos[i]),
+                "score_semantico": float(semanticos[i]),
+            }
+            for i in mejores
+        ]
+    ]
@@ -0,0 +1,531 @@
+"""Tiempos por etapa de las búsquedas y su exportación
+
+Cada etapa registra duración, filas, bytes transferidos y si vino del cache.
+Las mediciones se acumulan en memoria por proceso y se exportan en formato
+de texto de Prometheus (`/metrics` si PUERTO_METRICAS tiene valor) o como
+JSON lines (EXPORTAR_METRICAS). `mostrar_metricas` agrega un resumen en la
+barra lateral cuando MOSTRAR_METRICAS es True o la URL tiene `?debug=1`.
+"""
+
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+import atexit
+import functools
+import json
+import threading
+import time
+
+import pandas as pd
+
+from data.rutas import METRICAS_JSONL
+from utils.variables import EXPORTAR_METRICAS, MOSTRAR_METRICAS, PUERTO_METRICAS
+
+
+# Límites en segundos de los buckets del histograma de Prometheus
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Mediciones recientes que se guardan para percentiles y JSON lines
+MAXIMO_EVENTOS = 5000
+
+PREFIJO = "compras"
+
+# Las mediciones se escriben al JSON lines por tandas, fuera del lock del
+# registro: cada tanta líneas o cada tantos segundos, y al salir del proceso
+LINEAS_POR_ESCRITURA = 100
+SEGUNDOS_POR_ESCRITURA = 5
+
+
+class Medicion:
+    """Datos de una ejecución de una etapa
+
+    Quien mide puede asignar `filas`, `bytes`, `cache` ("hit" o "miss") y
+    `error` antes de que termine el bloque `medir`.
+    """
+
+    def __init__(self, etapa: str, etiquetas: dict):
+        self.etapa = etapa
+        self.etiquetas = etiquetas
+        self.marca = time.time()
+        self.duracion = None
+        self.filas = None
+        self.bytes = None
+        self.cache = None
+        self.error = None
+
+    def evento(self) -> dict:
+        evento = {
+            "marca": self.marca,
+            "etapa": self.etapa,
+            "duracion_s": self.duracion,
+            "filas": self.filas,
+            "bytes": self.bytes,
+            "cache": self.cache,
+            "error": self.error,
+        }
+
+        return evento | self.etiquetas
+
+
+class RegistroMetricas:
+    """Acumulado de mediciones de un proceso
+
+    Parameters
+    ----------
+    maximo : int, optional
+        Mediciones recientes en memoria, default MAXIMO_EVENTOS
+    archivo : str | Path, optional
+        JSON lines donde se agregan las mediciones por tandas, default None
+    """
+
+    def __init__(self, maximo: int = MAXIMO_EVENTOS, archivo=None):
+        self.archivo = Path(archivo) if archivo else None
+        self.eventos = deque(maxlen=maximo)
+        self._lock = threading.Lock()
+        self._series = defaultdict(self._serie)
+
+        self._pendientes = []
+        self._ultima_escritura = time.monotonic()
+        self._lock_archivo = threading.Lock()
+
+        if self.archivo is not None:
+            atexit.register(self.vaciar)
+
+    @staticmethod
+    def _serie() -> dict:
+        return {
+            "conteo": 0,
+            "suma": 0.0,
+            "buckets": [0] * len(BUCKETS),
+            "filas": 0,
+            "bytes": 0,
+            "hit": 0,
+            "miss": 0,
+            "errores": 0,
+        }
+
+    def registrar(self, medicion: Medicion):
+        """Agrega una medición terminada
+
+        Parameters
+        ----------
+        medicion : Medicion
+            Medición con duración
+        """
+        evento = medicion.evento()
+        llave = (medicion.etapa, tuple(sorted(medicion.etiquetas.items())))
+
+        with self._lock:
+            serie = self._series[llave]
+            serie["conteo"] += 1
+            serie["suma"] += medicion.duracion
+
+            for i, limite in enumerate(BUCKETS):
+                if medicion.duracion <= limite:
+                    serie["buckets"][i] += 1
+
+            serie["filas"] += medicion.filas or 0
+            serie["bytes"] += medicion.bytes or 0
+            serie["errores"] += medicion.error is not None
+
+            if medicion.cache in ("hit", "miss"):
+                serie[medicion.cache] += 1
+
+            self.eventos.append(evento)
+
+            lineas = None
+
+            if self.archivo is not None:
+                self._pendientes.append(json.dumps(evento, default=str) + "\n")
+
+                ahora = time.monotonic()
+
+                if (
+                    len(self._pendientes) >= LINEAS_POR_ESCRITURA
+                    or ahora - self._ultima_escritura >= SEGUNDOS_POR_ESCRITURA
+                ):
+                    lineas, self._pendientes = self._pendientes, []
+                    self._ultima_escritura = ahora
+
+        if lineas:
+            self._escribir(lineas)
+
+    def _escribir(self, lineas: list):
+        # Solo los hilos que escriben una tanda esperan el disco
+        with self._lock_archivo:
+            self.archivo.parent.mkdir(parents=True, exist_ok=True)
+
+            with open(self.archivo, "a", encoding="utf-8") as f:
+                f.writelines(lineas)
+
+    def vaciar(self):
+        """Escribe al JSON lines las mediciones que aún están en memoria"""
+        with self._lock:
+            lineas, self._pendientes = self._pendientes, []
+            self._ultima_escritura = time.monotonic()
+
+        if lineas and self.archivo is not None:
+            self._escribir(lineas)
+
+    def limpiar(self):
+        with self._lock:
+            self.eventos.clear()
+            self._series.clear()
+
+    def resumen(self) -> pd.DataFrame:
+        """Resumen por etapa de las mediciones recientes
+
+        Returns
+        -------
+        pd.DataFrame
+            Llamados, percentiles en ms, filas, bytes y tasa de aciertos del
+            cache por etapa
+        """
+        with self._lock:
+            df = pd.DataFrame(list(self.eventos))
+
+        if df.empty:
+            return df
+
+        df["ms"] = df["duracion_s"] * 1000
+        df["hit"] = df["cache"] == "hit"
+        df["con_cache"] = df["cache"].notna()
+
+        resumen = df.groupby("etapa").agg(
+            llamados=("ms", "size"),
+            p50_ms=("ms", "median"),
+            p95_ms=("ms", lambda s: s.quantile(0.95)),
+            total_ms=("ms", "sum"),
+            filas=("filas", "sum"),
+            bytes=("bytes", "sum"),
+            hits=("hit", "sum"),
+            con_cache=("con_cache", "sum"),
+        )
+
+        resumen["tasa_cache"] = resumen["hits"] / resumen["con_cache"].where(
+            resumen["con_cache"] > 0
+        )
+
+        resumen = resumen.drop(columns=["hits", "con_cache"])
+
+        return resumen.sort_values("total_ms", ascending=False)
+
+    def prometheus(self) -> str:
+        """Métricas acumuladas en formato de texto de Prometheus
+
+        Returns
+        -------
+        str
+            Histograma de duración y contadores de filas, bytes, cache y
+            errores por etapa
+        """
+        duracion = f"{PREFIJO}_etapa_segundos"
+        contadores = {
+            "filas": f"{PREFIJO}_etapa_filas_total",
+            "bytes": f"{PREFIJO}_etapa_bytes_total",
+            "errores": f"{PREFIJO}_etapa_errores_total",
+        }
+        cache = f"{PREFIJO}_cache_total"
+
+        lineas = [
+            f"# HELP {duracion} Duración de cada etapa",
+            f"# TYPE {duracion} histogram",
+        ]
+
+        with self._lock:
+            series = {
+                llave: {**serie, "buckets": list(serie["buckets"])}
+                for llave, serie in self._series.items()
+            }
+
+        for (etapa, etiquetas), serie in series.items():
+            base = _etiquetas({"etapa": etapa, **dict(etiquetas)})
+
+            for limite, n in zip(BUCKETS, serie["buckets"]):
+                le = _etiquetas({"etapa": etapa, **dict(etiquetas), "le": limite})
+                lineas.append(f"{duracion}_bucket{le} {n}")
+
+            infinito = _etiquetas({"etapa": etapa, **dict(etiquetas), "le": "+Inf"})
+            lineas.append(f"{duracion}_bucket{infinito} {serie['conteo']}")
+            lineas.append(f"{duracion}_sum{base} {serie['suma']}")
+            lineas.append(f"{duracion}_count{base} {serie['conteo']}")
+
+        for campo, nombre in contadores.items():
+            lineas.append(f"# TYPE {nombre} counter")
+
+            for (etapa, etiquetas), serie in series.items():
+                base = _etiquetas({"etapa": etapa, **dict(etiquetas)})
+                lineas.append(f"{nombre}{base} {serie[campo]}")
+
+        lineas.append(f"# TYPE {cache} counter")
+
+        for (etapa, etiquetas), serie in series.items():
+            if serie["hit"] or serie["miss"]:
+                for resultado in ["hit", "miss"]:
+                    base = _etiquetas(
+                        {"etapa": etapa, **dict(etiquetas), "resultado": resultado}
+                    )
+                    lineas.append(f"{cache}{base} {serie[resultado]}")
+
+        return "\n".join(lineas) + "\n"
+
+    def jsonl(self) -> str:
+        """Mediciones recientes como JSON lines
+
+        Returns
+        -------
+        str
+            Una medición por línea
+        """
+        with self._lock:
+            eventos = list(self.eventos)
+
+        return "".join(json.dumps(e, default=str) + "\n" for e in eventos)
+
+
+def _etiquetas(etiquetas: dict) -> str:
+    pares = []
+
+    for k, v in etiquetas.items():
+        valor = str(v).replace("\\", "\\\\").replace('"', '\\"')
+        pares.append(f'{k}="{valor}"')
+
+    return "{" + ",".join(pares) + "}"
+
+
+REGISTRO = RegistroMetricas(archivo=METRICAS_JSONL if EXPORTAR_METRICAS else None)
+
+# Mediciones abiertas en cada hilo, la última es la más interna
+_abiertas = threading.local()
+
+
+def _pila() -> list:
+    if not hasattr(_abiertas, "pila"):
+        _abiertas.pila = []
+
+    return _abiertas.pila
+
+
+def medicion_actual() -> Medicion | None:
+    """Medición más interna abierta en este hilo
+
+    Returns
+    -------
+    Medicion | None
+        Medición en curso, None si no hay
+    """
+    pila = _pila()
+
+    return pila[-1] if pila else None
+
+
+@contextmanager
+def medir(etapa: str, registro: RegistroMetricas = None, **etiquetas):
+    """Mide la duración de un bloque
+
+    Parameters
+    ----------
+    etapa : str
+        Nombre de la etapa, por ejemplo "socrata.http"
+    registro : RegistroMetricas, optional
+        Donde se registra la medición, default REGISTRO
+    **etiquetas
+        Etiquetas adicionales de la serie, por ejemplo el dataset
+
+    Yields
+    ------
+    Medicion
+        Medición a la que se pueden asignar filas, bytes y cache
+    """
+    medicion = Medicion(etapa, etiquetas)
+    pila = _pila()
+    pila.append(medicion)
+
+    inicio = time.perf_counter()
+
+    try:
+        yield medicion
+    except Exception as e:
+        medicion.error = type(e).__name__
+        raise
+    finally:
+        medicion.duracion = time.perf_counter() - inicio
+        pila.pop()
+        (registro or REGISTRO).registrar(medicion)
+
+
+def contar_filas(resultado) -> int | None:
+    """Filas de un resultado: DataFrame, tabla Arrow, lista o matriz
+
+    Parameters
+    ----------
+    resultado : Any
+        Valor retornado por una etapa
+
+    Returns
+    -------
+    int | None
+        Cantidad de filas, None si el resultado no tiene longitud
+    """
+    if isinstance(resultado, (pd.DataFrame, pd.Series, list, tuple, dict)):
+        return len(resultado)
+
+    # Tabla de Arrow
+    if hasattr(resultado, "num_rows"):
+        return resultado.num_rows
+
+    # np.ndarray o torch.Tensor, un vector cuenta como una fila
+    if hasattr(resultado, "ndim"):
+        return resultado.shape[0] if resultado.ndim > 1 else 1
+
+    return None
+
+
+def instrumentar(etapa: str, cache=None):
+    """Decorador que mide cada llamado a una función
+
+    Con `cache` (por ejemplo `st.cache_data(...)`) la función se guarda en
+    ese cache y la medición distingue aciertos de cálculos.
+
+    Parameters
+    ----------
+    etapa : str
+        Nombre de la etapa
+    cache : Callable, optional
+        Decorador de cache a aplicar a la función, default None
+
+    Returns
+    -------
+    Callable
+        Decorador
+    """
+
+    def decorador(funcion):
+        calcular = funcion
+
+        if cache is not None:
+
+            @functools.wraps(funcion)
+            def calcular(*args, **kwargs):
+                # Solo se ejecuta cuando el resultado no está en el cache
+                medicion = medicion_actual()
+
+                if medicion is not None:
+                    medicion.cache = "miss"
+
+                return funcion(*args, **kwargs)
+
+            calcular = cache(calcular)
+
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with medir(etapa) as medicion:
+                if cache is not None:
+                    medicion.cache = "hit"
+
+                resultado = calcular(*args, **kwargs)
+                medicion.filas = contar_filas(resultado)
+
+            return resultado
+
+        if cache is not None:
+            envoltura.clear = calcular.clear
+
+        return envoltura
+
+    return decorador
+
+
+class _ManejadorMetricas(BaseHTTPRequestHandler):
+    registro = REGISTRO
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+
+        cuerpo = self.registro.prometheus().encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+
+_exportador = None
+_lock_exportador = threading.Lock()
+
+
+def iniciar_exportador(puerto: int = PUERTO_METRICAS):
+    """Sirve `/metrics` para Prometheus en un hilo, una vez por proceso
+
+    Parameters
+    ----------
+    puerto : int, optional
+        Puerto local, default PUERTO_METRICAS
+
+    Returns
+    -------
+    ThreadingHTTPServer | None
+        Servidor, None si no hay puerto o ya está en uso
+    """
+    global _exportador
+
+    if puerto is None:
+        return None
+
+    with _lock_exportador:
+        if _exportador is None:
+            try:
+                _exportador = ThreadingHTTPServer(
+                    ("127.0.0.1", puerto), _ManejadorMetricas
+                )
+            except OSError:
+                # Otro proceso de la aplicación ya exporta en ese puerto
+                return None
+
+            _exportador.daemon_threads = True
+            threading.Thread(target=_exportador.serve_forever, daemon=True).start()
+
+    return _exportador
+
+
+def mostrar_metricas(registro: RegistroMetricas = None):
+    """Resumen de métricas en la barra lateral, si está habilitado
+
+    Parameters
+    ----------
+    registro : RegistroMetricas, optional
+        Registro a mostrar, default REGISTRO
+    """
+    import streamlit as st
+
+    iniciar_exportador()
+
+    if not (MOSTRAR_METRICAS or st.query_params.get("debug") == "1"):
+        return
+
+    registro = registro or REGISTRO
+
+    with st.sidebar.expander("⏱️ Métricas", expanded=True):
+        resumen = registro.resumen()
+
+        if resumen.empty:
+            st.caption("Sin mediciones")
+        else:
+            st.dataframe(resumen.round(1), use_container_width=True)
+
+        st.download_button(
+            "Prometheus", registro.prometheus(), "metricas.prom", "text/plain"
+        )
+        st.download_button(
+            "JSON lines", registro.jsonl(), "metricas.jsonl", "application/x-ndjson"
+        )
+
+        if st.button("Reiniciar métricas"):
+            registro.limpiar()
@@ -0,0 +1,213 @@
+from contextlib import contextmanager
+from pathlib import Path
+import platform
+import shutil
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from sentence_transformers import SentenceTransformer
+
+from data.rutas import DIR_MODELOS
+from utils.helpers import ruta_temporal
+
+
+BACKENDS = ["torch", "onnx"]
+
+_lock_exportacion = threading.Lock()
+
+
+def config_cuantizacion() -> str:
+    """Configuración de cuantización dinámica int8 según la CPU
+
+    Returns
+    -------
+    str
+        "arm64" en procesadores ARM, "avx2" en x86
+    """
+    if platform.machine().lower() in {"arm64", "aarch64"}:
+        return "arm64"
+
+    # avx512_vnni es más rápido pero no todas las CPU x86 lo soportan
+    return "avx2"
+
+
+def id_vectores(model_id: str, backend: str = "torch") -> str:
+    """ID con el que se guardan los vectores calculados por un backend
+
+    Los vectores del modelo cuantizado difieren levemente de los de PyTorch,
+    por eso no comparten almacén.
+
+    Parameters
+    ----------
+    model_id : str
+        ID del modelo en Hugging Face
+    backend : str, optional
+        "torch" u "onnx", default "torch"
+
+    Returns
+    -------
+    str
+        ID del modelo, con sufijo si el backend no es PyTorch
+    """
+    if backend == "torch":
+        return model_id
+
+    return f"{model_id}@{backend}-int8"
+
+
+def ruta_onnx(model_id: str) -> Path:
+    """Carpeta del modelo exportado a ONNX int8
+
+    Parameters
+    ----------
+    model_id : str
+        ID del modelo en Hugging Face
+
+    Returns
+    -------
+    Path
+        Carpeta en DIR_MODELOS
+    """
+    return DIR_MODELOS.joinpath(f"{model_id.replace('/', '__')}__onnx_int8")
+
+
+@contextmanager
+def _bloquear_exportacion(model_id: str):
+    # Un solo proceso (e hilo) exporta cada modelo; los demás esperan su archivo
+    DIR_MODELOS.mkdir(parents=True, exist_ok=True)
+    candado = DIR_MODELOS.joinpath(f"{ruta_onnx(model_id).name}.lock")
+
+    with _lock_exportacion, open(candado, "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _exportado(model_id: str) -> Path | None:
+    archivos = sorted(ruta_onnx(model_id).glob("onnx/model_qint8_*.onnx"))
+
+    return archivos[0] if archivos else None
+
+
+def exportar_onnx_int8(model_id: str, config: str = None) -> Path:
+    """Exporta un modelo a ONNX y lo cuantiza a int8 sin calibración
+
+    La exportación se hace en una carpeta temporal bajo un candado de archivo
+    y luego se mueve a su lugar, así varios procesos que arrancan a la vez no
+    escriben sobre la misma carpeta ni leen un modelo a medio exportar.
+
+    Parameters
+    ----------
+    model_id : str
+        ID del modelo en Hugging Face
+    config : str, optional
+        Configuración de cuantización, default según `config_cuantizacion`
+
+    Returns
+    -------
+    Path
+        Archivo .onnx cuantizado
+    """
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+
+    config = config or config_cuantizacion()
+    directorio = ruta_onnx(model_id)
+    archivo = directorio.joinpath("onnx", f"model_qint8_{config}.onnx")
+
+    with _bloquear_exportacion(model_id):
+        if archivo.exists():
+            return archivo
+
+        temporal = ruta_temporal(directorio)
+
+        try:
+            modelo = SentenceTransformer(model_id, backend="onnx", device="cpu")
+            modelo.save_pretrained(str(temporal))
+
+            export_dynamic_quantized_onnx_model(modelo, config, str(temporal))
+
+            if directorio.exists():
+                # Ya hay otra configuración exportada: solo se agrega esta
+                archivo.parent.mkdir(parents=True, exist_ok=True)
+                temporal.joinpath("onnx", archivo.name).rename(archivo)
+            else:
+                temporal.rename(directorio)
+        finally:
+            shutil.rmtree(temporal, ignore_errors=True)
+
+    return archivo
+
+
+def cargar_modelo(model_id: str, backend: str = "torch", hilos: int = None):
+    """Carga el modelo para calcular vectores en CPU
+
+    Con backend "onnx" lee el modelo cuantizado desde DIR_MODELOS; si no
+    existe lo exporta una vez, pero conviene exportarlo antes con
+    `python -m utils.modelos` para no hacerlo en la primera consulta.
+
+    Parameters
+    ----------
+    model_id : str
+        ID del modelo en Hugging Face
+    backend : str, optional
+        "torch" u "onnx", default "torch"
+    hilos : int, optional
+        Hilos de inferencia, default None usa todos los núcleos
+
+    Returns
+    -------
+    SentenceTransformer
+        Modelo con la misma interfaz `encode` en ambos backends
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend no soportado: {backend}")
+
+    if backend == "torch":
+        if hilos:
+            import torch
+
+            torch.set_num_threads(hilos)
+
+        return SentenceTransformer(model_id, device="cpu")
+
+    import onnxruntime as ort
+
+    directorio = ruta_onnx(model_id)
+    archivo = _exportado(model_id) or exportar_onnx_int8(model_id)
+
+    opciones = ort.SessionOptions()
+    opciones.intra_op_num_threads = hilos or 0
+    opciones.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+    return SentenceTransformer(
+        str(directorio),
+        backend="onnx",
+        device="cpu",
+        model_kwargs={
+            "file_name": archivo.relative_to(directorio).as_posix(),
+            "provider": "CPUExecutionProvider",
+            "session_options": opciones,
+        },
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from utils.variables import MODELO
+
+    parser = argparse.ArgumentParser(description="Exporta el modelo a ONNX int8")
+    parser.add_argument("--modelo", default=MODELO)
+    parser.add_argument("--config", default=None, help="arm64, avx2, avx512...")
+    args = parser.parse_args()
+
+    print(f"Modelo exportado en {exportar_onnx_int8(args.modelo, args.config)}")
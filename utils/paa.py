@@ -0,0 +1,417 @@
+from pathlib import Path
+import hashlib
+import json
+import threading
+
+import numpy as np
+import pandas as pd
+
+from data.rutas import (
+    DIR_PAA,
+    DIR_PAA_PARQUET,
+    DIR_PAA_VECTORES,
+    MANIFIESTO_PAA,
+    META_PAA,
+    INDICE_VECTORES_PAA,
+)
+from utils.codificacion import codificar_textos
+from utils.helpers import ruta_temporal
+from utils.modelos import id_vectores
+from utils.variables import BACKEND_EMBEDDINGS, COLS_PAA, RENOMBRES_PAA, MODELO
+
+
+NUMERICAS_PAA = ["duracion", "valor"]
+
+# Serializa la conversión y el cálculo de vectores entre sesiones del proceso,
+# cada una lee y reescribe el manifiesto completo
+_lock_paa = threading.Lock()
+
+# Los fragmentos se calculan con el backend de la aplicación, así los vectores
+# de las consultas y del corpus salen del mismo modelo
+MODELO_VECTORES = id_vectores(MODELO, BACKEND_EMBEDDINGS)
+
+
+def huella_archivo(ruta) -> str:
+    """Calcula el hash sha256 del contenido de un archivo
+
+    Parameters
+    ----------
+    ruta : str | Path
+        Archivo a leer
+
+    Returns
+    -------
+    str
+        Hash sha256 en hexadecimal
+    """
+    huella = hashlib.sha256()
+
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            huella.update(bloque)
+
+    return huella.hexdigest()
+
+
+def leer_manifiesto(ruta=MANIFIESTO_PAA) -> dict:
+    """Lee el manifiesto de archivos PAA ya convertidos
+
+    Parameters
+    ----------
+    ruta : str | Path, optional
+        Archivo JSON del manifiesto, default MANIFIESTO_PAA
+
+    Returns
+    -------
+    dict
+        Diccionario {archivo: {"mtime", "tamano", "sha256"}}
+    """
+    ruta = Path(ruta)
+
+    if not ruta.exists():
+        return {}
+
+    return json.loads(ruta.read_text(encoding="utf-8"))
+
+
+def ruta_parquet(archivo: str) -> Path:
+    """Ruta del Parquet que corresponde a un archivo PAA
+
+    Parameters
+    ----------
+    archivo : str
+        Nombre del archivo .xlsx en DIR_PAA
+
+    Returns
+    -------
+    Path
+        Archivo .parquet en DIR_PAA_PARQUET
+    """
+    return DIR_PAA_PARQUET.joinpath(Path(archivo).with_suffix(".parquet").name)
+
+
+def convertir_paa(archivo: str, entidad: str, nit_entidad: str) -> pd.DataFrame:
+    """Lee un archivo PAA y lo lleva al esquema COLS_PAA
+
+    Parameters
+    ----------
+    archivo : str
+        Nombre del archivo .xlsx en DIR_PAA
+    entidad : str
+        Nombre de la entidad dueña del plan
+    nit_entidad : str
+        NIT de la entidad
+
+    Returns
+    -------
+    pd.DataFrame
+        Plan con columnas COLS_PAA, entidad y nit_entidad
+    """
+    df = pd.read_excel(DIR_PAA.joinpath(archivo), skiprows=1)
+    df = df.rename(RENOMBRES_PAA, axis=1)
+    df = df[COLS_PAA]
+
+    for col in COLS_PAA:
+        if col in NUMERICAS_PAA:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+        else:
+            df[col] = df[col].astype("string")
+
+    df["entidad"] = pd.Series(entidad, index=df.index, dtype="string")
+    df["nit_entidad"] = pd.Series(nit_entidad, index=df.index, dtype="string")
+
+    return df
+
+
+def ingerir_paa(forzar: bool = False) -> str:
+    """Convierte a Parquet los archivos PAA nuevos o modificados
+
+    Un archivo se vuelve a convertir si cambia su fecha de modificación o su
+    tamaño y además cambia su contenido.
+
+    Parameters
+    ----------
+    forzar : bool, optional
+        Convertir todos los archivos, default False
+
+    Returns
+    -------
+    str
+        Firma del manifiesto, cambia cada vez que se convierte algún archivo
+    """
+    with _lock_paa:
+        df_meta = pd.read_excel(META_PAA, dtype={"nit_entidad": str})
+
+        manifiesto = leer_manifiesto()
+        nuevo = {}
+
+        DIR_PAA_PARQUET.mkdir(parents=True, exist_ok=True)
+
+        for row in df_meta.itertuples():
+            fuente = DIR_PAA.joinpath(row.archivo)
+            destino = ruta_parquet(row.archivo)
+
+            stat = fuente.stat()
+            anterior = manifiesto.get(row.archivo, {})
+
+            registro = {"mtime": stat.st_mtime, "tamano": stat.st_size}
+
+            sin_cambios = (
+                not forzar
+                and destino.exists()
+                and anterior.get("mtime") == registro["mtime"]
+                and anterior.get("tamano") == registro["tamano"]
+            )
+
+            if sin_cambios:
+                nuevo[row.archivo] = anterior
+                continue
+
+            registro["sha256"] = huella_archivo(fuente)
+
+            if (
+                forzar
+                or not destino.exists()
+                or anterior.get("sha256") != registro["sha256"]
+            ):
+                nit = None if pd.isna(row.nit_entidad) else row.nit_entidad
+                df = convertir_paa(row.archivo, row.entidad, nit)
+
+                temporal = ruta_temporal(destino)
+                df.to_parquet(temporal, index=False)
+                temporal.replace(destino)
+
+            nuevo[row.archivo] = registro
+
+        # Parquet de archivos que ya no están en la metadata
+        for archivo in set(manifiesto) - set(nuevo):
+            ruta_parquet(archivo).unlink(missing_ok=True)
+
+        if nuevo != manifiesto:
+            temporal = ruta_temporal(MANIFIESTO_PAA)
+            temporal.write_text(json.dumps(nuevo, indent=2), encoding="utf-8")
+            temporal.replace(MANIFIESTO_PAA)
+
+        firma = json.dumps({k: v["sha256"] for k, v in nuevo.items()}, sort_keys=True)
+
+        return hashlib.sha256(firma.encode("utf-8")).hexdigest()
+
+
+def leer_paa(archivos: list) -> pd.DataFrame:
+    """Lee solo los planes convertidos de los archivos indicados
+
+    Parameters
+    ----------
+    archivos : list
+        Nombres de archivos .xlsx, como la columna archivo de META_PAA
+
+    Returns
+    -------
+    pd.DataFrame
+        Planes concatenados en el orden recibido
+    """
+    dfs = [pd.read_parquet(ruta_parquet(archivo)) for archivo in archivos]
+
+    if not dfs:
+        return pd.DataFrame(columns=COLS_PAA + ["entidad", "nit_entidad"])
+
+    return pd.concat(dfs, ignore_index=True)
+
+
+def ruta_vectores(archivo: str) -> Path:
+    """Ruta del fragmento de vectores que corresponde a un archivo PAA
+
+    Parameters
+    ----------
+    archivo : str
+        Nombre del archivo .xlsx en DIR_PAA
+
+    Returns
+    -------
+    Path
+        Archivo .npy en DIR_PAA_VECTORES
+    """
+    return DIR_PAA_VECTORES.joinpath(Path(archivo).with_suffix(".npy").name)
+
+
+def construir_vectores_paa(
+    embedder, modelo: str = MODELO_VECTORES, forzar: bool = False, pool=None
+) -> int:
+    """Calcula un fragmento de vectores por archivo PAA convertido
+
+    Cada fragmento tiene una fila por fila del Parquet del archivo, en el mismo
+    orden. Solo se recalculan fragmentos cuyo archivo cambió según el
+    manifiesto o que fueron calculados con otro modelo.
+
+    Parameters
+    ----------
+    embedder : SentenceTransformer
+        Modelo para calcular los vectores
+    modelo : str, optional
+        ID de los vectores del modelo y backend de `embedder`, ver
+        `id_vectores`, default MODELO_VECTORES
+    forzar : bool, optional
+        Recalcular todos los fragmentos, default False
+    pool : ProcessPoolExecutor, optional
+        Pool de `crear_pool` para repartir la codificación, default None
+
+    Returns
+    -------
+    int
+        Cantidad de fragmentos calculados
+    """
+    with _lock_paa:
+        manifiesto = leer_manifiesto()
+        indice = leer_manifiesto(INDICE_VECTORES_PAA)
+
+        DIR_PAA_VECTORES.mkdir(parents=True, exist_ok=True)
+
+        calculados = 0
+
+        for archivo, registro in manifiesto.items():
+            anterior = indice.get(archivo, {})
+
+            vigente = (
+                not forzar
+                and ruta_vectores(archivo).exists()
+                and anterior.get("sha256") == registro["sha256"]
+                and anterior.get("modelo") == modelo
+            )
+
+            if vigente:
+                continue
+
+            textos = pd.read_parquet(ruta_parquet(archivo), columns=["descripcion"])
+            textos = textos["descripcion"].fillna("").to_list()
+
+            vectores = codificar_textos(embedder, textos, pool)
+
+            destino = ruta_vectores(archivo)
+            temporal = ruta_temporal(destino)
+
+            with open(temporal, "wb") as f:
+                np.save(f, np.asarray(vectores, dtype=np.float32))
+
+            temporal.replace(destino)
+
+            indice[archivo] = {
+                "sha256": registro["sha256"],
+                "modelo": modelo,
+                "filas": len(textos),
+            }
+            calculados += 1
+
+        for archivo in set(indice) - set(manifiesto):
+            ruta_vectores(archivo).unlink(missing_ok=True)
+            indice.pop(archivo)
+
+        temporal = ruta_temporal(INDICE_VECTORES_PAA)
+        temporal.write_text(json.dumps(indice, indent=2), encoding="utf-8")
+        temporal.replace(INDICE_VECTORES_PAA)
+
+        return calculados
+
+
+def firma_vectores_paa() -> float | None:
+    """Fecha de modificación del índice de fragmentos de vectores
+
+    Returns
+    -------
+    float | None
+        Marca de tiempo del índice, None si no se han calculado fragmentos
+    """
+    if not INDICE_VECTORES_PAA.exists():
+        return None
+
+    return INDICE_VECTORES_PAA.stat().st_mtime
+
+
+def leer_vectores_paa(archivos: list, modelo: str = MODELO_VECTORES):
+    """Concatena los fragmentos de vectores de los archivos indicados
+
+    Los fragmentos se abren con memory map, solo se copian al concatenar.
+
+    Parameters
+    ----------
+    archivos : list
+        Nombres de archivos .xlsx, en el mismo orden usado con `leer_paa`
+    modelo : str, optional
+        ID de los vectores con que deben estar calculados, ver `id_vectores`,
+        default MODELO_VECTORES
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray] | None
+        Matriz de vectores y fila inicial de cada archivo, None si falta algún
+        fragmento o está desactualizado
+    """
+    manifiesto = leer_manifiesto()
+    indice = leer_manifiesto(INDICE_VECTORES_PAA)
+
+    fragmentos = []
+
+    for archivo in archivos:
+        registro = indice.get(archivo, {})
+
+        vigente = (
+            archivo in manifiesto
+            and registro.get("sha256") == manifiesto[archivo]["sha256"]
+            and registro.get("modelo") == modelo
+            and ruta_vectores(archivo).exists()
+        )
+
+        if not vigente:
+            return None
+
+        fragmentos.append(np.load(ruta_vectores(archivo), mmap_mode="r"))
+
+    if not fragmentos:
+        return None
+
+    filas = [len(fragmento) for fragmento in fragmentos]
+    inicios = np.concatenate([[0], np.cumsum(filas)[:-1]]).astype(np.int64)
+
+    return np.concatenate(fragmentos), inicios
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convierte los PAA a Parquet")
+    parser.add_argument("--forzar", action="store_true", help="Convertir todos")
+    parser.add_argument(
+        "--vectores",
+        action="store_true",
+        help="Calcular también los fragmentos de vectores por archivo",
+    )
+    parser.add_argument("--backend", default=BACKEND_EMBEDDINGS)
+    parser.add_argument(
+        "--procesos",
+        type=int,
+        default=0,
+        help="Procesos para calcular los vectores, 0 usa solo el actual",
+    )
+    args = parser.parse_args()
+
+    print(f"Firma: {ingerir_paa(forzar=args.forzar)}")
+
+    if args.vectores:
+        from utils.codificacion import crear_pool
+        from utils.modelos import cargar_modelo
+
+        pool = None
+
+        if args.procesos:
+            pool = crear_pool(MODELO, args.backend, procesos=args.procesos)
+
+        n = construir_vectores_paa(
+            cargar_modelo(MODELO, args.backend),
+            id_vectores(MODELO, args.backend),
+            forzar=args.forzar,
+            pool=pool,
+        )
+
+        if pool is not None:
+            pool.shutdown()
+
+        print(f"{n} fragmentos de vectores calculados.")
@@ -0,0 +1,320 @@
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import urlsplit
+import hashlib
+import json
+import sqlite3
+import time
+import zlib
+
+import pyarrow as pa
+
+from utils.variables import TTL_DATASETS, TTL_DEFECTO
+
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS respuestas (
+    clave TEXT PRIMARY KEY,
+    dataset TEXT NOT NULL,
+    creado REAL NOT NULL,
+    expira REAL NOT NULL,
+    contenido BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS estadisticas (
+    dataset TEXT PRIMARY KEY,
+    hits INTEGER NOT NULL DEFAULT 0,
+    misses INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+def url_canonica(url: str) -> str:
+    """Normaliza una URL de Socrata API
+
+    Parameters
+    ----------
+    url : str
+        URL del recurso
+
+    Returns
+    -------
+    str
+        URL con esquema y dominio en minúscula, sin query ni barra final
+    """
+    partes = urlsplit(url.strip())
+    ruta = partes.path.rstrip("/")
+
+    return f"{partes.scheme.lower()}://{partes.netloc.lower()}{ruta}"
+
+
+def dataset_de_url(url: str) -> str:
+    """Extrae el ID del dataset de una URL de Socrata API
+
+    Parameters
+    ----------
+    url : str
+        URL del recurso, como URL_PROCESOS
+
+    Returns
+    -------
+    str
+        ID del dataset, como p6dx-8zbt
+    """
+    return Path(urlsplit(url).path).stem
+
+
+def clave_respuesta(
+    url: str, payload: dict, formato: str = "json", variante: dict = None
+) -> str:
+    """Calcula la clave de una consulta a partir de URL y payload
+
+    Parameters
+    ----------
+    url : str
+        URL del recurso
+    payload : dict
+        Payload enviado a Socrata API
+    formato : str, optional
+        Formato en que se guarda la respuesta, "json" o "arrow", default "json"
+    variante : dict, optional
+        Opciones locales que cambian lo guardado sin cambiar el payload, como
+        las columnas de una tabla, default None
+
+    Returns
+    -------
+    str
+        Hash sha256 de la URL canónica y el payload ordenado
+    """
+    params = {str(k): str(v) for k, v in payload.items()}
+    partes = [url_canonica(url), params]
+
+    if formato != "json":
+        partes.append(formato)
+
+    if variante:
+        partes.append({str(k): str(v) for k, v in variante.items()})
+
+    canonica = json.dumps(partes, sort_keys=True)
+
+    return hashlib.sha256(canonica.encode("utf-8")).hexdigest()
+
+
+class CacheRespuestas:
+    """Almacén persistente de respuestas de Socrata API en SQLite
+
+    Es seguro para varios procesos a la vez: cada operación abre su propia
+    conexión y SQLite en modo WAL serializa las escrituras.
+
+    Parameters
+    ----------
+    ruta : str | Path
+        Archivo SQLite donde se guardan las respuestas
+    ttls : dict, optional
+        Vigencia en segundos por ID de dataset, default TTL_DATASETS
+    ttl_defecto : int, optional
+        Vigencia para datasets sin TTL propio, default TTL_DEFECTO
+    """
+
+    def __init__(self, ruta, ttls: dict = None, ttl_defecto: int = TTL_DEFECTO):
+        self.ruta = Path(ruta)
+        self.ttls = TTL_DATASETS if ttls is None else ttls
+        self.ttl_defecto = ttl_defecto
+
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+
+        with self._conectar() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(ESQUEMA)
+
+    @contextmanager
+    def _conectar(self):
+        conn = sqlite3.connect(self.ruta, timeout=30)
+
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _contar(self, conn: sqlite3.Connection, dataset: str, campo: str):
+        conn.execute(
+            f"""
+            INSERT INTO estadisticas (dataset, {campo}) VALUES (?, 1)
+            ON CONFLICT(dataset) DO UPDATE SET {campo} = {campo} + 1
+            """,
+            (dataset,),
+        )
+
+    def ttl(self, dataset: str) -> int:
+        return self.ttls.get(dataset, self.ttl_defecto)
+
+    def _leer(self, url: str, clave: str) -> bytes | None:
+        dataset = dataset_de_url(url)
+
+        with self._conectar() as conn:
+            fila = conn.execute(
+                "SELECT contenido FROM respuestas WHERE clave = ? AND expira > ?",
+                (clave, time.time()),
+            ).fetchone()
+
+            self._contar(conn, dataset, "misses" if fila is None else "hits")
+
+        return None if fila is None else fila[0]
+
+    def _guardar(self, url: str, clave: str, contenido: bytes):
+        dataset = dataset_de_url(url)
+
+        ahora = time.time()
+
+        with self._conectar() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO respuestas VALUES (?, ?, ?, ?, ?)",
+                (clave, dataset, ahora, ahora + self.ttl(dataset), contenido),
+            )
+
+    def leer(self, url: str, payload: dict, variante: dict = None) -> list | None:
+        """Busca una respuesta vigente
+
+        Parameters
+        ----------
+        url : str
+            URL del recurso
+        payload : dict
+            Payload enviado a Socrata API
+        variante : dict, optional
+            Opciones de paginación que cambian la respuesta, default None
+
+        Returns
+        -------
+        list | None
+            Registros guardados, None si no hay respuesta vigente
+        """
+        contenido = self._leer(url, clave_respuesta(url, payload, variante=variante))
+
+        if contenido is None:
+            return None
+
+        return json.loads(zlib.decompress(contenido))
+
+    def guardar(self, url: str, payload: dict, resultados: list, variante: dict = None):
+        """Guarda una respuesta con la vigencia de su dataset
+
+        Parameters
+        ----------
+        url : str
+            URL del recurso
+        payload : dict
+            Payload enviado a Socrata API
+        resultados : list
+            Registros retornados por Socrata API
+        variante : dict, optional
+            Opciones de paginación que cambian la respuesta, default None
+        """
+        contenido = zlib.compress(json.dumps(resultados).encode("utf-8"))
+
+        self._guardar(url, clave_respuesta(url, payload, variante=variante), contenido)
+
+    def leer_tabla(self, url: str, payload: dict, variante: dict = None):
+        """Busca una respuesta vigente guardada como tabla Arrow
+
+        Parameters
+        ----------
+        url : str
+            URL del recurso
+        payload : dict
+            Payload enviado a Socrata API
+        variante : dict, optional
+            Columnas y anidados con que se construyó la tabla, default None
+
+        Returns
+        -------
+        pa.Table | None
+            Tabla guardada, None si no hay respuesta vigente
+        """
+        contenido = self._leer(url, clave_respuesta(url, payload, "arrow", variante))
+
+        if contenido is None:
+            return None
+
+        return pa.ipc.open_stream(contenido).read_all()
+
+    def guardar_tabla(self, url: str, payload: dict, tabla, variante: dict = None):
+        """Guarda una tabla Arrow comprimida con la vigencia de su dataset
+
+        Parameters
+        ----------
+        url : str
+            URL del recurso
+        payload : dict
+            Payload enviado a Socrata API
+        tabla : pa.Table
+            Tabla construida a partir de la respuesta
+        variante : dict, optional
+            Columnas y anidados con que se construyó la tabla, default None
+        """
+        sink = pa.BufferOutputStream()
+        opciones = pa.ipc.IpcWriteOptions(compression="zstd")
+
+        with pa.ipc.new_stream(sink, tabla.schema, options=opciones) as writer:
+            writer.write_table(tabla)
+
+        contenido = sink.getvalue().to_pybytes()
+
+        clave = clave_respuesta(url, payload, "arrow", variante)
+
+        self._guardar(url, clave, contenido)
+
+    def purgar(self) -> int:
+        """Elimina respuestas vencidas
+
+        Returns
+        -------
+        int
+            Cantidad de respuestas eliminadas
+        """
+        with self._conectar() as conn:
+            cursor = conn.execute(
+                "DELETE FROM respuestas WHERE expira <= ?", (time.time(),)
+            )
+
+        return cursor.rowcount
+
+    def estadisticas(self) -> dict:
+        """Reporta aciertos, fallos y respuestas guardadas por dataset
+
+        Returns
+        -------
+        dict
+            Diccionario {dataset: {"hits", "misses", "entradas"}}
+        """
+        with self._conectar() as conn:
+            contadores = conn.execute(
+                "SELECT dataset, hits, misses FROM estadisticas"
+            ).fetchall()
+            entradas = dict(
+                conn.execute(
+                    "SELECT dataset, count(*) FROM respuestas GROUP BY dataset"
+                ).fetchall()
+            )
+
+        reporte = {
+            dataset: {"hits": hits, "misses": misses, "entradas": 0}
+            for dataset, hits, misses in contadores
+        }
+
+        for dataset, n in entradas.items():
+            reporte.setdefault(dataset, {"hits": 0, "misses": 0, "entradas": 0})
+            reporte[dataset]["entradas"] = n
+
+        return reporte
+
+
+if __name__ == "__main__":
+    from data.rutas import CACHE_SOCRATA
+
+    cache = CacheRespuestas(CACHE_SOCRATA)
+
+    print(f"Respuestas vencidas eliminadas: {cache.purgar()}")
+
+    for dataset, valores in cache.estadisticas().items():
+        print(dataset, valores)
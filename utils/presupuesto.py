@@ -0,0 +1,233 @@
+from pathlib import Path
+import hashlib
+import json
+import re
+import shutil
+import threading
+
+import pandas as pd
+
+from data.rutas import DIR_PRESUPUESTO, DIR_PGN_PARQUET, MANIFIESTO_PGN
+from utils.helpers import ruta_temporal
+from utils.paa import huella_archivo, leer_manifiesto
+from utils.variables import COLS_PGN, NUMERICAS_PGN
+
+
+PATRON_PGN = re.compile(r"pgn(\d{4})\.csv$")
+
+# Serializa la conversión entre sesiones del proceso, cada una reescribe el
+# manifiesto completo
+_lock_pgn = threading.Lock()
+
+
+def vigencia_archivo(archivo) -> int | None:
+    """Vigencia del PGN según el nombre del archivo
+
+    Parameters
+    ----------
+    archivo : str | Path
+        Archivo con nombre pgn<año>.csv
+
+    Returns
+    -------
+    int | None
+        Año de la vigencia, None si el nombre no corresponde
+    """
+    coincidencia = PATRON_PGN.search(Path(archivo).name)
+
+    return int(coincidencia.group(1)) if coincidencia else None
+
+
+def ruta_vigencia(vigencia: int, directorio=DIR_PGN_PARQUET) -> Path:
+    """Partición de una vigencia en el dataset Parquet
+
+    Parameters
+    ----------
+    vigencia : int
+        Año de la vigencia
+    directorio : str | Path, optional
+        Raíz del dataset, default DIR_PGN_PARQUET
+
+    Returns
+    -------
+    Path
+        Carpeta vigencia=<año>
+    """
+    return Path(directorio).joinpath(f"vigencia={vigencia}")
+
+
+def convertir_pgn(ruta) -> pd.DataFrame:
+    """Lee un archivo PGN con separador de miles y lo tipa
+
+    Parameters
+    ----------
+    ruta : str | Path
+        Archivo pgn<año>.csv
+
+    Returns
+    -------
+    pd.DataFrame
+        PGN con columnas COLS_PGN, montos float64 y textos string
+    """
+    df = pd.read_csv(ruta, encoding="utf-8", usecols=COLS_PGN, thousands=",")
+
+    for col in COLS_PGN:
+        if col in NUMERICAS_PGN:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+        else:
+            df[col] = df[col].astype("string")
+
+    return df
+
+
+def ingerir_pgn(forzar: bool = False) -> str:
+    """Convierte a Parquet los PGN nuevos o modificados
+
+    El dataset queda particionado por vigencia y nivel. Cada vigencia se
+    escribe en una carpeta temporal y reemplaza la anterior completa.
+
+    Parameters
+    ----------
+    forzar : bool, optional
+        Convertir todas las vigencias, default False
+
+    Returns
+    -------
+    str
+        Firma del manifiesto, cambia cada vez que se convierte alguna vigencia
+    """
+    with _lock_pgn:
+        manifiesto = leer_manifiesto(MANIFIESTO_PGN)
+        nuevo = {}
+
+        DIR_PGN_PARQUET.mkdir(parents=True, exist_ok=True)
+
+        for fuente in sorted(DIR_PRESUPUESTO.glob("pgn*.csv")):
+            vigencia = vigencia_archivo(fuente)
+
+            if vigencia is None:
+                continue
+
+            destino = ruta_vigencia(vigencia)
+
+            stat = fuente.stat()
+            anterior = manifiesto.get(fuente.name, {})
+
+            registro = {"mtime": stat.st_mtime, "tamano": stat.st_size}
+
+            sin_cambios = (
+                not forzar
+                and destino.exists()
+                and anterior.get("mtime") == registro["mtime"]
+                and anterior.get("tamano") == registro["tamano"]
+            )
+
+            if sin_cambios:
+                nuevo[fuente.name] = anterior
+                continue
+
+            registro["sha256"] = huella_archivo(fuente)
+
+            if (
+                forzar
+                or not destino.exists()
+                or anterior.get("sha256") != registro["sha256"]
+            ):
+                df = convertir_pgn(fuente)
+                df["vigencia"] = vigencia
+
+                # Prefijo "." para que la lectura del dataset lo ignore
+                temporal = ruta_temporal(destino)
+                shutil.rmtree(temporal, ignore_errors=True)
+
+                df.to_parquet(
+                    temporal, index=False, partition_cols=["vigencia", "nivel"]
+                )
+
+                shutil.rmtree(destino, ignore_errors=True)
+                ruta_vigencia(vigencia, temporal).replace(destino)
+                shutil.rmtree(temporal, ignore_errors=True)
+
+            nuevo[fuente.name] = registro
+
+        # Particiones de archivos que ya no existen
+        for archivo in set(manifiesto) - set(nuevo):
+            shutil.rmtree(ruta_vigencia(vigencia_archivo(archivo)), ignore_errors=True)
+
+        if nuevo != manifiesto:
+            temporal = ruta_temporal(MANIFIESTO_PGN)
+            temporal.write_text(json.dumps(nuevo, indent=2), encoding="utf-8")
+            temporal.replace(MANIFIESTO_PGN)
+
+        firma = json.dumps({k: v["sha256"] for k, v in nuevo.items()}, sort_keys=True)
+
+        return hashlib.sha256(firma.encode("utf-8")).hexdigest()
+
+
+def vigencias_pgn() -> list:
+    """Vigencias del PGN ya convertidas
+
+    Returns
+    -------
+    list
+        Años en orden descendente
+    """
+    vigencias = (vigencia_archivo(a) for a in leer_manifiesto(MANIFIESTO_PGN))
+
+    return sorted((v for v in vigencias if v is not None), reverse=True)
+
+
+def leer_pgn(
+    vigencias: list, tipo: str = None, nivel: str = None, columnas: list = None
+) -> pd.DataFrame:
+    """Lee solo las particiones y filas pedidas del PGN
+
+    Parameters
+    ----------
+    vigencias : list
+        Años a leer
+    tipo : str, optional
+        Tipo de presupuesto, ver TIPO_PRESUPUESTO, default None
+    nivel : str, optional
+        Nivel de detalle: total, partida o subpartida, default None
+    columnas : list, optional
+        Columnas a leer además de vigencia, default None para COLS_PGN
+
+    Returns
+    -------
+    pd.DataFrame
+        PGN filtrado con la columna vigencia
+    """
+    columnas = list(dict.fromkeys((columnas or COLS_PGN) + ["vigencia"]))
+
+    if not vigencias:
+        return pd.DataFrame(columns=columnas)
+
+    filtros = [("vigencia", "in", [int(v) for v in vigencias])]
+
+    if nivel is not None:
+        filtros.append(("nivel", "=", nivel))
+
+    if tipo is not None:
+        filtros.append(("tipo", "=", tipo))
+
+    df = pd.read_parquet(DIR_PGN_PARQUET, columns=columnas, filters=filtros)
+
+    # Las columnas de partición se leen como categorías
+    df["vigencia"] = df["vigencia"].astype("int64")
+
+    if "nivel" in df.columns:
+        df["nivel"] = df["nivel"].astype("string")
+
+    return df
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convierte los PGN a Parquet")
+    parser.add_argument("--forzar", action="store_true", help="Convertir todos")
+    args = parser.parse_args()
+
+    print(f"Firma: {ingerir_pgn(forzar=args.forzar)}")
+    print(f"Vigencias: {vigencias_pgn()}")
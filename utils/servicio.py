@@ -0,0 +1,406 @@
+"""Servicio local de vectores con un solo modelo para todos los procesos
+
+Uso:
+
+    python -m utils.servicio --backend onnx
+
+Los procesos de Streamlit se conectan por un socket Unix, solo accesible por
+el mismo usuario y autenticado con una clave que el servicio guarda junto al
+socket. Las solicitudes de todas las sesiones se agrupan en micro-lotes antes
+de pasar por el modelo.
+"""
+
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+from pathlib import Path
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from data.rutas import SOCKET_EMBEDDINGS
+from utils.codificacion import codificar_textos
+from utils.modelos import cargar_modelo, id_vectores
+
+
+# Segundos que se espera a otras solicitudes antes de codificar un lote
+LATENCIA_LOTE = 0.005
+
+# Máximo de textos que se juntan en un micro-lote
+MAXIMO_TEXTOS_LOTE = 4096
+
+# Fallas de transporte ante las que el cliente pasa al modelo local; el error
+# de una solicitud (p. ej. un texto inválido) se propaga como RuntimeError
+ERRORES_SERVICIO = (ConnectionError, EOFError, OSError)
+
+# Segundos con el modelo local antes de volver a intentar con el servicio
+REINTENTO_SERVICIO = 30
+
+
+def ruta_clave(ruta) -> Path:
+    """Archivo con la clave de autenticación de un socket del servicio
+
+    Parameters
+    ----------
+    ruta : str | Path
+        Socket Unix del servicio
+
+    Returns
+    -------
+    Path
+        Archivo .key junto al socket
+    """
+    return Path(ruta).with_suffix(".key")
+
+
+class Solicitud:
+    """Textos de una conexión a la espera de sus vectores"""
+
+    def __init__(self, textos: list):
+        self.textos = textos
+        self.vectores = None
+        self.error = None
+        self.lista = threading.Event()
+
+
+class ServicioEmbeddings:
+    """Servidor que atiende solicitudes de vectores en micro-lotes
+
+    Un hilo por conexión recibe textos y los encola. Un solo hilo toma la
+    primera solicitud en cola, espera hasta LATENCIA_LOTE por otras y las
+    codifica juntas, así los textos repetidos entre sesiones se calculan una
+    vez.
+
+    Parameters
+    ----------
+    model_id : str
+        ID del modelo en Hugging Face
+    backend : str, optional
+        "torch" u "onnx", default "torch"
+    hilos : int, optional
+        Hilos de inferencia, default None
+    ruta : str | Path, optional
+        Socket Unix del servicio, default SOCKET_EMBEDDINGS
+    """
+
+    def __init__(
+        self, model_id: str, backend: str = "torch", hilos: int = None, ruta=None
+    ):
+        self.modelo = cargar_modelo(model_id, backend, hilos)
+        self.info = {
+            "modelo": id_vectores(model_id, backend),
+            "dim": self.modelo.get_sentence_embedding_dimension(),
+        }
+        self.ruta = Path(ruta or SOCKET_EMBEDDINGS)
+        self.cola = queue.Queue()
+
+    def _agrupar(self) -> list:
+        solicitudes = [self.cola.get()]
+        n = len(solicitudes[0].textos)
+        limite = time.monotonic() + LATENCIA_LOTE
+
+        while n < MAXIMO_TEXTOS_LOTE:
+            restante = limite - time.monotonic()
+
+            if restante <= 0:
+                break
+
+            try:
+                solicitud = self.cola.get(timeout=restante)
+            except queue.Empty:
+                break
+
+            solicitudes.append(solicitud)
+            n += len(solicitud.textos)
+
+        return solicitudes
+
+    def _codificar_solo(self, solicitud: Solicitud):
+        try:
+            solicitud.vectores = codificar_textos(self.modelo, solicitud.textos)
+        except Exception as e:
+            solicitud.error = str(e)
+
+        solicitud.lista.set()
+
+    def _codificar(self):
+        while True:
+            solicitudes = self._agrupar()
+            textos = [t for s in solicitudes for t in s.textos]
+
+            try:
+                vectores = codificar_textos(self.modelo, textos)
+            except Exception:
+                # Una solicitud inválida no hace fallar a las demás del lote
+                for solicitud in solicitudes:
+                    self._codificar_solo(solicitud)
+                continue
+
+            inicio = 0
+
+            for solicitud in solicitudes:
+                fin = inicio + len(solicitud.textos)
+                solicitud.vectores = vectores[inicio:fin]
+                solicitud.lista.set()
+                inicio = fin
+
+    def _atender(self, conn):
+        with conn:
+            while True:
+                try:
+                    mensaje, contenido = conn.recv()
+                except (EOFError, OSError):
+                    return
+
+                if mensaje == "info":
+                    conn.send(("ok", self.info))
+                    continue
+
+                solicitud = Solicitud(list(contenido))
+                self.cola.put(solicitud)
+                solicitud.lista.wait()
+
+                if solicitud.error is None:
+                    conn.send(("ok", solicitud.vectores))
+                else:
+                    conn.send(("error", solicitud.error))
+
+    def servir(self):
+        """Atiende conexiones hasta que se interrumpa el proceso"""
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+
+        # Socket de una ejecución anterior que no cerró
+        self.ruta.unlink(missing_ok=True)
+
+        clave = os.urandom(32)
+        archivo_clave = ruta_clave(self.ruta)
+        archivo_clave.unlink(missing_ok=True)
+
+        # Socket y clave se crean con permisos 0600, sin ventana intermedia
+        umask = os.umask(0o177)
+
+        try:
+            archivo_clave.write_bytes(clave)
+            listener = Listener(str(self.ruta), family="AF_UNIX", authkey=clave)
+        finally:
+            os.umask(umask)
+
+        threading.Thread(target=self._codificar, daemon=True).start()
+
+        with listener:
+            while True:
+                try:
+                    conn = listener.accept()
+                except (AuthenticationError, EOFError, OSError):
+                    # Conexión sin la clave correcta o cerrada en el saludo
+                    continue
+                threading.Thread(
+                    target=self._atender, args=(conn,), daemon=True
+                ).start()
+
+
+class ClienteEmbeddings:
+    """Cliente del servicio con la interfaz `encode` de SentenceTransformer
+
+    Cada hilo usa su propia conexión, así las sesiones de un mismo proceso
+    de Streamlit también se agrupan en el servidor. Si el servicio deja de
+    responder y hay `respaldo`, el cliente usa el modelo local durante
+    REINTENTO_SERVICIO segundos y luego vuelve a intentar con el servicio;
+    cuando este responde, libera el modelo local.
+
+    Parameters
+    ----------
+    ruta : str | Path, optional
+        Socket Unix del servicio, default SOCKET_EMBEDDINGS
+    respaldo : Callable[[], SentenceTransformer], optional
+        Carga el modelo local si falla el servicio, default None para
+        propagar el error
+    """
+
+    def __init__(self, ruta=None, respaldo=None):
+        self.ruta = Path(ruta or SOCKET_EMBEDDINGS)
+        self.respaldo = respaldo
+        self._local = threading.local()
+        self._modelo_local = None
+        self._caido_hasta = 0.0
+        self._lock = threading.Lock()
+        self.clave = ruta_clave(self.ruta).read_bytes()
+        self.info = self._pedir("info", None)
+
+    @property
+    def remoto(self) -> bool:
+        # `codificar_textos` delega en el servidor en vez de tokenizar
+        # localmente, salvo mientras se usa el modelo local
+        return time.monotonic() >= self._caido_hasta
+
+    def _conexion(self):
+        if getattr(self._local, "conn", None) is None:
+            self._local.conn = Client(
+                str(self.ruta), family="AF_UNIX", authkey=self.clave
+            )
+
+        return self._local.conn
+
+    def _pedir(self, mensaje: str, contenido):
+        for intento in range(2):
+            try:
+                conn = self._conexion()
+                conn.send((mensaje, contenido))
+                estado, respuesta = conn.recv()
+                break
+            except (EOFError, OSError):
+                # El servicio se reinició, se intenta una vez con otra conexión
+                # y la clave nueva
+                self._local.conn = None
+
+                if intento:
+                    raise ConnectionError(f"Servicio no disponible en {self.ruta}")
+
+                try:
+                    self.clave = ruta_clave(self.ruta).read_bytes()
+                except OSError:
+                    pass
+
+        if estado == "error":
+            raise RuntimeError(respuesta)
+
+        return respuesta
+
+    @property
+    def modelo(self) -> str:
+        return self.info["modelo"]
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.info["dim"]
+
+    def encode(
+        self,
+        sentences,
+        convert_to_numpy: bool = True,
+        convert_to_tensor: bool = False,
+        **kwargs,
+    ):
+        """Calcula vectores en el servicio
+
+        Parameters
+        ----------
+        sentences : str | list
+            Texto o textos a convertir en vectores
+        convert_to_numpy : bool, optional
+            Retornar np.ndarray, default True
+        convert_to_tensor : bool, optional
+            Retornar torch.Tensor, default False
+
+        Returns
+        -------
+        np.ndarray | torch.Tensor
+            Vector o matriz float32 en el orden recibido
+        """
+        if not self.remoto:
+            return self._encode_local(
+                sentences,
+                convert_to_numpy=convert_to_numpy,
+                convert_to_tensor=convert_to_tensor,
+                **kwargs,
+            )
+
+        unico = isinstance(sentences, str)
+        textos = [sentences] if unico else list(sentences)
+
+        if textos:
+            try:
+                vectores = self._pedir("encode", textos)
+            except ERRORES_SERVICIO:
+                if self.respaldo is None:
+                    raise
+
+                self._caido_hasta = time.monotonic() + REINTENTO_SERVICIO
+
+                return self._encode_local(
+                    sentences,
+                    convert_to_numpy=convert_to_numpy,
+                    convert_to_tensor=convert_to_tensor,
+                    **kwargs,
+                )
+
+            # El servicio volvió: el modelo local ya no hace falta en memoria
+            if self._modelo_local is not None:
+                with self._lock:
+                    self._modelo_local = None
+        else:
+            vectores = np.empty((0, self.info["dim"]), dtype=np.float32)
+
+        if unico:
+            vectores = vectores[0]
+
+        if convert_to_tensor:
+            import torch
+
+            return torch.from_numpy(vectores)
+
+        return vectores
+
+    def _encode_local(self, sentences, **kwargs):
+        with self._lock:
+            if self._modelo_local is None:
+                self._modelo_local = self.respaldo()
+
+            modelo = self._modelo_local
+
+        return modelo.encode(sentences, **kwargs)
+
+
+def conectar_servicio(model_id: str, backend: str = "torch", ruta=None, respaldo=None):
+    """Conecta con el servicio si está activo y usa el mismo modelo
+
+    Parameters
+    ----------
+    model_id : str
+        ID del modelo en Hugging Face
+    backend : str, optional
+        "torch" u "onnx", default "torch"
+    ruta : str | Path, optional
+        Socket Unix del servicio, default SOCKET_EMBEDDINGS
+    respaldo : Callable[[], SentenceTransformer], optional
+        Carga el modelo local si el servicio falla después, default None
+
+    Returns
+    -------
+    ClienteEmbeddings | None
+        Cliente, None si el servicio no está activo o usa otro modelo
+    """
+    ruta = Path(ruta or SOCKET_EMBEDDINGS)
+
+    if not ruta.exists():
+        return None
+
+    try:
+        cliente = ClienteEmbeddings(ruta, respaldo)
+    except ERRORES_SERVICIO:
+        return None
+
+    if cliente.modelo != id_vectores(model_id, backend):
+        return None
+
+    return cliente
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from utils.variables import MODELO, BACKEND_EMBEDDINGS, HILOS_EMBEDDINGS
+
+    parser = argparse.ArgumentParser(description="Servicio local de vectores")
+    parser.add_argument("--modelo", default=MODELO)
+    parser.add_argument("--backend", default=BACKEND_EMBEDDINGS)
+    parser.add_argument("--hilos", type=int, default=HILOS_EMBEDDINGS)
+    parser.add_argument("--socket", default=SOCKET_EMBEDDINGS)
+    args = parser.parse_args()
+
+    servicio = ServicioEmbeddings(args.modelo, args.backend, args.hilos, args.socket)
+
+    print(f"Atendiendo {servicio.info['modelo']} en {servicio.ruta}")
+
+    servicio.servir()
@@ -0,0 +1,196 @@
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.metricas import medir
+from utils.variables import (
+    ESPERA_MAXIMA_SOCRATA,
+    ESPERA_MINIMA_SOCRATA,
+    LLAMADOS_POR_SEGUNDO,
+    RAFAGA_SOCRATA,
+    REINTENTOS_SOCRATA,
+    TIMEOUT_SOCRATA,
+)
+
+
+# Respuestas transitorias que se vuelven a pedir
+ESTADOS_REINTENTO = {429, 500, 502, 503, 504}
+
+# Conexiones abiertas por host: paginación paralela y precarga de detalles
+CONEXIONES_POR_HOST = 16
+
+
+class LimitadorTasa:
+    """Cubeta de fichas compartida por los hilos que usan una sesión
+
+    Parameters
+    ----------
+    tasa : float
+        Fichas que se reponen por segundo
+    capacidad : int
+        Fichas máximas, permite ráfagas de ese tamaño
+    """
+
+    def __init__(self, tasa: float, capacidad: int):
+        self.tasa = tasa
+        self.capacidad = capacidad
+        self.fichas = float(capacidad)
+        self.ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def adquirir(self) -> float:
+        """Toma una ficha, esperando si no hay disponibles
+
+        Returns
+        -------
+        float
+            Segundos de espera
+        """
+        with self._lock:
+            ahora = time.monotonic()
+            self.fichas = min(
+                self.capacidad, self.fichas + (ahora - self.ultimo) * self.tasa
+            )
+            self.ultimo = ahora
+
+            # La ficha se descuenta de una vez, quien llega después espera más
+            self.fichas -= 1
+            espera = -self.fichas / self.tasa if self.fichas < 0 else 0.0
+
+        if espera:
+            time.sleep(espera)
+
+        return espera
+
+
+_limitadores = {}
+_lock_limitadores = threading.Lock()
+
+
+def limitador_compartido(token: str = None) -> LimitadorTasa:
+    """Limitador único por token dentro del proceso
+
+    Parameters
+    ----------
+    token : str, optional
+        Token de la aplicación, default None
+
+    Returns
+    -------
+    LimitadorTasa
+        Limitador con LLAMADOS_POR_SEGUNDO y RAFAGA_SOCRATA
+    """
+    with _lock_limitadores:
+        if token not in _limitadores:
+            _limitadores[token] = LimitadorTasa(LLAMADOS_POR_SEGUNDO, RAFAGA_SOCRATA)
+
+        return _limitadores[token]
+
+
+def espera_reintento(
+    intento: int,
+    respuesta=None,
+    minima: float = ESPERA_MINIMA_SOCRATA,
+    maxima: float = ESPERA_MAXIMA_SOCRATA,
+) -> float:
+    """Segundos a esperar antes de un reintento
+
+    Usa `Retry-After` si la respuesta lo trae. Si no, espera un valor al azar
+    entre 0 y un máximo que se duplica en cada intento (full jitter), así los
+    hilos que fallaron juntos no reintentan al mismo tiempo.
+
+    Parameters
+    ----------
+    intento : int
+        Número del reintento, desde 0
+    respuesta : requests.Response, optional
+        Respuesta fallida, default None
+    minima : float, optional
+        Segundos del primer máximo, default ESPERA_MINIMA_SOCRATA
+    maxima : float, optional
+        Tope de la espera, default ESPERA_MAXIMA_SOCRATA
+
+    Returns
+    -------
+    float
+        Segundos de espera
+    """
+    if respuesta is not None:
+        try:
+            return min(maxima, float(respuesta.headers["Retry-After"]))
+        except (KeyError, ValueError):
+            pass
+
+    return random.uniform(0, min(maxima, minima * 2**intento))
+
+
+class SesionSocrata(requests.Session):
+    """Sesión con reintentos, límite de tasa y conexiones persistentes
+
+    Los llamados que fallan por conexión o con ESTADOS_REINTENTO se repiten
+    hasta `reintentos` veces. Todas las sesiones del mismo token comparten el
+    limitador, incluidos los reintentos. Las respuestas llegan comprimidas con
+    gzip, que requests pide por defecto.
+
+    Parameters
+    ----------
+    token : str, optional
+        Token de la aplicación (X-App-Token), default None
+    limitador : LimitadorTasa, optional
+        Limitador de llamados, default el compartido por las sesiones del token
+    reintentos : int, optional
+        Reintentos por llamado, default REINTENTOS_SOCRATA
+    timeout : tuple, optional
+        Segundos de conexión y lectura, default TIMEOUT_SOCRATA
+    """
+
+    def __init__(
+        self,
+        token: str = None,
+        limitador: LimitadorTasa = None,
+        reintentos: int = REINTENTOS_SOCRATA,
+        timeout: tuple = TIMEOUT_SOCRATA,
+    ):
+        super().__init__()
+
+        if token:
+            self.headers.update({"X-App-token": token})
+
+        adaptador = HTTPAdapter(
+            pool_connections=4, pool_maxsize=CONEXIONES_POR_HOST, max_retries=0
+        )
+        self.mount("https://", adaptador)
+        self.mount("http://", adaptador)
+
+        self.limitador = limitador or limitador_compartido(token)
+        self.reintentos = reintentos
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+
+        for intento in range(self.reintentos + 1):
+            self.limitador.adquirir()
+
+            ultimo = intento == self.reintentos
+
+            try:
+                respuesta = super().request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if ultimo:
+                    raise
+
+                motivo, espera = type(e).__name__, espera_reintento(intento)
+            else:
+                if respuesta.status_code not in ESTADOS_REINTENTO or ultimo:
+                    return respuesta
+
+                motivo = str(respuesta.status_code)
+                espera = espera_reintento(intento, respuesta)
+                respuesta.close()
+
+            with medir("socrata.reintento", motivo=motivo):
+                time.sleep(espera)
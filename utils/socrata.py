@@ -1,6 +1,113 @@
 from datetime import date
 
 from utils.helpers import validar_fechas
+from utils.variables import COLS_PROCESOS, COLS_PROVEEDORES
+
+
+# Caracteres de IDs por consulta con `in (...)`, para no superar el largo
+# de URL que aceptan Socrata y los proxies intermedios
+LARGO_MAXIMO_IDS = 1200
+
+
+def lista_soql(valores) -> str:
+    """Lista de textos para un filtro `in (...)` de SoQL
+
+    Parameters
+    ----------
+    valores : Iterable[str]
+        Textos a incluir
+
+    Returns
+    -------
+    str
+        Textos entre comillas simples y separados por coma
+    """
+    return ",".join("'{}'".format(str(v).replace("'", "''")) for v in valores)
+
+
+def lotes_ids(ids, largo_maximo: int = LARGO_MAXIMO_IDS) -> list:
+    """Parte una colección de IDs en lotes que caben en una URL
+
+    Parameters
+    ----------
+    ids : Iterable[str]
+        IDs a buscar, los repetidos se ignoran
+    largo_maximo : int, optional
+        Caracteres máximos de cada lote, default LARGO_MAXIMO_IDS
+
+    Returns
+    -------
+    list[list]
+        Lotes de IDs en el orden recibido
+    """
+    lotes, lote, largo = [], [], 0
+
+    for i in dict.fromkeys(ids):
+        n = len(str(i)) + 3
+
+        if lote and largo + n > largo_maximo:
+            lotes.append(lote)
+            lote, largo = [], 0
+
+        lote.append(i)
+        largo += n
+
+    if lote:
+        lotes.append(lote)
+
+    return lotes
+
+
+def payload_keyset(payload: dict, ultimo: str = None) -> dict:
+    """Adapta un payload para paginar por `:id` en vez de `$offset`
+
+    Cada página pide los registros con `:id` mayor al último recibido, así
+    el tiempo por página no crece con la profundidad y los registros
+    publicados durante la descarga no desplazan las páginas siguientes.
+
+    Parameters
+    ----------
+    payload : dict
+        Payload de cualquiera de las funciones `payload_*` sin `$group` ni
+        `$order` distinto de `:id`
+    ultimo : str, optional
+        `:id` del último registro recibido, default None para la primera página
+
+    Returns
+    -------
+    dict
+        Payload ordenado por `:id`, con `:id` en `$select` si hay selección
+
+    Raises
+    ------
+    ValueError
+        Si el payload es agregado o pide otro orden, que se perdería
+    """
+    # https://dev.socrata.com/docs/paging
+
+    if "$group" in payload:
+        raise ValueError("Un payload agregado no tiene :id para paginar")
+
+    if payload.get("$order", ":id") != ":id":
+        raise ValueError(
+            f"Paginar por :id descarta el orden {payload['$order']}, "
+            "use paginación por $offset u ordene después"
+        )
+
+    params = {k: v for k, v in payload.items() if k != "$offset"}
+    params.update({"$order": ":id"})
+
+    if "$select" in params and ":id" not in params["$select"].split(","):
+        params.update({"$select": f":id,{params['$select']}"})
+
+    if ultimo is not None:
+        q = f":id > {lista_soql([ultimo])}"
+
+        where_query = f"({params['$where']}) AND {q}" if "$where" in params else q
+
+        params.update({"$where": where_query})
+
+    return params
 
 
 def payload_procesos(
@@ -11,6 +118,8 @@ def payload_procesos(
     entidades: list | set = None,
     id_proceso: str = None,
     sort: str = None,
+    columnas: list | None = COLS_PROCESOS,
+    ids_proceso: list | set = None,
 ) -> dict:
     """Payload para SECOP II - Procesos de Contratación
 
@@ -30,6 +139,11 @@ def payload_procesos(
         ID de proceso a buscar, default None
     sort : str, optional
         Campo a usar para ordenar, default None
+    columnas : list | None, optional
+        Columnas a traer, None para todas, default COLS_PROCESOS
+    ids_proceso : list | set, optional
+        IDs de procesos a buscar en un solo llamado, ver `lotes_ids`,
+        default None
 
     Returns
     -------
@@ -40,6 +154,9 @@ def payload_procesos(
 
     payload = {"$limit": offset}
 
+    if columnas is not None:
+        payload.update({"$select": ",".join(columnas)})
+
     if sort is not None:
         payload.update({"$order": sort})
 
@@ -75,6 +192,11 @@ def payload_procesos(
 
         where_query = f"{where_query} AND {q}" if where_query else q
 
+    if ids_proceso is not None:
+        q = f"id_del_proceso in({lista_soql(ids_proceso)})"
+
+        where_query = f"{where_query} AND {q}" if where_query else q
+
     if where_query:
         payload.update({"$where": where_query})
 
@@ -111,6 +233,67 @@ def payload_paa(anno: int = None, limit: int = 1000) -> dict:
     return payload
 
 
+def payload_agregado(
+    grupos: list,
+    sumas: list = None,
+    contar: bool = True,
+    where: str = None,
+    orden: str = None,
+    offset: int = 1000,
+) -> dict:
+    """Payload que agrega registros en el servidor con `$group`
+
+    Socrata retorna una fila por grupo en vez de todos los registros. Las sumas
+    quedan en columnas `suma_<columna>` y el conteo en `conteo`.
+
+    Parameters
+    ----------
+    grupos : list
+        Columnas por las que se agrupa
+    sumas : list, optional
+        Columnas numéricas a sumar, default None
+    contar : bool, optional
+        Incluir la cantidad de registros por grupo, default True
+    where : str, optional
+        Filtro SoQL previo a agrupar, default None
+    orden : str, optional
+        Campo a usar para ordenar, default la primera suma o el conteo
+        descendente
+    offset : int, optional
+        Cantidad de grupos por llamado, default 1000
+
+    Returns
+    -------
+    dict
+        Payload para enviar a Socrata API
+    """
+    # https://dev.socrata.com/docs/queries/group
+
+    agregados = [f"sum({c}) AS suma_{c}" for c in sumas or []]
+
+    if contar:
+        agregados.append("count(*) AS conteo")
+
+    if not agregados:
+        raise ValueError("Se requiere al menos una suma o el conteo")
+
+    if orden is None:
+        orden = f"suma_{sumas[0]} DESC" if sumas else "conteo DESC"
+
+    payload = {
+        "$limit": offset,
+        "$select": ",".join(grupos + agregados),
+        "$group": ",".join(grupos),
+        # El orden incluye los grupos para que las páginas sean disjuntas
+        "$order": ",".join([orden] + grupos),
+    }
+
+    if where:
+        payload.update({"$where": where})
+
+    return payload
+
+
 def payload_entidades(offset=1000, selection=None, select_col=None, sort=None):
     # https://dev.socrata.com/foundry/www.datos.gov.co/h7zv-k39x
     # https://dev.socrata.com/foundry/www.datos.gov.co/pajg-ux27
@@ -138,6 +321,8 @@ def payload_proponentes(
     offset: int = 1000,
     id_proc: str = None,
     proveedor: str = None,
+    columnas: list | None = COLS_PROVEEDORES,
+    sort: str | None = "fecha_publicaci_n DESC",
 ) -> dict:
     """Payload para Proponentes por Proceso SECOP II
 
@@ -151,6 +336,11 @@ def payload_proponentes(
         ID del proceso de compra, default None
     proveedor : str, optional
         Nombre del proveedor a buscar, default None
+    columnas : list | None, optional
+        Columnas a traer, None para todas, default COLS_PROVEEDORES
+    sort : str | None, optional
+        Campo a usar para ordenar, None para no ordenar como requiere
+        `payload_keyset`, default "fecha_publicaci_n DESC"
 
     Returns
     -------
@@ -159,7 +349,13 @@ def payload_proponentes(
     """
     # https://dev.socrata.com/foundry/www.datos.gov.co/hgi6-6wh3
 
-    payload = {"$limit": offset, "$order": "fecha_publicaci_n DESC"}
+    payload = {"$limit": offset}
+
+    if sort is not None:
+        payload.update({"$order": sort})
+
+    if columnas is not None:
+        payload.update({"$select": ",".join(columnas)})
 
     inicio, fin = validar_fechas(fechas)
 
@@ -0,0 +1,162 @@
+import json
+
+import pandas as pd
+import pyarrow as pa
+
+
+def _texto(valor) -> str | None:
+    if valor is None or isinstance(valor, str):
+        return valor
+
+    if isinstance(valor, (dict, list)):
+        return json.dumps(valor, ensure_ascii=False)
+
+    return str(valor)
+
+
+def lote_desde_pagina(
+    pagina: list, columnas: list, anidados: dict = None
+) -> pa.RecordBatch:
+    """Convierte una página de registros de Socrata en un lote columnar
+
+    Parameters
+    ----------
+    pagina : list
+        Registros de una página, como los retorna Socrata API
+    columnas : list
+        Columnas a conservar, en orden
+    anidados : dict, optional
+        Columnas con objetos anidados y la llave a extraer de cada uno, como
+        {"urlproceso": "url"}, default None
+
+    Returns
+    -------
+    pa.RecordBatch
+        Lote con una columna de texto por cada columna pedida
+    """
+    anidados = anidados or {}
+
+    arrays = []
+
+    for col in columnas:
+        valores = [registro.get(col) for registro in pagina]
+
+        if col in anidados:
+            llave = anidados[col]
+            valores = [v.get(llave) if isinstance(v, dict) else v for v in valores]
+
+        arrays.append(pa.array([_texto(v) for v in valores], type=pa.string()))
+
+    return pa.RecordBatch.from_arrays(arrays, names=list(columnas))
+
+
+def tabla_desde_paginas(paginas, columnas: list, anidados: dict = None) -> pa.Table:
+    """Construye una tabla Arrow consumiendo páginas una a una
+
+    Cada página se convierte a columnas apenas llega y se descarta, por lo que
+    nunca se mantiene la lista completa de diccionarios en memoria.
+
+    Parameters
+    ----------
+    paginas : Iterable[list]
+        Páginas de registros, como las genera `iterar_socrata`
+    columnas : list
+        Columnas a conservar, en orden
+    anidados : dict, optional
+        Columnas con objetos anidados y la llave a extraer, default None
+
+    Returns
+    -------
+    pa.Table
+        Tabla con todas las páginas concatenadas
+    """
+    esquema = pa.schema([(col, pa.string()) for col in columnas])
+
+    lotes = [lote_desde_pagina(pagina, columnas, anidados) for pagina in paginas]
+
+    return pa.Table.from_batches(lotes, schema=esquema)
+
+
+def df_desde_tabla(tabla: pa.Table) -> pd.DataFrame:
+    """Convierte una tabla Arrow en DataFrame liberando la tabla al convertir
+
+    Parameters
+    ----------
+    tabla : pa.Table
+        Tabla a convertir, no debe usarse después
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame con los datos de la tabla
+    """
+    return tabla.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def depurar_df(df: pd.DataFrame, na_cols=None, dup_cols=None) -> pd.DataFrame:
+    """Elimina filas sin datos requeridos y filas duplicadas
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        DataFrame a depurar
+    na_cols : list, optional
+        Columnas que no pueden estar vacías, default None
+    dup_cols : list, optional
+        Columnas que identifican duplicados, default None
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame depurado
+    """
+    if na_cols is not None:
+        df = df.dropna(subset=na_cols)
+    if dup_cols is not None:
+        df = df.drop_duplicates(subset=dup_cols)
+
+    if (na_cols is not None) or (dup_cols is not None):
+        df = df.reset_index(drop=True)
+
+    return df
+
+
+def aplicar_esquema(df: pd.DataFrame, esquema: dict = None) -> pd.DataFrame:
+    """Convierte columnas de texto a los tipos de un esquema
+
+    Cada columna se convierte de una vez; los valores que no se pueden
+    convertir quedan como NaN o NaT. Las columnas que no están en el esquema,
+    o en el DataFrame, no cambian.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        DataFrame con columnas de texto, como lo retorna Socrata API
+    esquema : dict, optional
+        Tipo de cada columna: "category", "datetime64[ns]" o un tipo numérico,
+        como ESQUEMA_PROCESOS, default None
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame con los tipos del esquema
+    """
+    if not esquema:
+        return df
+
+    df = df.copy(deep=False)
+
+    for col, tipo in esquema.items():
+        if col not in df.columns or df[col].dtype == tipo:
+            continue
+
+        if tipo == "category":
+            df[col] = df[col].astype("category")
+        elif tipo.startswith("datetime"):
+            # Socrata usa ISO 8601, como 2024-01-31T00:00:00.000
+            fechas = pd.to_datetime(df[col], errors="coerce", format="ISO8601")
+            df[col] = fechas.astype(tipo)
+        else:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype(tipo)
+
+    return df
@@ -3,6 +3,45 @@ ORDEN_ENTIDAD = ["Nacional", "Territorial", "Corporación Autónoma"]
 
 TIPO_PRESUPUESTO = ["Funcionamiento", "Inversión", "Total de Entidad"]
 
+MODELO = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+# Precisión de los vectores del corpus en cache: float32, float16 o int8
+PRECISION_EMBEDDINGS = "float16"
+
+# Selecciones de entidades PAA cuyos vectores concatenados se conservan en memoria
+MAXIMO_SELECCIONES_PAA = 4
+
+# Copias locales Parquet en memoria por proceso: la vigente y la anterior
+MAXIMO_COPIAS_PARQUET = 2
+
+# Búsqueda híbrida: candidatos que preselecciona BM25 y peso del puntaje léxico
+CANDIDATOS_LEXICOS = 2000
+PESO_LEXICO = 0.3
+
+# Índices BM25 en memoria por proceso y segundos que se conserva cada uno
+MAXIMO_INDICES_LEXICOS = 8
+TTL_INDICES_LEXICOS = 60 * 60
+
+# Backend de inferencia en CPU: "torch" u "onnx" (modelo cuantizado a int8).
+# Con "onnx" los vectores se guardan en otro almacén y los fragmentos PAA se
+# recalculan; exportar antes el modelo con python -m utils.modelos
+BACKEND_EMBEDDINGS = "torch"
+
+# Hilos de inferencia del modelo, None usa todos los núcleos
+HILOS_EMBEDDINGS = None
+
+# Usar el servicio local de vectores (python -m utils.servicio) si está activo
+USAR_SERVICIO_EMBEDDINGS = True
+
+# Resumen de tiempos por etapa en la barra lateral (también con ?debug=1)
+MOSTRAR_METRICAS = False
+
+# Agregar cada medición a METRICAS_JSONL
+EXPORTAR_METRICAS = False
+
+# Puerto local para servir /metrics a Prometheus, None para no servirlo
+PUERTO_METRICAS = None
+
 # IDs Colombia Compra Eficiente
 
 ID_PROCESOS = "p6dx-8zbt"  # SECOP II - Procesos de Contratación
@@ -28,6 +67,34 @@ URL_ENTIDADES_FP = f"{URL_RESOURCES}{ID_ENTIDADES_FP}.json"
 URL_ENTIDADES_SECOP = f"{URL_RESOURCES}{ID_ENTIDADES_SECOP}.json"
 URL_PROPONENTES = f"{URL_RESOURCES}{ID_PROPONENTES}.json"
 
+# Cliente de Socrata API
+
+# Llamados por segundo por proceso y ráfaga máxima, compartidos por las sesiones
+LLAMADOS_POR_SEGUNDO = 10
+RAFAGA_SOCRATA = 16
+
+# Reintentos ante 429, 5xx o fallas de conexión, con espera exponencial al azar
+REINTENTOS_SOCRATA = 5
+ESPERA_MINIMA_SOCRATA = 0.5
+ESPERA_MAXIMA_SOCRATA = 30
+
+# Segundos para conectar y para leer cada respuesta
+TIMEOUT_SOCRATA = (10, 120)
+
+# Vigencia en segundos de respuestas guardadas en disco, por dataset
+
+TTL_DEFECTO = 60 * 60
+
+TTL_DATASETS = {
+    ID_PROCESOS: 6 * 60 * 60,
+    ID_PROPONENTES: 6 * 60 * 60,
+    ID_OFERTAS: 6 * 60 * 60,
+    ID_CONTRATOS: 12 * 60 * 60,
+    ID_ENCABEZADO_PAA: 7 * 24 * 60 * 60,
+    ID_ENTIDADES_SECOP: 30 * 24 * 60 * 60,
+    ID_ENTIDADES_FP: 30 * 24 * 60 * 60,
+}
+
 # Columnas de tablas
 
 COLS_PROCESOS = [
@@ -51,6 +118,25 @@ COLS_PROCESOS = [
     "urlproceso",
 ]
 
+# Columnas con objetos anidados y la llave a conservar de cada uno
+ANIDADOS_PROCESOS = {"urlproceso": "url"}
+
+# Tipos de las columnas que no son texto libre, ver `aplicar_esquema`
+ESQUEMA_PROCESOS = {
+    "entidad": "category",
+    "precio_base": "float64",
+    "fecha_de_publicacion_del": "datetime64[ns]",
+    "fase": "category",
+    "duracion": "float32",
+    "unidad_de_duracion": "category",
+    "modalidad_de_contratacion": "category",
+    "estado_del_procedimiento": "category",
+    "estado_de_apertura_del_proceso": "category",
+    "ordenentidad": "category",
+    "adjudicado": "category",
+    "fecha_adjudicacion": "datetime64[ns]",
+}
+
 
 COLS_ENTIDADES = ["NOMBRE", "CCB_NIT_INST", "ORDEN", "SECTOR"]
 
@@ -64,6 +150,8 @@ COLS_PGN = [
     "TOTAL",
 ]
 
+NUMERICAS_PGN = ["APORTE_NACIONAL", "RECURSOS_PROPIOS", "TOTAL"]
+
 
 COLS_PAA = [
     "descripcion",
@@ -79,6 +167,28 @@ COLS_PAA = [
     "unspsc",
 ]
 
+RENOMBRES_PAA = {
+    "Código UNSPSC (cada código separado por ;)": "unspsc",
+    "Descripción": "descripcion",
+    "Fecha estimada de inicio de proceso de selección (mes)": "mes_inicio",
+    "Fecha estimada de presentación de ofertas (mes)": "mes_oferta",
+    "Duración del contrato (número)": "duracion",
+    "Duración del contrato (intervalo: días, meses, años)": "intervalo",
+    "Modalidad de selección ": "modalidad",
+    "Fuente de los recursos": "fuente",
+    "Valor total estimado": "valor",
+    "Valor estimado en la vigencia actual": "valor_vigencia",
+    "¿Se requieren vigencias futuras?": "vigencias_futuras",
+    "Estado de solicitud de vigencias futuras": "solicitud_vigencias",
+    "Unidad de contratación (referencia)": "unidad",
+    "Ubicación": "ubicacion",
+    "Nombre del responsable ": "responsable",
+    "Teléfono del responsable ": "telefono",
+    "Correo electrónico del responsable ": "email",
+    "¿Debe cumplir con invertir mínimo el 30% de los recursos del presupuesto destinados a comprar alimentos, cumpliendo con lo establecido en la Ley 2046 de 2020, reglamentada por el Decreto 248 de 2021?": "otra1",
+    "¿El contrato incluye el suministro de bienes y servicios distintos a alimentos?": "otra2",
+}
+
 COLS_PROVEEDORES = [
     "proveedor",
     "nit_proveedor",
@@ -87,3 +197,8 @@ COLS_PROVEEDORES = [
     "nombre_procedimiento",
     "entidad_compradora",
 ]
+
+ESQUEMA_PROVEEDORES = {
+    "fecha_publicaci_n": "datetime64[ns]",
+    "entidad_compradora": "category",
+}
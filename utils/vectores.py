@@ -0,0 +1,364 @@
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+import hashlib
+import sqlite3
+import unicodedata
+
+import numpy as np
+
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    llave TEXT PRIMARY KEY,
+    valor TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS vectores (
+    huella TEXT PRIMARY KEY,
+    fila INTEGER NOT NULL
+);
+"""
+
+# Límite de variables por consulta en versiones antiguas de SQLite
+LOTE_SQLITE = 900
+
+# Vectores compactos que se pasan a float32 a la vez al puntuar
+BLOQUE_PUNTAJE = 16384
+
+
+def normalizar_texto(texto: str) -> str:
+    """Normaliza un texto antes de calcular su vector
+
+    Parameters
+    ----------
+    texto : str
+        Texto a normalizar
+
+    Returns
+    -------
+    str
+        Texto en forma NFC, sin espacios repetidos ni en los extremos
+    """
+    return " ".join(unicodedata.normalize("NFC", str(texto)).split())
+
+
+def huella_texto(texto: str, modelo: str) -> str:
+    """Calcula la huella de un texto normalizado para un modelo
+
+    Parameters
+    ----------
+    texto : str
+        Texto ya normalizado
+    modelo : str
+        ID del modelo que calcula el vector
+
+    Returns
+    -------
+    str
+        Hash sha256 del modelo y el texto
+    """
+    return hashlib.sha256(f"{modelo}\0{texto}".encode("utf-8")).hexdigest()
+
+
+class AlmacenEmbeddings:
+    """Almacén persistente de vectores direccionado por contenido
+
+    Los vectores se agregan al final de una matriz float32 en disco que se lee
+    con memory map. Un índice SQLite asocia la huella de cada texto con su fila
+    y serializa las escrituras entre procesos. El índice manda: filas de la
+    matriz sin registro, como las de una escritura interrumpida, se descartan.
+
+    Parameters
+    ----------
+    directorio : str | Path
+        Carpeta del almacén, una por modelo
+    modelo : str
+        ID del modelo que calcula los vectores
+    dim : int
+        Dimensión de los vectores
+    """
+
+    def __init__(self, directorio, modelo: str, dim: int):
+        self.directorio = Path(directorio)
+        self.modelo = modelo
+        self.dim = dim
+
+        self.ruta_matriz = self.directorio.joinpath("matriz.f32")
+        self.ruta_indice = self.directorio.joinpath("indice.sqlite")
+
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        self.ruta_matriz.touch(exist_ok=True)
+
+        with self._conectar() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(ESQUEMA)
+
+            for llave, valor in [("modelo", modelo), ("dim", str(dim))]:
+                conn.execute("INSERT OR IGNORE INTO meta VALUES (?, ?)", (llave, valor))
+
+            meta = dict(conn.execute("SELECT llave, valor FROM meta").fetchall())
+
+        if meta["modelo"] != modelo or int(meta["dim"]) != dim:
+            raise ValueError(
+                f"El almacén {self.directorio} es de {meta['modelo']} ({meta['dim']})"
+            )
+
+        with self._conectar() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._recortar(self._registradas(conn))
+
+    @contextmanager
+    def _conectar(self):
+        conn = sqlite3.connect(self.ruta_indice, timeout=60)
+
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _registradas(self, conn: sqlite3.Connection) -> int:
+        # Filas con huella en el índice, siempre contiguas desde 0
+        return conn.execute(
+            "SELECT COALESCE(MAX(fila) + 1, 0) FROM vectores"
+        ).fetchone()[0]
+
+    def _recortar(self, n: int):
+        # Descarta filas sin registro al final de la matriz, llamar con el
+        # índice bloqueado
+        tamano = n * self.dim * 4
+
+        if self.ruta_matriz.stat().st_size != tamano:
+            with open(self.ruta_matriz, "r+b") as f:
+                f.truncate(tamano)
+
+    def __len__(self) -> int:
+        return self.ruta_matriz.stat().st_size // (self.dim * 4)
+
+    def matriz(self) -> np.ndarray:
+        """Abre la matriz de vectores en modo lectura con memory map
+
+        Returns
+        -------
+        np.ndarray
+            Matriz de forma (n, dim)
+        """
+        n = len(self)
+
+        if n == 0:
+            return np.empty((0, self.dim), dtype=np.float32)
+
+        return np.memmap(
+            self.ruta_matriz, dtype=np.float32, mode="r", shape=(n, self.dim)
+        )
+
+    def _filas(self, conn: sqlite3.Connection, huellas: list) -> dict:
+        filas = {}
+
+        for i in range(0, len(huellas), LOTE_SQLITE):
+            lote = huellas[i : i + LOTE_SQLITE]
+            marcas = ",".join("?" * len(lote))
+            filas.update(
+                conn.execute(
+                    f"SELECT huella, fila FROM vectores WHERE huella IN ({marcas})",
+                    lote,
+                ).fetchall()
+            )
+
+        return filas
+
+    def filas(self, huellas: list) -> dict:
+        """Busca las filas de un conjunto de huellas
+
+        Parameters
+        ----------
+        huellas : list
+            Huellas a buscar
+
+        Returns
+        -------
+        dict
+            Diccionario {huella: fila} solo con las huellas encontradas
+        """
+        with self._conectar() as conn:
+            return self._filas(conn, huellas)
+
+    def agregar(self, huellas: list, vectores: np.ndarray) -> dict:
+        """Agrega vectores que aún no estén en el almacén
+
+        Parameters
+        ----------
+        huellas : list
+            Huellas de los textos
+        vectores : np.ndarray
+            Vectores de forma (len(huellas), dim)
+
+        Returns
+        -------
+        dict
+            Diccionario {huella: fila} de todas las huellas recibidas
+        """
+        vectores = np.ascontiguousarray(vectores, dtype=np.float32)
+
+        with self._conectar() as conn:
+            # Bloquea escrituras de otros procesos hasta el commit
+            conn.execute("BEGIN IMMEDIATE")
+
+            filas = self._filas(conn, huellas)
+            nuevas = [i for i, h in enumerate(huellas) if h not in filas]
+
+            if nuevas:
+                # La fila inicial sale del índice y no del tamaño del archivo,
+                # así una escritura interrumpida no desplaza las filas
+                inicio = self._registradas(conn)
+                self._recortar(inicio)
+
+                with open(self.ruta_matriz, "ab") as f:
+                    f.write(vectores[nuevas].tobytes())
+
+                registros = [(huellas[i], inicio + j) for j, i in enumerate(nuevas)]
+                conn.executemany("INSERT INTO vectores VALUES (?, ?)", registros)
+                filas.update(registros)
+
+        return filas
+
+    def asegurar(self, textos: list, codificar) -> np.ndarray:
+        """Retorna las filas de unos textos, calculando solo los vectores nuevos
+
+        Parameters
+        ----------
+        textos : list
+            Textos a convertir en vectores
+        codificar : Callable[[list], np.ndarray]
+            Función que calcula los vectores de una lista de textos
+
+        Returns
+        -------
+        np.ndarray
+            Fila del almacén de cada texto, en el orden recibido
+        """
+        normalizados = [normalizar_texto(t) for t in textos]
+        huellas = [huella_texto(t, self.modelo) for t in normalizados]
+
+        unicas = list(dict.fromkeys(huellas))
+        filas = self.filas(unicas)
+
+        faltantes = {h: t for h, t in zip(huellas, normalizados) if h not in filas}
+
+        if faltantes:
+            vectores = codificar(list(faltantes.values()))
+            filas.update(self.agregar(list(faltantes.keys()), vectores))
+
+        return np.fromiter((filas[h] for h in huellas), dtype=np.int64)
+
+    def obtener(self, textos: list, codificar) -> np.ndarray:
+        """Retorna los vectores de unos textos, calculando solo los nuevos
+
+        Parameters
+        ----------
+        textos : list
+            Textos a convertir en vectores
+        codificar : Callable[[list], np.ndarray]
+            Función que calcula los vectores de una lista de textos
+
+        Returns
+        -------
+        np.ndarray
+            Matriz float32 de forma (len(textos), dim) en el orden recibido
+        """
+        filas = self.asegurar(textos, codificar)
+
+        return np.asarray(self.matriz()[filas])
+
+
+@dataclass
+class VectoresCompactos:
+    """Vectores normalizados guardados en float16 o int8
+
+    Parameters
+    ----------
+    datos : np.ndarray
+        Matriz float16, o int8 con una escala por vector
+    escala : np.ndarray | None
+        Escala float32 de cada vector en int8, None en float16
+    """
+
+    datos: np.ndarray
+    escala: np.ndarray | None = None
+
+    def __len__(self) -> int:
+        return len(self.datos)
+
+    @property
+    def precision(self) -> str:
+        return str(self.datos.dtype)
+
+    @property
+    def nbytes(self) -> int:
+        return self.datos.nbytes + (0 if self.escala is None else self.escala.nbytes)
+
+
+def compactar(embeddings, precision: str = "float16") -> VectoresCompactos:
+    """Normaliza y reduce la precisión de una matriz de vectores
+
+    Parameters
+    ----------
+    embeddings : np.ndarray | torch.Tensor
+        Matriz de vectores float32
+    precision : str, optional
+        "float16" o "int8", default "float16"
+
+    Returns
+    -------
+    VectoresCompactos
+        Vectores de norma 1 en la precisión pedida
+    """
+    if hasattr(embeddings, "detach"):
+        embeddings = embeddings.detach().cpu().numpy()
+
+    matriz = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+    matriz = matriz / np.maximum(np.linalg.norm(matriz, axis=1, keepdims=True), 1e-12)
+
+    if precision == "float16":
+        return VectoresCompactos(matriz.astype(np.float16))
+
+    if precision == "int8":
+        # Cuantización escalar simétrica con una escala por vector
+        escala = np.maximum(np.abs(matriz).max(axis=1), 1e-12) / 127
+        datos = np.round(matriz / escala[:, None]).astype(np.int8)
+
+        return VectoresCompactos(datos, escala.astype(np.float32))
+
+    raise ValueError(f"Precisión no soportada: {precision}")
+
+
+def puntuar_compacto(consultas: np.ndarray, compacto: VectoresCompactos) -> np.ndarray:
+    """Similitud coseno entre consultas y vectores compactos
+
+    Recorre la matriz por bloques para no materializarla completa en float32.
+
+    Parameters
+    ----------
+    consultas : np.ndarray
+        Matriz de consultas de norma 1, de forma (m, dim)
+    compacto : VectoresCompactos
+        Vectores del corpus
+
+    Returns
+    -------
+    np.ndarray
+        Puntajes de forma (m, len(compacto))
+    """
+    consultas = np.atleast_2d(np.asarray(consultas, dtype=np.float32))
+    puntajes = np.empty((len(consultas), len(compacto)), dtype=np.float32)
+
+    for i in range(0, len(compacto), BLOQUE_PUNTAJE):
+        bloque = compacto.datos[i : i + BLOQUE_PUNTAJE].astype(np.float32)
+        parcial = consultas @ bloque.T
+
+        if compacto.escala is not None:
+            parcial *= compacto.escala[i : i + BLOQUE_PUNTAJE]
+
+        puntajes[:, i : i + BLOQUE_PUNTAJE] = parcial
+
+    return puntajes